@@ -0,0 +1 @@
+# Пустые __init__.py файлы для Python пакетов
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Микро-бенчмарк подготовки текста комментария для Telegram: clean_html_content
+(прежняя реализация из webhook_server) против utils.html_converter.
+
+Прежний путь на один комментарий:
+    clean_html_content(content)[:100] для debug-лога
+    + clean_html_content(content)[:150] для уведомления
+Новый путь:
+    html_to_telegram(content, 150) - один проход с обрезкой по бюджету
+
+Корпус: тела комментариев из записанных webhook'ов и benchmarks/data/comment_bodies.jsonl.
+
+Запуск: python -m benchmarks.bench_html_converter [--repeat N]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.html_converter import html_to_telegram  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DEFAULT_FILES = [
+    os.path.join(DATA_DIR, "webhook_payloads.jsonl"),
+    os.path.join(DATA_DIR, "comment_bodies.jsonl"),
+]
+
+
+def legacy_clean_html_content(content: str) -> str:
+    """Прежняя реализация clean_html_content из webhook_server"""
+    if not content:
+        return ""
+    content = re.sub(r'</(p|div|br|h[1-6]|li|ul|ol|blockquote)[^>]*>', ' ', content, flags=re.IGNORECASE)
+    clean_text = re.sub(r'<[^>]+>', '', content)
+    clean_text = re.sub(r'\n\s*\n', '\n', clean_text)
+    clean_text = re.sub(r'\s+', ' ', clean_text)
+    clean_text = clean_text.replace('\r', '').replace('\t', ' ')
+    return clean_text.strip()
+
+
+def load_comments(paths: list) -> list:
+    """Тела комментариев из JSONL: webhook'и Okdesk или записи {"content": ...}"""
+    comments = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                content = data.get("content") or data.get("event", {}).get("comment", {}).get("content")
+                if content:
+                    comments.append(content)
+    return comments
+
+
+def legacy_pipeline(content: str) -> str:
+    """Как было в handle_comment_created + notify_user_new_comment"""
+    legacy_clean_html_content(content)[:100]
+    clean_content = legacy_clean_html_content(content)
+    truncated = clean_content[:150]
+    if len(clean_content) > 150:
+        truncated += "..."
+    return truncated
+
+
+def new_pipeline(content: str) -> str:
+    """Один проход; debug-лог по умолчанию выключен, поэтому считается только уведомление"""
+    return html_to_telegram(content, 150)
+
+
+def bench(func, items: list, repeat: int) -> float:
+    """Среднее время обработки одного комментария в микросекундах"""
+    timer = timeit.Timer(lambda: [func(item) for item in items])
+    best = min(timer.repeat(repeat=5, number=repeat))
+    return best / (repeat * len(items)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк преобразования HTML комментариев для Telegram")
+    parser.add_argument("--file", action="append", help="JSONL с комментариями (можно несколько)")
+    parser.add_argument("--repeat", type=int, default=2000, help="Количество прогонов корпуса")
+    args = parser.parse_args()
+
+    comments = load_comments(args.file or DEFAULT_FILES)
+    total_chars = sum(len(c) for c in comments)
+    print(f"📦 Корпус: {len(comments)} комментариев, {total_chars} символов, средний размер {total_chars // len(comments)}")
+
+    rows = [
+        ("legacy clean_html_content x1", legacy_clean_html_content),
+        ("html_to_telegram (без лимита)", html_to_telegram),
+        ("legacy pipeline (лог + уведомление)", legacy_pipeline),
+        ("html_to_telegram(limit=150)", new_pipeline),
+    ]
+    results = {name: bench(func, comments, args.repeat) for name, func in rows}
+    for name, value in results.items():
+        print(f"{name:<40} {value:8.2f} мкс/комментарий")
+
+    legacy = results["legacy pipeline (лог + уведомление)"]
+    new = results["html_to_telegram(limit=150)"]
+    print(f"{'ускорение на комментарий':<40} x{legacy / new:.1f} (экономия {legacy - new:.2f} мкс)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Микро-бенчмарк разбора webhook'ов Okdesk: старый путь против json_codec.
+
+Старый путь (webhook_handler до json_codec):
+    body.decode('utf-8') -> json.loads(str) -> json.dumps(indent=2) для печати
+Новый путь:
+    json_codec.loads(bytes) без промежуточной строки и повторной сериализации
+
+Запуск: python -m benchmarks.bench_json_codec [--file payloads.jsonl] [--repeat N]
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.json_codec import JSONCodec, OrjsonCodec, orjson  # noqa: E402
+
+DEFAULT_PAYLOADS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "webhook_payloads.jsonl")
+
+
+def load_payloads(path: str) -> list:
+    """Загрузить записанные тела webhook'ов (по одному JSON на строку) как bytes"""
+    with open(path, "rb") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def legacy_parse(body: bytes):
+    """Старый путь: decode + json.loads + json.dumps(indent=2) только ради печати"""
+    data = json.loads(body.decode("utf-8"))
+    json.dumps(data, indent=2, ensure_ascii=False)
+    return data
+
+
+def bench(func, bodies: list, repeat: int) -> float:
+    """Среднее время обработки одного события в микросекундах"""
+    timer = timeit.Timer(lambda: [func(body) for body in bodies])
+    best = min(timer.repeat(repeat=5, number=repeat))
+    return best / (repeat * len(bodies)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк JSON-кодека для webhook'ов Okdesk")
+    parser.add_argument("--file", default=DEFAULT_PAYLOADS, help="Файл с записанными webhook'ами (JSONL)")
+    parser.add_argument("--repeat", type=int, default=500, help="Количество прогонов корпуса")
+    args = parser.parse_args()
+
+    bodies = load_payloads(args.file)
+    total_bytes = sum(len(b) for b in bodies)
+    print(f"📦 Корпус: {len(bodies)} webhook'ов, {total_bytes} байт, средний размер {total_bytes // len(bodies)} байт")
+
+    codecs = [JSONCodec()]
+    if orjson is not None:
+        codecs.append(OrjsonCodec())
+    else:
+        print("⚠️ orjson не установлен - сравнение только со стандартным json")
+
+    legacy = bench(legacy_parse, bodies, args.repeat)
+    print(f"{'legacy (decode+loads+dumps indent=2)':<40} {legacy:8.2f} мкс/событие")
+
+    for codec in codecs:
+        parse_time = bench(codec.loads, bodies, args.repeat)
+        print(f"{'json_codec.loads [' + codec.name + ']':<40} {parse_time:8.2f} мкс/событие"
+              f"  (экономия {legacy - parse_time:.2f} мкс, x{legacy / parse_time:.1f})")
+
+    # Исходящие тела запросов: json.dumps(str) против dumps_bytes
+    objects = [json.loads(b) for b in bodies]
+    legacy_dump = bench(lambda o: json.dumps(o).encode("utf-8"), objects, args.repeat)
+    print(f"{'legacy json.dumps(...).encode()':<40} {legacy_dump:8.2f} мкс/тело")
+    for codec in codecs:
+        dump_time = bench(codec.dumps_bytes, objects, args.repeat)
+        print(f"{'json_codec.dumps_bytes [' + codec.name + ']':<40} {dump_time:8.2f} мкс/тело"
+              f"  (x{legacy_dump / dump_time:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест webhook сервера без сети.
+
+Поднимает в одном процессе заглушки Okdesk (benchmarks/stub_okdesk.py) и
+Telegram Bot API (benchmarks/stub_telegram.py), webhook сервер на uvicorn
+с временной SQLite базой и подает с заданной частотой (open loop):
+- синтетические webhook'и Okdesk: публичные комментарии (часть с вложениями)
+  и смены статуса заявок;
+- Telegram updates (режим TELEGRAM_MODE=webhook): /menu и "Открытые заявки".
+
+Отчет: p50/p95/p99/max задержки, событий в секунду, ошибки, память
+процесса, число запросов к заглушкам.
+
+Запуск: python -m benchmarks.loadtest --webhooks 500 --webhook-rate 50 --updates 200 --update-rate 20
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import random
+import resource
+import socket
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_okdesk import OkdeskStub  # noqa: E402
+from benchmarks.stub_telegram import TelegramStub  # noqa: E402
+
+BOT_TOKEN = "123456789:LOADTEST-offline-token-not-for-telegram"
+WEBHOOK_SECRET_HEADER = "loadtest-telegram-secret"
+STATUS_CYCLE = ("in_work", "opened", "completed")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_mb() -> float:
+    """Текущий RSS процесса, МБ (Linux), иначе пиковый"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def configure_environment(args, okdesk_url: str, port: int, workdir: str):
+    """Переменные окружения для приложения (до импорта config)"""
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'loadtest.db')}",
+        "BOT_TOKEN": BOT_TOKEN,
+        "OKDESK_API_URL": okdesk_url,
+        "OKDESK_API_TOKEN": "loadtest",
+        "TELEGRAM_MODE": "webhook",
+        "TELEGRAM_WEBHOOK_URL": f"http://127.0.0.1:{port}/telegram-webhook",
+        "TELEGRAM_WEBHOOK_PATH": "/telegram-webhook",
+        "TELEGRAM_WEBHOOK_SECRET": WEBHOOK_SECRET_HEADER,
+        "WEBHOOK_PATH": "/okdesk-webhook",
+        "WEBHOOK_SECRET": "",
+        "RECONCILE_ENABLED": "false",
+        "LOG_LEVEL": args.log_level,
+        "TRACING_EXPORTER": args.tracing,
+        "TRACING_FILE": os.path.join(workdir, "traces.jsonl"),
+    })
+
+
+def seed_database(users: int, issues_per_user: int) -> List[Dict]:
+    """Зарегистрированные пользователи с заявками; возвращает [{telegram_id, okdesk_issue_id}]"""
+    from database.crud import UserService, IssueService
+    from models.database import create_tables
+
+    create_tables()
+    issues = []
+    for index in range(users):
+        telegram_id = 700000000 + index
+        user = UserService.create_user(telegram_id=telegram_id, username=f"load{index}")
+        UserService.update_user_physical(user.id, f"Нагрузка {index}", f"+7900{index:07d}")
+        for number in range(issues_per_user):
+            okdesk_issue_id = 10000 + index * issues_per_user + number
+            IssueService.create_issue(telegram_user_id=telegram_id, okdesk_issue_id=okdesk_issue_id,
+                                      title=f"Заявка {okdesk_issue_id}", issue_number=str(okdesk_issue_id))
+            issues.append({"telegram_id": telegram_id, "okdesk_issue_id": okdesk_issue_id})
+    return issues
+
+
+class EventFactory:
+    """Синтетические webhook'и Okdesk и Telegram updates"""
+
+    def __init__(self, issues: List[Dict], attachment_share: float, seed: int):
+        self.issues = issues
+        self.attachment_share = attachment_share
+        self.random = random.Random(seed)
+        self.comment_id = 500000
+        self.attachment_id = 900000
+        self.update_id = 0
+        self.status_index: Dict[int, int] = {}
+
+    def webhook(self) -> Dict:
+        issue = self.random.choice(self.issues)
+        issue_id = issue["okdesk_issue_id"]
+        if self.random.random() < 0.6:
+            self.comment_id += 1
+            attachments = []
+            if self.random.random() < self.attachment_share:
+                self.attachment_id += 1
+                attachments.append({"id": self.attachment_id, "attachment_file_name": f"photo_{self.attachment_id}.png",
+                                    "attachment_file_size": 65536})
+            return {
+                "event": {
+                    "event_type": "new_comment",
+                    "comment": {
+                        "id": self.comment_id,
+                        "content": f"<p>Комментарий <b>{self.comment_id}</b>: мастер выедет "
+                                   f"<strong>сегодня</strong>.</p><p>Номер: {issue_id}</p>",
+                        "is_public": True,
+                        "attachments": attachments,
+                    },
+                    "author": {"id": 12, "first_name": "Иван", "last_name": "Петров", "type": "employee"},
+                },
+                "issue": {"id": issue_id, "title": f"Заявка {issue_id}", "attachments": []},
+            }
+        index = self.status_index.get(issue_id, 0)
+        self.status_index[issue_id] = index + 1
+        status = STATUS_CYCLE[index % len(STATUS_CYCLE)]
+        return {"event": "issue.status_changed", "data": {"id": issue_id, "status": {"code": status, "name": status}}}
+
+    def update(self) -> Dict:
+        self.update_id += 1
+        telegram_id = self.random.choice(self.issues)["telegram_id"]
+        user = {"id": telegram_id, "is_bot": False, "first_name": "Load"}
+        chat = {"id": telegram_id, "type": "private"}
+        now = int(time.time())
+        if self.random.random() < 0.5:
+            return {"update_id": self.update_id, "message": {
+                "message_id": self.update_id, "date": now, "chat": chat, "from": user, "text": "/menu",
+                "entities": [{"type": "bot_command", "offset": 0, "length": 5}]}}
+        return {"update_id": self.update_id, "callback_query": {
+            "id": f"cb{self.update_id}", "from": user, "chat_instance": "loadtest", "data": "show_open_issues",
+            "message": {"message_id": self.update_id, "date": now, "chat": chat,
+                        "from": {"id": 1, "is_bot": True, "first_name": "LoadBot"}, "text": "Меню"}}}
+
+
+class Stream:
+    """Результаты одного потока событий"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.started = 0.0
+        self.finished = 0.0
+
+    def report(self) -> str:
+        count = len(self.latencies)
+        duration = max(self.finished - self.started, 1e-9)
+        ms = [value * 1000 for value in self.latencies]
+        return (f"{self.name:<22} {count:>6} шт  {count / duration:8.1f} соб/с  ошибок {self.errors:<4}"
+                f" p50 {percentile(ms, 50):7.1f}  p95 {percentile(ms, 95):7.1f}  p99 {percentile(ms, 99):7.1f}"
+                f"  max {max(ms) if ms else 0:7.1f} мс")
+
+
+async def run_open_loop(stream: Stream, count: int, rate: float, send):
+    """Отправить count событий с частотой rate/с, не дожидаясь ответов (open loop)"""
+    tasks = []
+    stream.started = time.perf_counter()
+    for index in range(count):
+        delay = stream.started + index / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send()))
+    await asyncio.gather(*tasks)
+    stream.finished = time.perf_counter()
+
+
+async def main_async(args):
+    import aiohttp
+    import uvicorn
+
+    okdesk = OkdeskStub(latency_ms=args.okdesk_latency_ms, jitter_ms=args.okdesk_latency_ms / 2,
+                        error_rate=args.okdesk_error_rate, seed=args.seed)
+    telegram = TelegramStub(latency_ms=args.telegram_latency_ms, jitter_ms=args.telegram_latency_ms / 2,
+                            flood_rate=args.telegram_flood_rate, seed=args.seed)
+    okdesk_url = await okdesk.start()
+    telegram_url = await telegram.start()
+    port = free_port()
+
+    workdir = tempfile.mkdtemp(prefix="okdesk-loadtest-")
+    configure_environment(args, okdesk_url, port, workdir)
+
+    # Импорт приложения - только после настройки окружения
+    from aiogram.client.telegram import TelegramAPIServer
+    from services.okdesk_api import enable_shared_session, close_shared_session
+    import webhook_server
+    import bot as bot_module
+
+    bot_module.bot.session.api = TelegramAPIServer.from_base(telegram_url)
+    issues = seed_database(args.users, args.issues_per_user)
+    enable_shared_session()
+
+    # Время полной обработки Telegram update (ответ HTTP приходит раньше)
+    updates = Stream("telegram updates")
+    original_process = webhook_server.process_telegram_update
+
+    async def timed_process(update):
+        started = time.perf_counter()
+        await original_process(update)
+        updates.latencies.append(time.perf_counter() - started)
+
+    webhook_server.process_telegram_update = timed_process
+
+    server = uvicorn.Server(uvicorn.Config(webhook_server.app, host="127.0.0.1", port=port,
+                                           log_config=None, lifespan="on"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    factory = EventFactory(issues, args.attachment_share, args.seed)
+    webhooks = Stream("okdesk webhooks")
+    base = f"http://127.0.0.1:{port}"
+    rss_before = rss_mb()
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as session:
+        async def send_webhook():
+            payload = factory.webhook()
+            started = time.perf_counter()
+            try:
+                async with session.post(f"{base}/okdesk-webhook", json=payload) as resp:
+                    body = await resp.json()
+                    if resp.status != 200 or body.get("status") != "success":
+                        webhooks.errors += 1
+            except aiohttp.ClientError:
+                webhooks.errors += 1
+            webhooks.latencies.append(time.perf_counter() - started)
+
+        async def send_update():
+            headers = {"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET_HEADER}
+            try:
+                async with session.post(f"{base}/telegram-webhook", json=factory.update(), headers=headers) as resp:
+                    if resp.status != 200:
+                        updates.errors += 1
+            except aiohttp.ClientError:
+                updates.errors += 1
+
+        print(f"🚀 Нагрузка: {args.webhooks} webhook'ов @ {args.webhook_rate}/с, "
+              f"{args.updates} updates @ {args.update_rate}/с, {len(issues)} заявок")
+        jobs = []
+        if args.webhooks:
+            jobs.append(run_open_loop(webhooks, args.webhooks, args.webhook_rate, send_webhook))
+        if args.updates:
+            jobs.append(run_open_loop(updates, args.updates, args.update_rate, send_update))
+        await asyncio.gather(*jobs)
+
+        # Дожидаемся фоновой обработки updates
+        while webhook_server.telegram_update_tasks:
+            await asyncio.sleep(0.05)
+        updates.finished = time.perf_counter()
+
+    rss_after = rss_mb()
+    server.should_exit = True
+    await server_task
+    await close_shared_session()
+    await bot_module.bot.session.close()
+    await okdesk.stop()
+    await telegram.stop()
+
+    print()
+    for stream in (webhooks, updates):
+        if stream.latencies or stream.errors:
+            print(stream.report())
+    print(f"{'память':<22} RSS {rss_before:.1f} -> {rss_after:.1f} МБ, пик {peak_rss_mb():.1f} МБ")
+    print(f"{'заглушка Okdesk':<22} {sum(okdesk.requests.values())} запросов, ошибок внедрено {okdesk.errors}")
+    for route, count in okdesk.requests.most_common(8):
+        print(f"    {count:>6}  {route}")
+    print(f"{'заглушка Telegram':<22} {sum(telegram.calls.values())} вызовов, flood {telegram.floods}: "
+          f"{dict(telegram.calls.most_common())}")
+    print(f"🗂 База и трассы: {workdir}")
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест webhook сервера без сети")
+    parser.add_argument("--webhooks", type=int, default=300, help="Количество webhook'ов Okdesk")
+    parser.add_argument("--webhook-rate", type=float, default=50.0, help="Webhook'ов в секунду")
+    parser.add_argument("--updates", type=int, default=100, help="Количество Telegram updates")
+    parser.add_argument("--update-rate", type=float, default=20.0, help="Updates в секунду")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--issues-per-user", type=int, default=3)
+    parser.add_argument("--attachment-share", type=float, default=0.1, help="Доля комментариев с вложением")
+    parser.add_argument("--okdesk-latency-ms", type=float, default=30.0)
+    parser.add_argument("--okdesk-error-rate", type=float, default=0.0)
+    parser.add_argument("--telegram-latency-ms", type=float, default=40.0)
+    parser.add_argument("--telegram-flood-rate", type=float, default=0.0)
+    parser.add_argument("--tracing", default="none", help="TRACING_EXPORTER для прогона (none/console/file)")
+    parser.add_argument("--log-level", default="ERROR")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args(argv)
+
+
+def main():
+    asyncio.run(main_async(parse_args()))
+
+
+if __name__ == "__main__":
+    main()
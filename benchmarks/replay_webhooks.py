@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Воспроизведение записанных webhook'ов Okdesk (WEBHOOK_RECORD_FILE) против
+локального экземпляра webhook сервера.
+
+Скорость: 1 (как в записи), 10 (в 10 раз быстрее) или max (без пауз,
+не более --concurrency одновременных запросов). Исходные тела
+(WEBHOOK_RECORD_SCRUB=false) отправляются байт в байт с записанной
+подписью. Очищенные от ПДн тела сериализуются заново, и записанная подпись
+к ним не подходит, поэтому для таких записей нужен --secret: тела
+подписываются заново.
+
+Отчет: p50/p95/p99/max задержки ответа, событий в секунду, ошибки,
+а также время обработки тех же событий при записи (для сравнения).
+
+Запуск: python -m benchmarks.replay_webhooks webhooks.jsonl.gz --url http://127.0.0.1:8000 --speed 10
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp  # noqa: E402
+
+from benchmarks.loadtest import Stream, percentile  # noqa: E402
+from services.webhook_recorder import needs_resign, read_records, record_body  # noqa: E402
+
+
+def prepare(record: Dict, secret: Optional[str]) -> tuple:
+    """Тело и заголовки запроса для записи"""
+    body = record_body(record)
+    headers = {"Content-Type": "application/json"}
+    if secret:
+        headers["X-Okdesk-Signature"] = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    elif record.get("s"):
+        headers["X-Okdesk-Signature"] = record["s"]
+    return body, headers
+
+
+async def replay(records: List[Dict], url: str, speed: Optional[float], concurrency: int,
+                 secret: Optional[str], path: Optional[str]) -> Stream:
+    stream = Stream(f"replay x{speed:g}" if speed else "replay max")
+    semaphore = asyncio.Semaphore(concurrency)
+    requests = [prepare(record, secret) for record in records]
+    first_at = records[0]["t"]
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as session:
+        async def send(index: int):
+            body, headers = requests[index]
+            target = url.rstrip("/") + (path or records[index].get("p") or "/okdesk-webhook")
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    async with session.post(target, data=body, headers=headers) as resp:
+                        result = await resp.read()
+                        if resp.status != 200 or b'"error"' in result:
+                            stream.errors += 1
+                except aiohttp.ClientError:
+                    stream.errors += 1
+                stream.latencies.append(time.perf_counter() - started)
+
+        tasks = []
+        stream.started = time.perf_counter()
+        for index, record in enumerate(records):
+            if speed:
+                delay = stream.started + (record["t"] - first_at) / speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send(index)))
+        await asyncio.gather(*tasks)
+        stream.finished = time.perf_counter()
+    return stream
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение записанных webhook'ов Okdesk")
+    parser.add_argument("file", help="Файл записи (WEBHOOK_RECORD_FILE, .jsonl или .jsonl.gz)")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Базовый URL webhook сервера")
+    parser.add_argument("--path", default=None, help="Путь webhook'а (по умолчанию - из записи)")
+    parser.add_argument("--speed", default="1", help="Множитель скорости (1, 10, ...) или max")
+    parser.add_argument("--concurrency", type=int, default=50, help="Одновременных запросов")
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET"), help="Подписать тела этим секретом")
+    parser.add_argument("--limit", type=int, default=0, help="Воспроизвести только первые N записей")
+    args = parser.parse_args()
+
+    records = list(read_records(args.file))
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        print("⚠️ В файле нет записей")
+        return
+    records.sort(key=lambda record: record["t"])
+    if not args.secret and any(needs_resign(record) for record in records):
+        parser.error("записи очищены от ПДн (WEBHOOK_RECORD_SCRUB), записанная подпись к ним не подходит - "
+                     "укажите --secret или WEBHOOK_SECRET")
+
+    speed = None if args.speed == "max" else float(args.speed)
+    span = records[-1]["t"] - records[0]["t"]
+    print(f"📼 {len(records)} webhook'ов за {span:.1f} с записи, скорость {args.speed}, цель {args.url}")
+
+    stream = asyncio.run(replay(records, args.url, speed, args.concurrency, args.secret, args.path))
+    print(stream.report())
+
+    recorded = [record["d"] for record in records if "d" in record]
+    if recorded:
+        print(f"{'при записи':<22} {len(recorded):>6} шт  {'':<27}"
+              f" p50 {percentile(recorded, 50):7.1f}  p95 {percentile(recorded, 95):7.1f}"
+              f"  p99 {percentile(recorded, 99):7.1f}  max {max(recorded):7.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
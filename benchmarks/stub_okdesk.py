@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Локальная заглушка REST API Okdesk для нагрузочных тестов (без сети).
+
+Отвечает на endpoint'ы, которые использует OkdeskAPI: issues, comments,
+contacts, companies, maintenance_entities, login_link и attachments (включая выдачу
+файлов по attachment_url). Задержка ответов и доля ошибок настраиваются.
+
+Отдельный запуск: python -m benchmarks.stub_okdesk --port 8081 --latency-ms 50
+(затем OKDESK_API_URL=http://127.0.0.1:8081)
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+from aiohttp import web
+
+# Минимальный PNG (1x1), дополняется до нужного размера
+_PNG_HEADER = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082"
+)
+
+
+class OkdeskStub:
+    """Заглушка Okdesk на aiohttp"""
+
+    def __init__(self, latency_ms: float = 20.0, jitter_ms: float = 10.0, error_rate: float = 0.0,
+                 attachment_size: int = 64 * 1024, seed: Optional[int] = None):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.attachment = (_PNG_HEADER + b"\0" * attachment_size)[:max(attachment_size, len(_PNG_HEADER))]
+        self.random = random.Random(seed)
+        self.requests: Counter = Counter()
+        self.errors = 0
+        self.base_url = ""
+        self._next_id = 100000
+        self._runner: Optional[web.AppRunner] = None
+        self._no_error_routes = frozenset((
+            "/files/{attachment_id}",
+            "/api/v1/issues/{issue_id}/attachments/{attachment_id}",
+            "/api/v1/attachments/{attachment_id}",
+            "/api/v1/attachments/{attachment_id}/download",
+        ))
+
+    # --- Вспомогательное ---
+
+    def _new_id(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+    @staticmethod
+    def _issue(issue_id: int, status: str = "opened") -> Dict:
+        return {
+            "id": issue_id,
+            "title": f"Заявка {issue_id}",
+            "description": "<p>Синтетическая заявка для нагрузочного теста</p>",
+            "status": {"code": status, "name": status},
+            "created_at": "2025-01-01T10:00:00.000+03:00",
+            "updated_at": "2025-01-01T10:00:00.000+03:00",
+            "company": {"id": 7, "name": "ООО Нагрузка"},
+            "contact": {"id": 301, "name": "Тестовый Контакт"},
+            "attachments": [],
+        }
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource else "unknown"
+        self.requests[f"{request.method} {route}"] += 1
+        delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        # Скачивание файлов не ломаем: при ошибке OkdeskAPI.download_attachment перебирает
+        # запасные URL, включая адреса реального портала, а тест должен оставаться без сети
+        if self.error_rate and route not in self._no_error_routes and self.random.random() < self.error_rate:
+            self.errors += 1
+            return web.json_response({"errors": "injected error"}, status=500)
+        return await handler(request)
+
+    # --- Обработчики ---
+
+    async def issues_list(self, request: web.Request):
+        page_size = int(request.query.get("page[size]", request.query.get("limit", 50)))
+        page = int(request.query.get("page[number]", 1))
+        if page > 1:
+            return web.json_response([])
+        return web.json_response([self._issue(1000 + i) for i in range(min(page_size, 20))])
+
+    async def issues_count(self, request: web.Request):
+        return web.json_response([1000 + i for i in range(20)])
+
+    async def issue_get(self, request: web.Request):
+        return web.json_response(self._issue(int(request.match_info["issue_id"])))
+
+    async def issue_create(self, request: web.Request):
+        issue_id = self._new_id()
+        return web.json_response({"id": issue_id, **self._issue(issue_id)}, status=201)
+
+    async def issue_status(self, request: web.Request):
+        return web.json_response({"id": int(request.match_info["issue_id"])})
+
+    async def comments_list(self, request: web.Request):
+        return web.json_response([])
+
+    async def comment_create(self, request: web.Request):
+        return web.json_response({"id": self._new_id(), "content": "ok", "public": True}, status=201)
+
+    async def attachment_info(self, request: web.Request):
+        attachment_id = int(request.match_info["attachment_id"])
+        return web.json_response({
+            "id": attachment_id,
+            "attachment_file_name": f"photo_{attachment_id}.png",
+            "attachment_file_size": len(self.attachment),
+            "attachment_url": f"{self.base_url}/files/{attachment_id}",
+        })
+
+    async def file_download(self, request: web.Request):
+        return web.Response(body=self.attachment, content_type="image/png")
+
+    async def contacts_list(self, request: web.Request):
+        phone = request.query.get("phone")
+        contact = {"id": 301, "first_name": "Тестовый", "last_name": "Контакт", "phone": phone or "+70000000000",
+                   "company_id": 7}
+        return web.json_response([contact])
+
+    async def contact_get(self, request: web.Request):
+        contact_id = int(request.match_info["contact_id"])
+        return web.json_response({"id": contact_id, "first_name": "Тестовый", "last_name": "Контакт",
+                                  "company_id": 7, "access_level": ["company_issues"],
+                                  "authentication_code": f"code{contact_id}"})
+
+    async def contact_create(self, request: web.Request):
+        return web.json_response({"id": self._new_id(), "first_name": "Новый", "last_name": "Контакт"}, status=201)
+
+    async def login_link(self, request: web.Request):
+        data = await request.json()
+        return web.json_response({"url": f"{self.base_url}/login?token=link{data.get('user_id')}-{self._new_id()}"})
+
+    async def companies_list(self, request: web.Request):
+        return web.json_response([{"id": 7, "name": "ООО Нагрузка", "inn_company": "5501234567"}])
+
+    async def company_get(self, request: web.Request):
+        return web.json_response({"id": int(request.match_info["company_id"]), "name": "ООО Нагрузка"})
+
+    async def company_create(self, request: web.Request):
+        return web.json_response({"id": self._new_id(), "name": "ООО Новая"}, status=201)
+
+    async def maintenance_entities(self, request: web.Request):
+        return web.json_response([{"id": 55, "name": "Офис на Ленина, 10", "company_id": 7}])
+
+    # --- Запуск ---
+
+    def make_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        api = "/api/v1"
+        app.router.add_get(f"{api}/issues/list", self.issues_list)
+        app.router.add_get(f"{api}/issues/count", self.issues_count)
+        app.router.add_get(f"{api}/issues", self.issues_list)
+        app.router.add_post(f"{api}/issues", self.issue_create)
+        app.router.add_get(f"{api}/issues/{{issue_id:\\d+}}", self.issue_get)
+        app.router.add_post(f"{api}/issues/{{issue_id:\\d+}}/statuses", self.issue_status)
+        app.router.add_get(f"{api}/issues/{{issue_id:\\d+}}/comments", self.comments_list)
+        app.router.add_post(f"{api}/issues/{{issue_id:\\d+}}/comments", self.comment_create)
+        app.router.add_get(f"{api}/issues/{{issue_id:\\d+}}/attachments/{{attachment_id:\\d+}}", self.attachment_info)
+        app.router.add_get(f"{api}/contacts", self.contacts_list)
+        app.router.add_get(f"{api}/contacts/list", self.contacts_list)
+        app.router.add_get(f"{api}/contacts/{{contact_id:\\d+}}", self.contact_get)
+        app.router.add_post(f"{api}/contacts", self.contact_create)
+        app.router.add_post(f"{api}/login_link", self.login_link)
+        app.router.add_get(f"{api}/companies", self.companies_list)
+        app.router.add_get(f"{api}/companies/list", self.companies_list)
+        app.router.add_get(f"{api}/companies/{{company_id:\\d+}}", self.company_get)
+        app.router.add_post(f"{api}/companies", self.company_create)
+        app.router.add_get(f"{api}/maintenance_entities", self.maintenance_entities)
+        app.router.add_get(f"{api}/maintenance_entities/list", self.maintenance_entities)
+        app.router.add_get(f"{api}/attachments/{{attachment_id:\\d+}}", self.file_download)
+        app.router.add_get(f"{api}/attachments/{{attachment_id:\\d+}}/download", self.file_download)
+        app.router.add_get("/files/{attachment_id}", self.file_download)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Запустить заглушку, вернуть базовый URL"""
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        actual_port = self._runner.addresses[0][1]
+        self.base_url = f"http://{host}:{actual_port}"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def _serve(args):
+    stub = OkdeskStub(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate)
+    url = await stub.start(args.host, args.port)
+    print(f"🧪 Заглушка Okdesk: {url} (задержка {args.latency_ms} мс, ошибок {args.error_rate:.0%})")
+    try:
+        while True:
+            await asyncio.sleep(60)
+            print(f"📊 {time.strftime('%H:%M:%S')} запросов: {sum(stub.requests.values())}, ошибок: {stub.errors}")
+    finally:
+        await stub.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Заглушка REST API Okdesk")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 500 (0..1)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Локальная заглушка Telegram Bot API для нагрузочных тестов (без сети).
+
+Принимает запросы aiogram вида POST /bot<token>/<method> и возвращает
+правдоподобные ответы (Message для send*/edit*, True для остальных).
+Можно задать задержку и долю ответов flood control (429 с retry_after).
+
+Отдельный запуск: python -m benchmarks.stub_telegram --port 8082
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from aiohttp import web
+
+_MESSAGE_METHODS = frozenset((
+    "sendMessage", "sendPhoto", "sendDocument", "sendVideo", "sendAudio", "sendVoice",
+    "editMessageText", "editMessageReplyMarkup", "editMessageCaption", "copyMessage",
+))
+
+
+class TelegramStub:
+    """Заглушка Bot API на aiohttp"""
+
+    def __init__(self, latency_ms: float = 30.0, jitter_ms: float = 10.0, flood_rate: float = 0.0,
+                 retry_after: int = 1, seed: Optional[int] = None):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.calls: Counter = Counter()
+        self.floods = 0
+        self.base_url = ""
+        self._message_id = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    def _message(self, fields: Dict[str, Any]) -> Dict[str, Any]:
+        self._message_id += 1
+        chat_id = int(fields.get("chat_id") or 0)
+        return {
+            "message_id": int(fields.get("message_id") or self._message_id),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": 1, "is_bot": True, "first_name": "LoadBot", "username": "load_bot"},
+            "text": str(fields.get("text") or fields.get("caption") or ""),
+        }
+
+    async def handle(self, request: web.Request):
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        fields = await request.post()
+
+        delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if self.flood_rate and method.startswith("send") and self.random.random() < self.flood_rate:
+            self.floods += 1
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+
+        if method in _MESSAGE_METHODS:
+            result: Any = self._message(fields)
+        elif method == "sendMediaGroup":
+            result = [self._message(fields)]
+        elif method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "LoadBot", "username": "load_bot"}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    def make_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Запустить заглушку, вернуть базовый URL (для TelegramAPIServer.from_base)"""
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        self.base_url = f"http://{host}:{self._runner.addresses[0][1]}"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def _serve(args):
+    stub = TelegramStub(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, flood_rate=args.flood_rate)
+    url = await stub.start(args.host, args.port)
+    print(f"🧪 Заглушка Telegram Bot API: {url}")
+    try:
+        while True:
+            await asyncio.sleep(60)
+            print(f"📊 {time.strftime('%H:%M:%S')} вызовов: {dict(stub.calls)}, flood: {stub.floods}")
+    finally:
+        await stub.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Заглушка Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--latency-ms", type=float, default=30.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="Доля ответов 429 для send* (0..1)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
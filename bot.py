@@ -4,30 +4,81 @@ from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from handlers import registration, issues
+from handlers.middlewares import UserMiddleware, UpdateMetricsMiddleware, TelegramRequestMetrics
 from models.database import create_tables
+from services.okdesk_api import enable_shared_session, close_shared_session
+from services.fsm_storage import create_fsm_storage, DatabaseFSMStorage
+from utils.logging_setup import setup_logging, get_queue_size
+from utils.metrics import QUEUE_DEPTH, start_metrics_server
+from utils.profiling import loop_monitor, install_profile_signal
 import config
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
+# Настройка логирования (очередь + уровни по категориям из LOG_LEVELS)
+setup_logging()
 
 # Инициализация бота и диспетчера
 bot = Bot(
     token=config.BOT_TOKEN,
     default=DefaultBotProperties(parse_mode=ParseMode.HTML)
 )
-dp = Dispatcher()
+# FSM в БД: незавершенные регистрация и заявки переживают перезапуск
+dp = Dispatcher(storage=create_fsm_storage())
 
 # Регистрация роутеров
 dp.include_router(registration.router)
 dp.include_router(issues.router)
 
+# Пользователь загружается один раз на update и передается в обработчики
+dp.message.middleware(UserMiddleware())
+dp.callback_query.middleware(UserMiddleware())
+
+# Метрики: обработка update'ов, запросы к Bot API, очереди
+dp.update.outer_middleware(UpdateMetricsMiddleware())
+bot.session.middleware(TelegramRequestMetrics())
+QUEUE_DEPTH.set_function(get_queue_size, "log_records")
+if isinstance(dp.storage, DatabaseFSMStorage):
+    QUEUE_DEPTH.set_function(dp.storage.pending_count, "fsm_pending_writes")
+
+async def run_polling(**kwargs):
+    """Запуск long polling (kwargs передаются в dp.start_polling)"""
+    # Снимаем webhook, если он остался после работы в режиме webhook
+    try:
+        await bot.delete_webhook(drop_pending_updates=False)
+    except Exception as e:
+        logging.getLogger(__name__).warning("⚠️ Не удалось снять webhook перед polling: %s", e)
+    await dp.start_polling(bot, **kwargs)
+
 async def main():
     """Главная функция запуска бота"""
     # Создаем таблицы в базе данных
     create_tables()
     
-    # Запускаем бота
-    await dp.start_polling(bot)
+    if config.TELEGRAM_MODE == "webhook":
+        # Updates принимает webhook_server (маршрут TELEGRAM_WEBHOOK_PATH)
+        logging.getLogger(__name__).warning(
+            "⚠️ TELEGRAM_MODE=webhook: обновления принимает webhook_server, polling не запускается"
+        )
+        return
+    
+    # Одна HTTP-сессия к Okdesk на весь процесс
+    enable_shared_session()
+    # Блокировки event loop - в лог; kill -USR1 <pid> - профилирование
+    loop_monitor.start()
+    install_profile_signal()
+    metrics_runner = None
+    if config.METRICS_ENABLED and config.BOT_METRICS_PORT:
+        try:
+            metrics_runner = await start_metrics_server(config.HOST, config.BOT_METRICS_PORT)
+        except OSError as e:
+            logging.getLogger(__name__).warning("⚠️ Не удалось запустить endpoint метрик: %s", e)
+    try:
+        # Запускаем бота
+        await run_polling()
+    finally:
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await loop_monitor.stop()
+        await close_shared_session()
 
 if __name__ == "__main__":
     asyncio.run(main())
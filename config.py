@@ -1,4 +1,5 @@
 import os
+import hashlib
 from dotenv import load_dotenv
 
 # Загружаем переменные окружения
@@ -14,12 +15,31 @@ OKDESK_PORTAL_URL = os.getenv("OKDESK_PORTAL_URL", "https://yapomogu55.okdesk.ru
 OKDESK_PORTAL_TOKEN = os.getenv("OKDESK_PORTAL_TOKEN")
 OKDESK_SYSTEM_USER_ID_STR = os.getenv("OKDESK_SYSTEM_USER_ID", "5")
 OKDESK_SYSTEM_USER_ID = int(OKDESK_SYSTEM_USER_ID_STR) if OKDESK_SYSTEM_USER_ID_STR and OKDESK_SYSTEM_USER_ID_STR.isdigit() else None
+# Пул соединений общей HTTP-сессии к Okdesk (бот и webhook сервер)
+OKDESK_HTTP_POOL_SIZE = int(os.getenv("OKDESK_HTTP_POOL_SIZE", 20))
+OKDESK_HTTP_TIMEOUT = int(os.getenv("OKDESK_HTTP_TIMEOUT", 60))  # секунды
 
 # Webhook Configuration
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")
 WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/okdesk-webhook")
 WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
 
+# Telegram updates: polling (bot.py опрашивает getUpdates) или webhook (через webhook_server)
+TELEGRAM_MODE = os.getenv("TELEGRAM_MODE", "polling").lower()
+TELEGRAM_WEBHOOK_PATH = os.getenv("TELEGRAM_WEBHOOK_PATH", "/telegram-webhook")
+# Публичный URL для Telegram; по умолчанию - хост из WEBHOOK_URL + TELEGRAM_WEBHOOK_PATH
+TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL")
+if not TELEGRAM_WEBHOOK_URL and WEBHOOK_URL and "://" in WEBHOOK_URL:
+    _scheme, _rest = WEBHOOK_URL.split("://", 1)
+    TELEGRAM_WEBHOOK_URL = f"{_scheme}://{_rest.split('/')[0]}{TELEGRAM_WEBHOOK_PATH}"
+# Секрет для заголовка X-Telegram-Bot-Api-Secret-Token; по умолчанию выводится из BOT_TOKEN,
+# чтобы все экземпляры сервера использовали одно значение
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET") or (
+    hashlib.sha256(BOT_TOKEN.encode()).hexdigest() if BOT_TOKEN else None
+)
+# Сколько секунд при остановке ждать обработки уже принятых Telegram updates
+TELEGRAM_UPDATE_DRAIN_TIMEOUT = float(os.getenv("TELEGRAM_UPDATE_DRAIN_TIMEOUT", 20))
+
 # Database Configuration
 # PostgreSQL Configuration
 POSTGRES_HOST = os.getenv("POSTGRES_HOST", "postgres")
@@ -45,10 +65,102 @@ if POSTGRES_HOST and POSTGRES_HOST.lower() != 'sqlite':
 else:
     DATABASE_URL = os.getenv("DATABASE_URL", DEFAULT_DB_PATH)
 
+# Пул соединений PostgreSQL
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))  # секунды ожидания свободного соединения
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))  # секунды жизни соединения
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+# Настройки SQLite (файл общий для бота и webhook сервера)
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL").upper()
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000))  # миллисекунды
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 64 * 1024 * 1024))  # байты, 0 - отключено
+
 # Server Configuration
 HOST = os.getenv("HOST", "0.0.0.0")  # Слушаем на всех интерфейсах
 PORT = int(os.getenv("PORT", 8000))
 
+# Метрики Prometheus: /metrics webhook сервера и отдельный порт бота в режиме polling (0 - отключен)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+BOT_METRICS_PORT = int(os.getenv("BOT_METRICS_PORT", 9101))
+
+# Трассировка событий: none, console (разбивка по этапам в лог), file (JSON Lines) или otel
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none").lower()
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+TRACING_RECENT_SIZE = int(os.getenv("TRACING_RECENT_SIZE", 200))  # последних трасс для /traces
+
+# Запись входящих webhook'ов для воспроизведения (benchmarks/replay_webhooks.py); пусто - выключена
+WEBHOOK_RECORD_FILE = os.getenv("WEBHOOK_RECORD_FILE", "")  # *.gz - со сжатием
+WEBHOOK_RECORD_SAMPLE_RATE = float(os.getenv("WEBHOOK_RECORD_SAMPLE_RATE", 1.0))
+WEBHOOK_RECORD_SCRUB = os.getenv("WEBHOOK_RECORD_SCRUB", "true").lower() in ("1", "true", "yes")  # очистка ПДн
+WEBHOOK_RECORD_FLUSH_INTERVAL = float(os.getenv("WEBHOOK_RECORD_FLUSH_INTERVAL", 1.0))  # секунды
+WEBHOOK_RECORD_MAX_MB = int(os.getenv("WEBHOOK_RECORD_MAX_MB", 512))
+
+# Массовая привязка контактов/компаний (sync_all_users.py, sync_contacts_companies.py)
+BULK_SYNC_CONCURRENCY = int(os.getenv("BULK_SYNC_CONCURRENCY", 8))  # одновременных запросов к Okdesk
+BULK_SYNC_BATCH_SIZE = int(os.getenv("BULK_SYNC_BATCH_SIZE", 200))  # пользователей на транзакцию
+
+# Профилирование на лету: POST /admin/profile (заголовок X-Admin-Token) или сигнал SIGUSR1
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")  # пусто - административные endpoint'ы отключены
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_DEFAULT_SECONDS = float(os.getenv("PROFILE_DEFAULT_SECONDS", 30))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 300))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", 5))
+
+# Контроль задержек event loop: блокировки дольше порога логируются со стеком (0 - отключен)
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", 200))
+LOOP_LAG_CHECK_INTERVAL_MS = float(os.getenv("LOOP_LAG_CHECK_INTERVAL_MS", 50))
+LOOP_LAG_STACK_DEPTH = int(os.getenv("LOOP_LAG_STACK_DEPTH", 15))
+
+# JSON backend: auto (orjson, если установлен), orjson или json
+JSON_BACKEND = os.getenv("JSON_BACKEND", "auto")
+
+# Logging Configuration
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Уровни по категориям: "services.okdesk_api=WARNING,webhook_server.payload=DEBUG"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()  # text или json
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+# Доля дампов payload, попадающих в лог (1.0 - все)
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", 1.0))
+LOG_MAX_PAYLOAD_CHARS = int(os.getenv("LOG_MAX_PAYLOAD_CHARS", 2000))
+
+# Хранилище FSM (состояний диалогов): database (переживает перезапуск) или memory
+FSM_STORAGE = os.getenv("FSM_STORAGE", "database").lower()
+# Интервал отложенной записи состояний в БД, секунды (0 - запись сразу, для нескольких реплик)
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", 1.0))
+# Брошенные диалоги удаляются через FSM_STATE_TTL секунд без активности
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", 86400))
+FSM_CLEANUP_INTERVAL = int(os.getenv("FSM_CLEANUP_INTERVAL", 3600))
+
+# Кэш пользователей в middleware бота (секунды жизни записи, 0 - отключен; число записей)
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 30))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 1000))
+
+# Ссылки со входом в портал строятся при отрисовке; login-ссылка контакта кэшируется
+PORTAL_LINK_CACHE_TTL = float(os.getenv("PORTAL_LINK_CACHE_TTL", 3600))  # секунды
+PORTAL_LINK_CACHE_SIZE = int(os.getenv("PORTAL_LINK_CACHE_SIZE", 5000))
+PORTAL_LINK_EXPIRE_MINUTES = int(os.getenv("PORTAL_LINK_EXPIRE_MINUTES", 60 * 24 * 30))  # срок жизни ссылки в Okdesk
+
+# Объекты обслуживания компании (шаг выбора филиала при регистрации юр. лица)
+SERVICE_OBJECT_CACHE_TTL = float(os.getenv("SERVICE_OBJECT_CACHE_TTL", 900))  # секунды
+SERVICE_OBJECT_CACHE_SIZE = int(os.getenv("SERVICE_OBJECT_CACHE_SIZE", 500))  # компаний
+
+# Фоновая сверка статусов заявок с Okdesk (на случай потерянных webhook'ов)
+RECONCILE_ENABLED = os.getenv("RECONCILE_ENABLED", "true").lower() in ("1", "true", "yes")
+RECONCILE_MIN_INTERVAL = int(os.getenv("RECONCILE_MIN_INTERVAL", 60))  # секунды
+RECONCILE_MAX_INTERVAL = int(os.getenv("RECONCILE_MAX_INTERVAL", 900))  # секунды
+RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", 50))  # заявок на страницу (не более 100)
+# Перекрытие окна updated_since (расхождение часов и часовых поясов)
+RECONCILE_OVERLAP_SECONDS = int(os.getenv("RECONCILE_OVERLAP_SECONDS", 300))
+# Глубина первой сверки, если курсор еще не сохранен
+RECONCILE_INITIAL_LOOKBACK_HOURS = int(os.getenv("RECONCILE_INITIAL_LOOKBACK_HOURS", 24))
+# Сверку выполняет один процесс (аренда в sync_state); если он не продлил аренду
+# за RECONCILE_MAX_INTERVAL + RECONCILE_LEASE_GRACE_SECONDS, ее подхватывает другой
+RECONCILE_LEASE_GRACE_SECONDS = int(os.getenv("RECONCILE_LEASE_GRACE_SECONDS", 120))
+
 # Okdesk API Endpoints
 OKDESK_ENDPOINTS = {
     "companies": "/companies",
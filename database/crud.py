@@ -1,10 +1,40 @@
-from models.database import SessionLocal, User, Issue, Comment
+from models.database import SessionLocal, User, Issue, Comment, SyncState
+from database.unit_of_work import get_session, in_unit_of_work
+from database.user_cache import user_cache
+from services.portal_links import portal_links
+from sqlalchemy import and_, or_, func, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import Optional, List
+from typing import Any, Optional, List, Dict, Tuple
+from datetime import datetime, timedelta
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+def _update_returning(db, model, criteria: list, values: Dict[str, Any]):
+    """
+    Обновить одну запись и вернуть ее за один запрос (UPDATE ... RETURNING).
+
+    В единице работы (database/unit_of_work.py) и на СУБД без RETURNING
+    изменяется объект сессии: запись произойдет при фиксации.
+    """
+    if in_unit_of_work() or not db.get_bind().dialect.update_returning:
+        obj = db.query(model).filter(*criteria).first()
+        if obj:
+            for name, value in values.items():
+                setattr(obj, name, value)
+            db.commit()
+        return obj
+
+    obj = db.execute(
+        update(model).where(*criteria).values(**values).returning(model),
+        execution_options={"synchronize_session": False}
+    ).scalars().first()
+    db.commit()
+    return obj
+
+
 class UserService:
     """Сервис для работы с пользователями"""
     
@@ -12,7 +42,7 @@ class UserService:
     def get_user_by_telegram_id(telegram_id: int) -> Optional[User]:
         """Получить пользователя по Telegram ID"""
         try:
-            db = SessionLocal()
+            db = get_session()
             try:
                 return db.query(User).filter(User.telegram_id == telegram_id).first()
             finally:
@@ -21,11 +51,27 @@ class UserService:
             logger.error(f"Ошибка получения пользователя {telegram_id}: {e}")
             return None
     
+    @staticmethod
+    def get_cached_user_by_telegram_id(telegram_id: int) -> Optional[User]:
+        """Получить пользователя по Telegram ID через кэш (см. database/user_cache.py)"""
+        found, user = user_cache.get(telegram_id)
+        if found:
+            return user
+        user = UserService.get_user_by_telegram_id(telegram_id)
+        user_cache.set(telegram_id, user)
+        return user
+    
+    @staticmethod
+    def invalidate_cached_user(telegram_id: int):
+        """Сбросить кэш пользователя после изменения его записи"""
+        if telegram_id is not None:
+            user_cache.invalidate(telegram_id)
+    
     @staticmethod
     def create_user(telegram_id: int, username: str = None) -> User:
         """Создать нового пользователя"""
         try:
-            db = SessionLocal()
+            db = get_session()
             try:
                 user = User(
                     telegram_id=telegram_id,
@@ -35,7 +81,7 @@ class UserService:
                 )
                 db.add(user)
                 db.commit()
-                db.refresh(user)
+                UserService.invalidate_cached_user(user.telegram_id)
                 return user
             finally:
                 db.close()
@@ -53,16 +99,16 @@ class UserService:
     @staticmethod
     def update_user_physical(user_id: int, full_name: str, phone: str) -> Optional[User]:
         """Обновить данные физического лица"""
-        db = SessionLocal()
+        db = get_session()
         try:
-            user = db.query(User).filter(User.id == user_id).first()
+            user = _update_returning(db, User, [User.id == user_id], {
+                "user_type": "physical",
+                "full_name": full_name,
+                "phone": phone,
+                "is_registered": True,
+            })
             if user:
-                user.user_type = "physical"
-                user.full_name = full_name
-                user.phone = phone
-                user.is_registered = True
-                db.commit()
-                db.refresh(user)
+                UserService.invalidate_cached_user(user.telegram_id)
             return user
         finally:
             db.close()
@@ -70,18 +116,18 @@ class UserService:
     @staticmethod
     def update_user_legal(user_id: int, inn_company: str, company_id: int = None, company_name: str = None, service_object_name: str = None) -> Optional[User]:
         """Обновить данные юридического лица"""
-        db = SessionLocal()
+        db = get_session()
         try:
-            user = db.query(User).filter(User.id == user_id).first()
+            user = _update_returning(db, User, [User.id == user_id], {
+                "user_type": "legal",
+                "inn_company": inn_company,
+                "company_id": company_id,
+                "company_name": company_name,
+                "service_object_name": service_object_name,
+                "is_registered": True,
+            })
             if user:
-                user.user_type = "legal"
-                user.inn_company = inn_company
-                user.company_id = company_id
-                user.company_name = company_name
-                user.service_object_name = service_object_name
-                user.is_registered = True
-                db.commit()
-                db.refresh(user)
+                UserService.invalidate_cached_user(user.telegram_id)
             return user
         finally:
             db.close()
@@ -89,13 +135,11 @@ class UserService:
     @staticmethod
     def update_user_auth_code(user_id: int, auth_code: str) -> Optional[User]:
         """Обновить код авторизации пользователя"""
-        db = SessionLocal()
+        db = get_session()
         try:
-            user = db.query(User).filter(User.id == user_id).first()
+            user = _update_returning(db, User, [User.id == user_id], {"contact_auth_code": auth_code})
             if user:
-                user.contact_auth_code = auth_code
-                db.commit()
-                db.refresh(user)
+                UserService.invalidate_cached_user(user.telegram_id)
             return user
         finally:
             db.close()
@@ -103,15 +147,14 @@ class UserService:
     @staticmethod
     def update_user_contact_info(user_id: int, contact_id: int, auth_code: str = None) -> Optional[User]:
         """Обновить информацию о контакте пользователя"""
-        db = SessionLocal()
+        db = get_session()
         try:
-            user = db.query(User).filter(User.id == user_id).first()
+            values = {"okdesk_contact_id": contact_id}
+            if auth_code:
+                values["contact_auth_code"] = auth_code
+            user = _update_returning(db, User, [User.id == user_id], values)
             if user:
-                user.okdesk_contact_id = contact_id
-                if auth_code:
-                    user.contact_auth_code = auth_code
-                db.commit()
-                db.refresh(user)
+                UserService.invalidate_cached_user(user.telegram_id)
             return user
         finally:
             db.close()
@@ -120,13 +163,11 @@ class UserService:
     def update_contact_id_by_telegram_id(telegram_id: int, contact_id: int) -> Optional[User]:
         """Обновить ID контакта OkDesk для пользователя по telegram_id"""
         logger.info(f"Обновление contact_id={contact_id} для пользователя telegram_id={telegram_id}")
-        db = SessionLocal()
+        db = get_session()
         try:
-            user = db.query(User).filter(User.telegram_id == telegram_id).first()
+            user = _update_returning(db, User, [User.telegram_id == telegram_id], {"okdesk_contact_id": contact_id})
             if user:
-                user.okdesk_contact_id = contact_id
-                db.commit()
-                db.refresh(user)
+                UserService.invalidate_cached_user(user.telegram_id)
                 logger.info(f"✅ Успешно обновлен контакт для пользователя {telegram_id}: contact_id={contact_id}")
                 return user
             else:
@@ -142,13 +183,13 @@ class UserService:
     def update_portal_token_by_telegram_id(telegram_id: int, portal_token: str) -> Optional[User]:
         """Обновить токен портала для пользователя по telegram_id"""
         logger.info(f"Обновление portal_token для пользователя telegram_id={telegram_id}")
-        db = SessionLocal()
+        db = get_session()
         try:
-            user = db.query(User).filter(User.telegram_id == telegram_id).first()
+            user = _update_returning(db, User, [User.telegram_id == telegram_id], {"portal_token": portal_token})
             if user:
-                user.portal_token = portal_token
-                db.commit()
-                db.refresh(user)
+                UserService.invalidate_cached_user(user.telegram_id)
+                # Ссылки на портал строятся при отрисовке: достаточно сбросить ссылку контакта
+                portal_links.invalidate(user.okdesk_contact_id)
                 logger.info(f"✅ Успешно обновлен токен портала для пользователя {telegram_id}")
                 return user
             else:
@@ -164,7 +205,7 @@ class UserService:
     def get_portal_token_by_telegram_id(telegram_id: int) -> Optional[str]:
         """Получить токен портала пользователя по telegram_id"""
         try:
-            db = SessionLocal()
+            db = get_session()
             try:
                 user = db.query(User).filter(User.telegram_id == telegram_id).first()
                 return user.portal_token if user else None
@@ -175,13 +216,13 @@ class UserService:
             return None
         """Обновить ID компании OkDesk для пользователя по telegram_id"""
         logger.info(f"Обновление company_id={company_id} для пользователя telegram_id={telegram_id}")
-        db = SessionLocal()
+        db = get_session()
         try:
             user = db.query(User).filter(User.telegram_id == telegram_id).first()
             if user:
                 user.okdesk_company_id = company_id
                 db.commit()
-                db.refresh(user)
+                UserService.invalidate_cached_user(user.telegram_id)
                 logger.info(f"✅ Успешно обновлена компания для пользователя {telegram_id}: company_id={company_id}")
                 return user
             else:
@@ -201,7 +242,7 @@ class IssueService:
                     description: str = None, status: str = "opened", 
                     okdesk_url: str = None, issue_number: str = None) -> Issue:
         """Создать новую заявку"""
-        db = SessionLocal()
+        db = get_session()
         try:
             issue = Issue(
                 telegram_user_id=telegram_user_id,
@@ -214,7 +255,6 @@ class IssueService:
             )
             db.add(issue)
             db.commit()
-            db.refresh(issue)
             return issue
         finally:
             db.close()
@@ -222,16 +262,81 @@ class IssueService:
     @staticmethod
     def get_user_issues(telegram_user_id: int) -> List[Issue]:
         """Получить все заявки пользователя"""
-        db = SessionLocal()
+        db = get_session()
         try:
             return db.query(Issue).filter(Issue.telegram_user_id == telegram_user_id).all()
         finally:
             db.close()
     
+    @staticmethod
+    def count_user_issues(telegram_user_id: int, statuses: List[str] = None, exclude: bool = False) -> int:
+        """
+        Количество заявок пользователя (опционально - только с указанными
+        статусами или, при exclude=True, со всеми, кроме указанных)
+        """
+        db = get_session()
+        try:
+            query = db.query(func.count(Issue.id)).filter(Issue.telegram_user_id == telegram_user_id)
+            if statuses is not None:
+                query = query.filter(Issue.status.notin_(statuses) if exclude else Issue.status.in_(statuses))
+            return query.scalar() or 0
+        finally:
+            db.close()
+    
+    @staticmethod
+    def get_user_issues_page(telegram_user_id: int, statuses: List[str], limit: int = 10,
+                             after_id: int = None, before_id: int = None,
+                             exclude: bool = False) -> Tuple[List[Issue], bool, bool]:
+        """
+        Страница заявок пользователя (новые сверху) с keyset-пагинацией.
+        Фильтр - статусы statuses или, при exclude=True, все, кроме них.
+
+        Курсор - id крайней заявки предыдущей страницы: after_id - следующая
+        страница (более старые заявки), before_id - предыдущая (более новые).
+        Порядок (created_at, id) обслуживается индексом ix_issues_user_status_created.
+
+        Returns:
+            Tuple[List[Issue], bool, bool]: (заявки, есть ли предыдущая страница, есть ли следующая)
+        """
+        db = get_session()
+        try:
+            query = db.query(Issue).filter(
+                Issue.telegram_user_id == telegram_user_id,
+                Issue.status.notin_(statuses) if exclude else Issue.status.in_(statuses)
+            )
+
+            anchor_id = after_id or before_id
+            anchor = None
+            if anchor_id:
+                anchor = db.query(Issue.created_at, Issue.id).filter(
+                    Issue.id == anchor_id,
+                    Issue.telegram_user_id == telegram_user_id
+                ).first()
+
+            if anchor is None:
+                issues = query.order_by(Issue.created_at.desc(), Issue.id.desc()).limit(limit + 1).all()
+                return issues[:limit], False, len(issues) > limit
+
+            if after_id:
+                issues = query.filter(or_(
+                    Issue.created_at < anchor.created_at,
+                    and_(Issue.created_at == anchor.created_at, Issue.id < anchor.id)
+                )).order_by(Issue.created_at.desc(), Issue.id.desc()).limit(limit + 1).all()
+                return issues[:limit], True, len(issues) > limit
+
+            issues = query.filter(or_(
+                Issue.created_at > anchor.created_at,
+                and_(Issue.created_at == anchor.created_at, Issue.id > anchor.id)
+            )).order_by(Issue.created_at.asc(), Issue.id.asc()).limit(limit + 1).all()
+            has_prev = len(issues) > limit
+            return list(reversed(issues[:limit])), has_prev, True
+        finally:
+            db.close()
+    
     @staticmethod
     def get_all_issues() -> List[Issue]:
         """Получить все заявки (для отладки)"""
-        db = SessionLocal()
+        db = get_session()
         try:
             return db.query(Issue).all()
         finally:
@@ -240,7 +345,7 @@ class IssueService:
     @staticmethod
     def get_issue_by_okdesk_id(okdesk_issue_id: int) -> Optional[Issue]:
         """Получить заявку по ID в Okdesk"""
-        db = SessionLocal()
+        db = get_session()
         try:
             return db.query(Issue).filter(Issue.okdesk_issue_id == okdesk_issue_id).first()
         finally:
@@ -249,7 +354,7 @@ class IssueService:
     @staticmethod
     def get_issue_by_id(issue_id: int) -> Optional[Issue]:
         """Получить заявку по ID"""
-        db = SessionLocal()
+        db = get_session()
         try:
             return db.query(Issue).filter(Issue.id == issue_id).first()
         finally:
@@ -258,7 +363,7 @@ class IssueService:
     @staticmethod
     def get_issue_by_number(issue_number: int) -> Optional[Issue]:
         """Получить заявку по номеру"""
-        db = SessionLocal()
+        db = get_session()
         try:
             return db.query(Issue).filter(Issue.issue_number == str(issue_number)).first()
         finally:
@@ -267,28 +372,41 @@ class IssueService:
     @staticmethod
     def update_issue_status(issue_id: int, status: str) -> Optional[Issue]:
         """Обновить статус заявки"""
-        db = SessionLocal()
+        db = get_session()
         try:
-            issue = db.query(Issue).filter(Issue.id == issue_id).first()
-            if issue:
-                issue.status = status
-                db.commit()
-                db.refresh(issue)
-            return issue
+            return _update_returning(db, Issue, [Issue.id == issue_id], {"status": status})
         finally:
             db.close()
     
     @staticmethod
     def update_issue_message_id(issue_id: int, message_id: int) -> bool:
         """Обновить ID сообщения Telegram для заявки"""
-        db = SessionLocal()
+        db = get_session()
         try:
-            issue = db.query(Issue).filter(Issue.id == issue_id).first()
-            if issue:
-                issue.telegram_message_id = message_id
-                db.commit()
-                return True
-            return False
+            return _update_returning(db, Issue, [Issue.id == issue_id], {"telegram_message_id": message_id}) is not None
+        finally:
+            db.close()
+
+    @staticmethod
+    def mark_rating_requested(issue_id: int) -> bool:
+        """Отметить, что пользователю отправлен запрос оценки"""
+        db = get_session()
+        try:
+            return _update_returning(db, Issue, [Issue.id == issue_id], {"rating_requested": True}) is not None
+        finally:
+            db.close()
+
+    @staticmethod
+    def get_open_issue_statuses(closed_statuses: List[str]) -> Dict[int, str]:
+        """Получить {okdesk_issue_id: status} для заявок, статус которых не в closed_statuses"""
+        db = get_session()
+        try:
+            rows = (
+                db.query(Issue.okdesk_issue_id, Issue.status)
+                .filter(Issue.status.notin_(closed_statuses))
+                .all()
+            )
+            return {okdesk_issue_id: status for okdesk_issue_id, status in rows}
         finally:
             db.close()
 
@@ -297,9 +415,15 @@ class CommentService:
     
     @staticmethod
     def add_comment(issue_id: int, telegram_user_id: int, content: str, 
-                   okdesk_comment_id: int = None, is_from_okdesk: bool = False) -> Comment:
-        """Добавить комментарий"""
-        db = SessionLocal()
+                   okdesk_comment_id: int = None, is_from_okdesk: bool = False) -> Optional[Comment]:
+        """
+        Добавить комментарий.
+
+        Запись выполняется сразу (flush и в единице работы), поэтому комментарий
+        с уже сохраненным okdesk_comment_id дает None, а не дубликат. В единице
+        работы при этом откатывается вся ее транзакция - вызывать до других изменений.
+        """
+        db = get_session()
         try:
             comment = Comment(
                 issue_id=issue_id,
@@ -309,8 +433,13 @@ class CommentService:
                 is_from_okdesk=is_from_okdesk
             )
             db.add(comment)
-            db.commit()
-            db.refresh(comment)
+            try:
+                db.flush()
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                logger.info("ℹ️ Комментарий Okdesk %s уже сохранен", okdesk_comment_id)
+                return None
             return comment
         finally:
             db.close()
@@ -318,8 +447,96 @@ class CommentService:
     @staticmethod
     def get_issue_comments(issue_id: int) -> List[Comment]:
         """Получить все комментарии заявки"""
-        db = SessionLocal()
+        db = get_session()
         try:
             return db.query(Comment).filter(Comment.issue_id == issue_id).all()
         finally:
             db.close()
+
+class SyncStateService:
+    """Сервис для хранения состояния фоновой синхронизации"""
+    
+    @staticmethod
+    def get_value(key: str) -> Optional[str]:
+        """Получить значение по ключу"""
+        db = get_session()
+        try:
+            state = db.query(SyncState).filter(SyncState.key == key).first()
+            return state.value if state else None
+        finally:
+            db.close()
+    
+    @staticmethod
+    def set_value(key: str, value: str) -> None:
+        """Сохранить значение по ключу"""
+        db = get_session()
+        try:
+            state = db.query(SyncState).filter(SyncState.key == key).first()
+            if state:
+                state.value = value
+            else:
+                db.add(SyncState(key=key, value=value))
+            db.commit()
+        finally:
+            db.close()
+    
+    @staticmethod
+    def try_acquire_lease(key: str, owner: str, ttl_seconds: float) -> bool:
+        """
+        Захватить или продлить аренду (один исполнитель фоновой задачи на все процессы).
+
+        Значение - "владелец|истекает(UTC ISO)". Захват - compare-and-set:
+        UPDATE ... WHERE value = прочитанное значение, поэтому из нескольких
+        процессов аренду получает только один.
+        """
+        now = datetime.utcnow()
+        new_value = f"{owner}|{(now + timedelta(seconds=ttl_seconds)).isoformat(timespec='seconds')}"
+        db = SessionLocal()
+        try:
+            state = db.query(SyncState).filter(SyncState.key == key).first()
+            if state is None:
+                db.add(SyncState(key=key, value=new_value))
+                try:
+                    db.commit()
+                except IntegrityError:
+                    # Другой процесс создал запись одновременно с нами
+                    db.rollback()
+                    return False
+                return True
+
+            current_owner, _, expires = (state.value or "").partition("|")
+            try:
+                expired = datetime.fromisoformat(expires) < now
+            except ValueError:
+                expired = True
+            if current_owner != owner and not expired:
+                return False
+
+            updated = db.execute(
+                update(SyncState)
+                .where(SyncState.key == key, SyncState.value == state.value)
+                .values(value=new_value)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+            return updated == 1
+        finally:
+            db.close()
+    
+    @staticmethod
+    def release_lease(key: str, owner: str) -> None:
+        """Освободить аренду, если она принадлежит owner"""
+        db = SessionLocal()
+        try:
+            state = db.query(SyncState).filter(SyncState.key == key).first()
+            if state is None or (state.value or "").partition("|")[0] != owner:
+                return
+            db.execute(
+                update(SyncState)
+                .where(SyncState.key == key, SyncState.value == state.value)
+                .values(value=None)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+        finally:
+            db.close()
@@ -0,0 +1,166 @@
+"""
+Единица работы (unit of work) для обработки одного события.
+
+Без единицы работы каждый метод сервисов из database/crud.py открывает свою
+сессию и фиксирует изменения отдельной транзакцией. Внутри
+
+    with unit_of_work():
+        await handle_status_changed(data)
+
+все вызовы сервисов в текущей задаче используют одну сессию: чтения идут
+через общую identity map, commit() в сервисах откладывается, а все изменения
+записываются одной транзакцией при выходе (при исключении - откатываются).
+
+Сетевые вызовы (уведомления в Telegram, запросы к Okdesk) внутри единицы
+работы держали бы соединение пула в открытой транзакции, поэтому они
+откладываются через after_commit() и выполняются run_unit_of_work() уже
+после фиксации - и только если она прошла успешно:
+
+    await run_unit_of_work(handle_status_changed, data)
+
+Особенности внутри единицы работы:
+- объекты, созданные сервисами, получают id только после выхода из блока
+  (кроме CommentService.add_comment: он выполняет flush сразу);
+- сервисы возвращают те же объекты, что и при чтении, поэтому прежние
+  значения полей нужно сохранять до вызова update_*.
+
+Сессия привязана к задаче и потоку, в которых открыта единица работы:
+фоновые задачи и asyncio.to_thread, унаследовавшие контекст, работают
+со своими сессиями, как и раньше.
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Iterator, List, Optional
+
+from sqlalchemy.orm import Session
+
+from models.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+class UnitOfWork:
+    """Сессия, общая для всех вызовов сервисов в рамках одного события"""
+
+    def __init__(self):
+        self.session: Session = SessionLocal(expire_on_commit=False)
+        self.thread_id = threading.get_ident()
+        self.active = True
+        # Асинхронные действия, выполняемые после успешной фиксации
+        self.after_commit: List[Callable[[], Awaitable]] = []
+
+    def owns_current_thread(self) -> bool:
+        return self.active and self.thread_id == threading.get_ident()
+
+
+_current: ContextVar[Optional[UnitOfWork]] = ContextVar("unit_of_work", default=None)
+
+
+class _BorrowedSession:
+    """
+    Сессия единицы работы, выданная методу сервиса: commit/refresh/close
+    не выполняются, фиксация - при завершении единицы работы.
+    """
+
+    __slots__ = ("_session",)
+
+    def __init__(self, session: Session):
+        self._session = session
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    def commit(self):
+        pass
+
+    def refresh(self, instance, *args, **kwargs):
+        pass
+
+    def close(self):
+        pass
+
+
+def get_session():
+    """
+    Сессия для метода сервиса: сессия текущей единицы работы (если она открыта
+    в этой задаче и потоке) или новая SessionLocal().
+    """
+    uow = _current.get()
+    if uow is not None and uow.owns_current_thread():
+        return _BorrowedSession(uow.session)
+    return SessionLocal()
+
+
+def in_unit_of_work() -> bool:
+    """Открыта ли единица работы в текущей задаче"""
+    uow = _current.get()
+    return uow is not None and uow.owns_current_thread()
+
+
+@contextmanager
+def unit_of_work() -> Iterator[Session]:
+    """
+    Открыть единицу работы. Вложенный вызов присоединяется к внешней.
+
+    Yields:
+        Session: Общая сессия (для запросов вне сервисов)
+    """
+    outer = _current.get()
+    if outer is not None and outer.owns_current_thread():
+        yield outer.session
+        return
+
+    uow = UnitOfWork()
+    token = _current.set(uow)
+    try:
+        yield uow.session
+        uow.session.commit()
+    except BaseException:
+        uow.session.rollback()
+        raise
+    finally:
+        uow.active = False
+        _current.reset(token)
+        uow.session.close()
+
+
+def _current_unit_of_work() -> Optional[UnitOfWork]:
+    uow = _current.get()
+    return uow if uow is not None and uow.owns_current_thread() else None
+
+
+async def after_commit(callback: Callable[[], Awaitable]):
+    """
+    Выполнить callback (уведомление и т.п.) после фиксации текущей единицы
+    работы; вне единицы работы - сразу. При откате callback не выполняется.
+    """
+    uow = _current_unit_of_work()
+    if uow is not None:
+        uow.after_commit.append(callback)
+    else:
+        await callback()
+
+
+async def run_unit_of_work(handler: Callable[..., Awaitable], *args, **kwargs):
+    """
+    Выполнить обработчик события в единице работы, затем - отложенные
+    через after_commit() действия (уже без открытой транзакции).
+    """
+    outer = _current_unit_of_work()
+    if outer is not None:
+        # Вложенный вызов: действия выполнит внешняя единица работы
+        return await handler(*args, **kwargs)
+
+    with unit_of_work():
+        callbacks = _current.get().after_commit
+        result = await handler(*args, **kwargs)
+    for callback in callbacks:
+        try:
+            await callback()
+        except Exception as e:
+            # Данные уже зафиксированы: ошибка одного уведомления не отменяет остальные
+            logger.exception("❌ Ошибка отложенного действия после фиксации: %s", e)
+    return result
@@ -0,0 +1,14 @@
+"""
+Небольшой TTL-кэш пользователей по telegram_id.
+
+Используется middleware бота, чтобы пользователь загружался из БД один раз
+на несколько нажатий подряд. Записи инвалидируются при любых изменениях
+пользователя через UserService, а TTL ограничивает устаревание данных,
+измененных в обход сервиса (другим процессом). Отсутствующий в БД
+пользователь тоже кэшируется (значение None).
+"""
+
+import config
+from utils.ttl_cache import TTLCache
+
+user_cache = TTLCache(ttl=config.USER_CACHE_TTL, max_size=config.USER_CACHE_SIZE)
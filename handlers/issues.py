@@ -5,15 +5,24 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from database.crud import UserService, IssueService, CommentService
 from services.okdesk_api import OkdeskAPI
-from models.database import SessionLocal, Issue
+from services.portal_links import portal_links, simple_issue_url
+from models.database import SessionLocal, Issue, User
 from utils.helpers import create_issue_title
+from utils.status_classifier import status_classifier
 import config
 import logging
 import asyncio
+from typing import Optional
 
 logger = logging.getLogger(__name__)
 router = Router()
 
+# Раздел "Закрытые" - завершающие статусы, "Открытые" - все остальные
+# (включая неизвестные коды, как и при сверке статусов)
+CLOSED_ISSUE_STATUSES = status_classifier.known_statuses(completion=True)
+# Заявок на одной странице списка
+ISSUES_PAGE_SIZE = 10
+
 def is_user_registered(user) -> bool:
     """Проверяет, зарегистрирован ли пользователь по фактическим данным"""
     if not user:
@@ -31,10 +40,8 @@ class IssueStates(StatesGroup):
     waiting_for_comment = State()
 
 @router.message(Command("menu"))
-async def cmd_menu(message: Message):
+async def cmd_menu(message: Message, user: Optional[User]):
     """Главное меню"""
-    user = UserService.get_user_by_telegram_id(message.from_user.id)
-    
     if not is_user_registered(user):
         await message.answer(
             "❌ Вы не зарегистрированы в системе.\n"
@@ -53,18 +60,9 @@ async def cmd_menu(message: Message):
     
     # Если у пользователя есть доступ к порталу, добавляем кнопку портала
     if user and user.okdesk_contact_id:
-        try:
-            from update_urls import update_user_portal_access
-            import asyncio
-            portal_result = await update_user_portal_access(user.telegram_id)
-            
-            if portal_result.get('success'):
-                portal_url = portal_result.get('main_portal_url', config.OKDESK_PORTAL_URL)
-                keyboard_buttons.append([InlineKeyboardButton(text="🌐 Клиентский портал", url=portal_url)])
-        except Exception as e:
-            logger.error(f"Ошибка создания ссылки на портал: {e}")
-            # Fallback - обычная ссылка на портал
-            keyboard_buttons.append([InlineKeyboardButton(text="🌐 Клиентский портал", url=config.OKDESK_PORTAL_URL)])
+        # Ссылка со входом строится на лету (кэш по контакту), при ошибке - обычная ссылка
+        portal_url = await portal_links.main_url(user)
+        keyboard_buttons.append([InlineKeyboardButton(text="🌐 Клиентский портал", url=portal_url)])
     
     # Дополнительные кнопки
     keyboard_buttons.append([InlineKeyboardButton(text="👤 Профиль", callback_data="profile")])
@@ -80,10 +78,8 @@ async def cmd_menu(message: Message):
     )
 
 @router.callback_query(F.data == "main_menu")
-async def show_main_menu(callback: CallbackQuery):
+async def show_main_menu(callback: CallbackQuery, user: Optional[User]):
     """Показать главное меню через callback"""
-    user = UserService.get_user_by_telegram_id(callback.from_user.id)
-    
     if not is_user_registered(user):
         await callback.message.edit_text(
             "❌ Вы не зарегистрированы в системе.\n"
@@ -102,17 +98,9 @@ async def show_main_menu(callback: CallbackQuery):
     
     # Если у пользователя есть доступ к порталу, добавляем кнопку портала
     if user and user.okdesk_contact_id:
-        try:
-            from update_urls import update_user_portal_access
-            portal_result = await update_user_portal_access(user.telegram_id)
-            
-            if portal_result.get('success'):
-                portal_url = portal_result.get('main_portal_url', config.OKDESK_PORTAL_URL)
-                keyboard_buttons.append([InlineKeyboardButton(text="🌐 Клиентский портал", url=portal_url)])
-        except Exception as e:
-            logger.error(f"Ошибка создания ссылки на портал: {e}")
-            # Fallback - обычная ссылка на портал
-            keyboard_buttons.append([InlineKeyboardButton(text="🌐 Клиентский портал", url=config.OKDESK_PORTAL_URL)])
+        # Ссылка со входом строится на лету (кэш по контакту), при ошибке - обычная ссылка
+        portal_url = await portal_links.main_url(user)
+        keyboard_buttons.append([InlineKeyboardButton(text="🌐 Клиентский портал", url=portal_url)])
     
     # Дополнительные кнопки
     keyboard_buttons.append([InlineKeyboardButton(text="👤 Профиль", callback_data="profile")])
@@ -127,10 +115,8 @@ async def show_main_menu(callback: CallbackQuery):
 
 
 @router.callback_query(F.data == "profile")
-async def show_profile(callback: CallbackQuery):
+async def show_profile(callback: CallbackQuery, user: Optional[User]):
     """Показать профиль пользователя"""
-    user = UserService.get_user_by_telegram_id(callback.from_user.id)
-    
     if not user:
         await callback.answer("❌ Пользователь не найден")
         return
@@ -205,10 +191,8 @@ async def cmd_help(message: Message):
     await message.answer(help_text)
 
 @router.message(Command("issue"))
-async def cmd_create_issue(message: Message, state: FSMContext):
+async def cmd_create_issue(message: Message, state: FSMContext, user: Optional[User]):
     """Быстрое создание заявки через команду"""
-    user = UserService.get_user_by_telegram_id(message.from_user.id)
-    
     if not is_user_registered(user):
         await message.answer(
             "❌ Вы не зарегистрированы в системе.\n"
@@ -239,7 +223,7 @@ async def create_issue_start(callback: CallbackQuery, state: FSMContext):
     await state.set_state(IssueStates.waiting_for_description)
 
 @router.message(StateFilter(IssueStates.waiting_for_description))
-async def process_issue_description(message: Message, state: FSMContext):
+async def process_issue_description(message: Message, state: FSMContext, user: Optional[User]):
     """Обработка описания заявки"""
     if not message.text:
         await message.answer(
@@ -255,7 +239,6 @@ async def process_issue_description(message: Message, state: FSMContext):
     # Автоматически создаем краткий заголовок из описания
     title = create_issue_title(description)
     
-    user = UserService.get_user_by_telegram_id(message.from_user.id)
     if not user:
         await message.answer("❌ Ошибка: пользователь не найден.")
         await state.clear()
@@ -319,45 +302,14 @@ async def process_issue_description(message: Message, state: FSMContext):
             okdesk_issue_id = response["id"]
             issue_number = response.get("number", str(okdesk_issue_id))
             
-            # Используем новую систему генерации ссылок с автоматическим входом
-            contact_id = user.okdesk_contact_id
-            
-            if contact_id:
-                # Импортируем функцию для создания расширенных ссылок
-                from update_urls import get_enhanced_issue_urls
-                
-                # Генерируем улучшенные ссылки с автоматическим входом
-                try:
-                    url_result = await get_enhanced_issue_urls(user.telegram_id, okdesk_issue_id)
-                    
-                    if url_result.get('success'):
-                        okdesk_url = url_result['auto_login_url']  # Ссылка с автоматическим входом
-                        simple_url = url_result['simple_url']      # Обычная ссылка
-                        main_portal_url = url_result['main_portal_url']  # Главная портала
-                        
-                        logger.info(f"✅ Сгенерированы улучшенные ссылки для заявки {okdesk_issue_id}")
-                    else:
-                        # Fallback к простой ссылке
-                        okdesk_url = f"{config.OKDESK_PORTAL_URL}/issues/{okdesk_issue_id}"
-                        logger.warning(f"⚠️ Используем простую ссылку для заявки {okdesk_issue_id}")
-                        
-                except Exception as e:
-                    logger.error(f"Ошибка генерации улучшенных ссылок: {e}")
-                    # Fallback к простой ссылке
-                    okdesk_url = f"{config.OKDESK_PORTAL_URL}/issues/{okdesk_issue_id}"
-            else:
-                # Если нет contact_id, используем простую ссылку на портал
-                okdesk_url = f"{config.OKDESK_PORTAL_URL}/issues/{okdesk_issue_id}"
-                logger.warning(f"⚠️ У пользователя {user.telegram_id} нет contact_id, используем простую ссылку")
-            
-            # Сохраняем заявку в нашей БД
+            # В БД - простая ссылка; ссылка со входом строится при отрисовке (services/portal_links.py)
             issue = IssueService.create_issue(
                 telegram_user_id=user.telegram_id,
                 okdesk_issue_id=okdesk_issue_id,
                 title=title,
                 description=description,
                 status="opened",
-                okdesk_url=okdesk_url,
+                okdesk_url=simple_issue_url(okdesk_issue_id),
                 issue_number=issue_number
             )
             
@@ -365,12 +317,12 @@ async def process_issue_description(message: Message, state: FSMContext):
             keyboard_buttons = []
             
             # Основная кнопка для перехода в портал
-            keyboard_buttons.append([InlineKeyboardButton(text="🔗 Открыть заявку в портале", url=okdesk_url)])
+            issue_portal_url = await portal_links.issue_url(user, okdesk_issue_id)
+            keyboard_buttons.append([InlineKeyboardButton(text="🔗 Открыть заявку в портале", url=issue_portal_url)])
             
-            # Если у нас есть contact_id и дополнительные ссылки, добавляем их
-            if contact_id and 'url_result' in locals() and url_result.get('success'):
-                # Кнопка для главной страницы портала
-                keyboard_buttons.append([InlineKeyboardButton(text="🏠 Главная портала", url=url_result['main_portal_url'])])
+            # Кнопка для главной страницы портала
+            if user.okdesk_contact_id:
+                keyboard_buttons.append([InlineKeyboardButton(text="🏠 Главная портала", url=await portal_links.main_url(user))])
             
             # Дополнительные функциональные кнопки
             keyboard_buttons.extend([
@@ -409,16 +361,13 @@ async def process_issue_description(message: Message, state: FSMContext):
     await state.clear()
 
 @router.callback_query(F.data == "my_issues")
-async def show_my_issues(callback: CallbackQuery):
+async def show_my_issues(callback: CallbackQuery, user: Optional[User]):
     """Показать заявки пользователя"""
-    user = UserService.get_user_by_telegram_id(callback.from_user.id)
     if not user:
         await callback.answer("❌ Пользователь не найден")
         return
     
-    issues = IssueService.get_user_issues(user.telegram_id)
-    
-    if not issues:
+    if not IssueService.count_user_issues(user.telegram_id):
         await callback.message.edit_text(
             "📋 **У вас пока нет заявок**\n\n"
             "📝 Создайте свою первую заявку!\n"
@@ -431,50 +380,49 @@ async def show_my_issues(callback: CallbackQuery):
         )
         return
     
-    # Разделяем заявки на открытые и закрытые
-    # Открытые - активные статусы
-    open_statuses = ["opened", "in_progress", "on_hold"]
-    closed_statuses = ["resolved", "closed", "completed"]
-    
-    open_issues = [issue for issue in issues if issue.status in open_statuses]
-    closed_issues = [issue for issue in issues if issue.status in closed_statuses]
-    
-    # Сортируем по дате создания (новые сверху)
-    open_issues.sort(key=lambda x: x.created_at, reverse=True)
-    closed_issues.sort(key=lambda x: x.created_at, reverse=True)
-    
     # Показываем открытые заявки по умолчанию
-    await show_issues_list(callback, open_issues, closed_issues, "open")
+    await show_issues_list(callback, user, "open")
 
-async def show_issues_list(callback: CallbackQuery, open_issues, closed_issues, list_type):
-    """Показать список заявок определенного типа"""
-    if list_type == "open":
-        issues = open_issues
+async def show_issues_list(callback: CallbackQuery, user: User, list_type: str,
+                           after_id: int = None, before_id: int = None):
+    """
+    Показать страницу заявок определенного типа.
+
+    Фильтрация по статусам, сортировка и пагинация выполняются в БД;
+    after_id/before_id - курсор соседней страницы (см. IssueService.get_user_issues_page).
+    """
+    statuses = CLOSED_ISSUE_STATUSES
+    exclude = list_type == "open"
+    if exclude:
         title = "📋 Открытые заявки"
         switch_button = "Показать закрытые"
         switch_callback = "show_closed_issues"
     else:
-        issues = closed_issues
         title = "📋 Закрытые заявки"
         switch_button = "Показать открытые"
         switch_callback = "show_open_issues"
     
+    total = IssueService.count_user_issues(user.telegram_id, statuses, exclude=exclude)
+    issues, has_prev, has_next = IssueService.get_user_issues_page(
+        user.telegram_id, statuses, limit=ISSUES_PAGE_SIZE, after_id=after_id, before_id=before_id,
+        exclude=exclude
+    )
+    
     if not issues:
         text = f"{title}\n\nУ вас нет заявок в этом разделе."
     else:
-        text = f"{title} ({len(issues)}):\n\n"
+        text = f"{title} ({total}):\n\n"
         
         for i, issue in enumerate(issues, 1):
-            status_emoji = config.ISSUE_STATUS_MESSAGES.get(issue.status, issue.status)
+            status_emoji = status_classifier.status_text(issue.status)
             created_date = issue.created_at.strftime('%d.%m')
             text += f"{i}. `#{issue.issue_number}` • {issue.title}\n"
             text += f"   {status_emoji} • {created_date}\n\n"
     
     keyboard_buttons = []
     
-    # Добавляем кнопки заявок (максимум 10 последних)
-    for i, issue in enumerate(issues[:10], 1):
-        status_emoji = config.ISSUE_STATUS_MESSAGES.get(issue.status, issue.status)
+    # Кнопки заявок текущей страницы
+    for i, issue in enumerate(issues, 1):
         # Обрезаем заголовок, если он слишком длинный
         title_short = issue.title[:25] + "..." if len(issue.title) > 25 else issue.title
         keyboard_buttons.append([
@@ -484,11 +432,23 @@ async def show_issues_list(callback: CallbackQuery, open_issues, closed_issues,
             )
         ])
     
+    # Навигация по страницам
+    navigation = []
+    if has_prev:
+        navigation.append(InlineKeyboardButton(
+            text="⬅️ Новее", callback_data=f"issues_page_{list_type}_prev_{issues[0].id}"
+        ))
+    if has_next:
+        navigation.append(InlineKeyboardButton(
+            text="Старее ➡️", callback_data=f"issues_page_{list_type}_next_{issues[-1].id}"
+        ))
+    if navigation:
+        keyboard_buttons.append(navigation)
+    
     # Добавляем кнопки управления
-    if open_issues or closed_issues:
-        keyboard_buttons.append([
-            InlineKeyboardButton(text=switch_button, callback_data=switch_callback)
-        ])
+    keyboard_buttons.append([
+        InlineKeyboardButton(text=switch_button, callback_data=switch_callback)
+    ])
     
     keyboard_buttons.append([
         InlineKeyboardButton(text="📝 Создать заявку", callback_data="create_issue"),
@@ -500,49 +460,45 @@ async def show_issues_list(callback: CallbackQuery, open_issues, closed_issues,
     await callback.message.edit_text(text, reply_markup=keyboard)
 
 @router.callback_query(F.data == "show_open_issues")
-async def show_open_issues(callback: CallbackQuery):
+async def show_open_issues(callback: CallbackQuery, user: Optional[User]):
     """Показать открытые заявки"""
-    user = UserService.get_user_by_telegram_id(callback.from_user.id)
     if not user:
         await callback.answer("❌ Пользователь не найден")
         return
     
-    issues = IssueService.get_user_issues(user.telegram_id)
-    
-    open_statuses = ["opened", "in_progress", "on_hold"]
-    closed_statuses = ["resolved", "closed", "completed"]
-    
-    open_issues = [issue for issue in issues if issue.status in open_statuses]
-    closed_issues = [issue for issue in issues if issue.status in closed_statuses]
-    
-    open_issues.sort(key=lambda x: x.created_at, reverse=True)
-    closed_issues.sort(key=lambda x: x.created_at, reverse=True)
-    
-    await show_issues_list(callback, open_issues, closed_issues, "open")
+    await show_issues_list(callback, user, "open")
 
 @router.callback_query(F.data == "show_closed_issues")
-async def show_closed_issues(callback: CallbackQuery):
+async def show_closed_issues(callback: CallbackQuery, user: Optional[User]):
     """Показать закрытые заявки"""
-    user = UserService.get_user_by_telegram_id(callback.from_user.id)
     if not user:
         await callback.answer("❌ Пользователь не найден")
         return
     
-    issues = IssueService.get_user_issues(user.telegram_id)
-    
-    open_statuses = ["opened", "in_progress", "on_hold"]
-    closed_statuses = ["resolved", "closed", "completed"]
-    
-    open_issues = [issue for issue in issues if issue.status in open_statuses]
-    closed_issues = [issue for issue in issues if issue.status in closed_statuses]
+    await show_issues_list(callback, user, "closed")
+
+@router.callback_query(F.data.startswith("issues_page_"))
+async def show_issues_page(callback: CallbackQuery, user: Optional[User]):
+    """Переход по страницам списка заявок (issues_page_<open|closed>_<prev|next>_<id>)"""
+    if not user:
+        await callback.answer("❌ Пользователь не найден")
+        return
     
-    open_issues.sort(key=lambda x: x.created_at, reverse=True)
-    closed_issues.sort(key=lambda x: x.created_at, reverse=True)
+    try:
+        _, _, list_type, direction, anchor_id = callback.data.split("_")
+        anchor_id = int(anchor_id)
+    except ValueError:
+        await callback.answer("❌ Некорректная страница")
+        return
     
-    await show_issues_list(callback, open_issues, closed_issues, "closed")
+    if direction == "next":
+        await show_issues_list(callback, user, list_type, after_id=anchor_id)
+    else:
+        await show_issues_list(callback, user, list_type, before_id=anchor_id)
+    await callback.answer()
 
 @router.callback_query(F.data.startswith("view_issue_"))
-async def view_issue(callback: CallbackQuery):
+async def view_issue(callback: CallbackQuery, user: Optional[User]):
     """Просмотр конкретной заявки"""
     issue_id = int(callback.data.split("_")[-1])
     
@@ -561,10 +517,7 @@ async def view_issue(callback: CallbackQuery):
             
             if okdesk_issue:
                 # Обновляем статус в нашей БД
-                current_status = okdesk_issue.get("status", issue.status)
-                # Если статус - словарь, извлекаем код
-                if isinstance(current_status, dict):
-                    current_status = current_status.get("code", current_status)
+                current_status = status_classifier.normalize(okdesk_issue.get("status") or issue.status)
                 
                 if current_status != issue.status:
                     issue.status = current_status
@@ -572,27 +525,17 @@ async def view_issue(callback: CallbackQuery):
         finally:
             await okdesk_api.close()
         
-        status_text = config.ISSUE_STATUS_MESSAGES.get(issue.status, issue.status)
+        status_text = status_classifier.status_text(issue.status)
         
         # Создаем кнопки с учетом возможности автоматического входа
         keyboard_buttons = []
         
-        # Пытаемся создать ссылку с автоматическим входом
-        user = UserService.get_user_by_telegram_id(callback.from_user.id)
-        enhanced_url = issue.okdesk_url  # По умолчанию используем существующую ссылку
+        # Ссылка с автоматическим входом (кэш по контакту)
+        enhanced_url = await portal_links.issue_url(user, issue.okdesk_issue_id)
         
         if user and user.okdesk_contact_id:
-            try:
-                from update_urls import get_enhanced_issue_urls
-                url_result = await get_enhanced_issue_urls(user.telegram_id, issue.okdesk_issue_id)
-                
-                if url_result.get('success'):
-                    enhanced_url = url_result['auto_login_url']
-                    # Дополнительная кнопка для главной портала
-                    keyboard_buttons.append([InlineKeyboardButton(text="🏠 Главная портала", url=url_result['main_portal_url'])])
-                    
-            except Exception as e:
-                logger.error(f"Ошибка создания enhanced URL: {e}")
+            # Дополнительная кнопка для главной портала
+            keyboard_buttons.append([InlineKeyboardButton(text="🏠 Главная портала", url=await portal_links.main_url(user))])
         
         # Основные кнопки
         keyboard_buttons.extend([
@@ -609,7 +552,7 @@ async def view_issue(callback: CallbackQuery):
             f"📝 Заголовок: {issue.title}\n"
             f"📄 Описание: {issue.description or 'Не указано'}\n"
             f" Создана: {issue.created_at.strftime('%d.%m.%Y %H:%M')}\n\n"
-            f"🔗 Ссылка на портал: {issue.okdesk_url}",
+            f"🔗 Ссылка на портал: {simple_issue_url(issue.okdesk_issue_id)}",
             reply_markup=keyboard
         )
     finally:
@@ -618,22 +561,22 @@ async def view_issue(callback: CallbackQuery):
 @router.callback_query(F.data.startswith("add_comment_"))
 async def add_comment_start(callback: CallbackQuery, state: FSMContext):
     """Начало добавления комментария"""
-    print(f"🔘 Обработка callback: {callback.data}")
+    logger.debug("🔘 Обработка callback: %s", callback.data)
     identifier = int(callback.data.split("_")[-1])
-    print(f"🔢 Извлечен идентификатор: {identifier}")
+    logger.debug("🔢 Извлечен идентификатор: %s", identifier)
     
     # Пытаемся найти заявку по ID или номеру
     issue = IssueService.get_issue_by_id(identifier)
     if not issue:
-        print(f"🔍 Не найдено по ID {identifier}, ищу по номеру...")
+        logger.debug("🔍 Не найдено по ID %s, ищу по номеру...", identifier)
         issue = IssueService.get_issue_by_number(identifier)
     
     if not issue:
-        print(f"❌ Заявка с идентификатором {identifier} не найдена")
+        logger.warning("❌ Заявка с идентификатором %s не найдена", identifier)
         await callback.message.edit_text("❌ Заявка не найдена")
         return
     
-    print(f"✅ Заявка найдена: #{issue.issue_number} (ID: {issue.id})")
+    logger.debug("✅ Заявка найдена: #%s (ID: %s)", issue.issue_number, issue.id)
     await state.update_data(issue_id=issue.id)
     
     await callback.message.edit_text(
@@ -646,7 +589,7 @@ async def add_comment_start(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 @router.message(StateFilter(IssueStates.waiting_for_comment))
-async def process_comment(message: Message, state: FSMContext, bot: Bot):
+async def process_comment(message: Message, state: FSMContext, bot: Bot, user: Optional[User]):
     """Обработка комментария с поддержкой медиафайлов"""
     data = await state.get_data()
     issue_id = data["issue_id"]
@@ -660,8 +603,6 @@ async def process_comment(message: Message, state: FSMContext, bot: Bot):
             await state.clear()
             return
         
-        # Получаем информацию о пользователе
-        user = UserService.get_user_by_telegram_id(message.from_user.id)
         if not user:
             await message.answer("❌ Ошибка: пользователь не найден")
             await state.clear()
@@ -861,20 +802,17 @@ async def check_status(callback: CallbackQuery):
             
             if okdesk_issue:
                 old_status = issue.status
-                new_status = okdesk_issue.get("status", issue.status)
-                # Если статус - словарь, извлекаем код
-                if isinstance(new_status, dict):
-                    new_status = new_status.get("code", new_status)
+                new_status = status_classifier.normalize(okdesk_issue.get("status") or issue.status)
                 
                 if new_status != old_status:
                     # Статус изменился
                     issue.status = new_status
                     db.commit()
                     
-                    status_text = config.ISSUE_STATUS_MESSAGES.get(new_status, new_status)
+                    status_text = status_classifier.status_text(new_status)
                     await callback.answer(f"📊 Статус обновлен: {status_text}")
                 else:
-                    status_text = config.ISSUE_STATUS_MESSAGES.get(new_status, new_status)
+                    status_text = status_classifier.status_text(new_status)
                     await callback.answer(f"📊 Текущий статус: {status_text}")
             else:
                 await callback.answer("❌ Не удалось получить актуальную информацию")
@@ -974,9 +912,8 @@ async def handle_rating(callback: CallbackQuery):
         await callback.answer("❌ Произошла ошибка")
 
 @router.callback_query(F.data == "profile")
-async def show_profile(callback: CallbackQuery):
+async def show_profile(callback: CallbackQuery, user: Optional[User]):
     """Показать профиль пользователя"""
-    user = UserService.get_user_by_telegram_id(callback.from_user.id)
     if not user:
         await callback.answer("❌ Пользователь не найден")
         return
@@ -1009,9 +946,8 @@ async def show_profile(callback: CallbackQuery):
     await callback.message.edit_text(profile_text, reply_markup=keyboard)
 
 @router.callback_query(F.data == "main_menu")
-async def back_to_menu(callback: CallbackQuery):
+async def back_to_menu(callback: CallbackQuery, user: Optional[User]):
     """Возврат в главное меню"""
-    user = UserService.get_user_by_telegram_id(callback.from_user.id)
     
     # Если не удалось получить пользователя из базы, показываем меню с регистрацией
     if not user or not is_user_registered(user):
@@ -0,0 +1,82 @@
+"""
+Middleware бота.
+
+UserMiddleware загружает пользователя один раз на update (через TTL-кэш
+UserService) и передает его в обработчики аргументом user. Регистрируется
+как inner middleware, поэтому запрос выполняется только для update'ов,
+для которых нашелся обработчик.
+
+UpdateMetricsMiddleware (outer middleware на update) и TelegramRequestMetrics
+(middleware сессии Bot) собирают метрики обработки update'ов, запросов
+к Telegram Bot API и ответов flood control (utils/metrics.py); запросы
+к Bot API попадают и в трассу текущего события (utils/tracing.py).
+"""
+
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.types import TelegramObject, Update
+
+from database.crud import UserService
+from utils.metrics import BOT_UPDATE_SECONDS, TELEGRAM_FLOOD_WAITS, TELEGRAM_FLOOD_WAIT_SECONDS, TELEGRAM_REQUEST_SECONDS
+from utils.tracing import record_span
+
+
+class UserMiddleware(BaseMiddleware):
+    """Передает в обработчики пользователя из БД (None, если не найден)"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        from_user = data.get("event_from_user")
+        data["user"] = UserService.get_cached_user_by_telegram_id(from_user.id) if from_user else None
+        return await handler(event, data)
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Длительность обработки update'а по типу (message, callback_query, ...) и результату"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        update_type = event.event_type if isinstance(event, Update) else type(event).__name__
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await handler(event, data)
+            outcome = "ok"
+            return result
+        finally:
+            BOT_UPDATE_SECONDS.observe(time.perf_counter() - started, update_type, outcome)
+
+
+class TelegramRequestMetrics(BaseRequestMiddleware):
+    """Длительность запросов к Telegram Bot API и ожидания flood control"""
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot, method: TelegramMethod):
+        api_method = method.__api_method__
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            response = await make_request(bot, method)
+            outcome = "ok"
+            return response
+        except TelegramRetryAfter as e:
+            outcome = "flood"
+            TELEGRAM_FLOOD_WAITS.inc(api_method)
+            TELEGRAM_FLOOD_WAIT_SECONDS.inc(api_method, amount=e.retry_after)
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            TELEGRAM_REQUEST_SECONDS.observe(duration, api_method, outcome)
+            record_span(f"telegram.{api_method}", duration, outcome=outcome)
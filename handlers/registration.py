@@ -5,9 +5,12 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from database.crud import UserService, IssueService
 from services.okdesk_api import OkdeskAPI
+from services.service_objects import service_objects_cache
+from models.database import User
 from utils.helpers import validate_phone, normalize_phone, validate_inn
 import config
 import logging
+from typing import Optional
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -26,13 +29,14 @@ def truncate_message(text: str, max_length: int = 4000) -> str:
 async def get_available_service_objects(okdesk_api: OkdeskAPI, company_id: int) -> list:
     """
     Получить доступные объекты обслуживания для компании.
-    Использует новый API метод get_maintenance_entities_for_company.
+    Список загружается через get_maintenance_entities_for_company один раз и
+    кэшируется по компании (services/service_objects.py).
     """
     try:
         logger.info(f"🔍 Получение объектов обслуживания для компании ID={company_id}")
         
-        # Используем новый метод API для получения объектов обслуживания для компании
-        service_objects = await okdesk_api.get_maintenance_entities_for_company(company_id)
+        # Из кэша компании или одной загрузкой через API
+        service_objects = await service_objects_cache.get(company_id, okdesk_api)
         
         if service_objects:
             logger.info(f"📋 Найдено {len(service_objects)} объектов обслуживания для компании")
@@ -65,10 +69,8 @@ class RegistrationStates(StatesGroup):
     waiting_for_branch = State()
 
 @router.message(Command("start"))
-async def cmd_start(message: Message, state: FSMContext):
+async def cmd_start(message: Message, state: FSMContext, user: Optional[User]):
     """Обработчик команды /start"""
-    user = UserService.get_user_by_telegram_id(message.from_user.id)
-    
     if is_user_registered(user):
         await message.answer(
             f"👋 Добро пожаловать обратно!\n\n"
@@ -139,7 +141,7 @@ async def process_full_name(message: Message, state: FSMContext):
     await state.set_state(RegistrationStates.waiting_for_phone)
 
 @router.message(StateFilter(RegistrationStates.waiting_for_phone))
-async def process_phone(message: Message, state: FSMContext):
+async def process_phone(message: Message, state: FSMContext, user: Optional[User]):
     """Обработка ввода телефона"""
     if message.contact:
         phone = message.contact.phone_number
@@ -166,7 +168,6 @@ async def process_phone(message: Message, state: FSMContext):
     
     if user_type == "physical":
         # Для физических лиц завершаем регистрацию
-        user = UserService.get_user_by_telegram_id(message.from_user.id)
         
         if user:
             # Обновляем данные пользователя
@@ -288,7 +289,7 @@ async def process_phone(message: Message, state: FSMContext):
         await state.set_state(RegistrationStates.waiting_for_inn)
 
 @router.message(StateFilter(RegistrationStates.waiting_for_inn))
-async def process_inn(message: Message, state: FSMContext):
+async def process_inn(message: Message, state: FSMContext, user: Optional[User]):
     """
     Обработка ИНН, поиск компании и переход к выбору объекта обслуживания
     """
@@ -306,9 +307,6 @@ async def process_inn(message: Message, state: FSMContext):
     okdesk_api = OkdeskAPI()
     
     try:
-        # Поиск пользователя в БД
-        user = UserService.get_user_by_telegram_id(message.from_user.id)
-        
         if not user:
             await message.answer("❌ Пользователь не найден. Начните регистрацию заново.")
             await state.clear()
@@ -434,7 +432,7 @@ async def process_branch_selection(callback: CallbackQuery, state: FSMContext):
     # Сохраняем branch_id в состоянии для использования в finalize
     await state.update_data(branch_id=branch_id)
     
-    # Получаем название объекта по ID
+    # Название объекта из кэша компании, заполненного при вводе ИНН
     branch_name = await get_service_object_name_by_id(callback, branch_id, company_id)
     
     await callback.message.edit_text(
@@ -474,7 +472,7 @@ async def finalize_legal_registration(message_or_callback, state: FSMContext, se
     """Финализация регистрации юридического лица с объектом обслуживания"""
     # Получаем данные из состояния
     data = await state.get_data()
-    user = UserService.get_user_by_telegram_id(message_or_callback.from_user.id)
+    user = UserService.get_cached_user_by_telegram_id(message_or_callback.from_user.id)
     
     if not user:
         error_msg = "❌ Пользователь не найден. Начните регистрацию заново."
@@ -495,6 +493,9 @@ async def finalize_legal_registration(message_or_callback, state: FSMContext, se
     full_name = data.get("full_name")
     phone = data.get("phone")
     branch_id = data.get("branch_id")
+    if branch_id:
+        # Выбранный из списка объект: название из кэша компании (без запросов к API)
+        service_object_name = service_objects_cache.name(company_id, branch_id) or service_object_name
     
     okdesk_api = OkdeskAPI()
     
@@ -671,31 +672,9 @@ async def finalize_legal_registration(message_or_callback, state: FSMContext, se
     await state.clear()
 
 async def get_service_object_name_by_id(callback_or_message, branch_id: int, company_id: int) -> str:
-    """Получить название объекта обслуживания по ID"""
+    """Получить название объекта обслуживания по ID (из кэша объектов компании)"""
     try:
-        okdesk_api = OkdeskAPI()
-        
-        # Сначала пробуем получить из maintenance_entities
-        maintenance_entities = await okdesk_api._make_request('GET', 'maintenance_entities')
-        if maintenance_entities and isinstance(maintenance_entities, list):
-            for obj in maintenance_entities:
-                if obj.get('id') == branch_id:
-                    await okdesk_api.close()
-                    return obj.get('name', f'Объект {branch_id}')
-        
-        # Если не нашли, пробуем из issues
-        issues = await okdesk_api._make_request('GET', 'issues/list')
-        if issues and isinstance(issues, list):
-            for issue in issues:
-                company = issue.get('company', {})
-                service_obj = issue.get('service_object', {})
-                if (isinstance(company, dict) and company.get('id') == company_id and 
-                    isinstance(service_obj, dict) and service_obj.get('id') == branch_id):
-                    await okdesk_api.close()
-                    return service_obj.get('name', f'Объект {branch_id}')
-        
-        await okdesk_api.close()
-        return f'Объект {branch_id}'
+        return await service_objects_cache.resolve_name(company_id, branch_id)
         
     except Exception as e:
         logger.error(f"Ошибка получения названия объекта обслуживания: {e}")
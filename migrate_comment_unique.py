@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Скрипт миграции базы данных: уникальный индекс comments (okdesk_comment_id).
+
+Индекс не дает сохранить комментарий Okdesk дважды при повторной или
+параллельной доставке webhook'а (и отправить пользователю два уведомления).
+Новые базы получают индекс автоматически при create_tables(); для
+существующих таблиц его нужно создать этим скриптом. Уже сохраненные
+дубликаты удаляются (остается запись с наименьшим id). Работает с SQLite
+и PostgreSQL.
+"""
+
+from sqlalchemy import func, inspect, select
+
+from models.database import engine, Comment
+
+
+INDEX_NAME = "ux_comments_okdesk_comment_id"
+
+
+def migrate_database():
+    """Миграция базы данных"""
+    try:
+        inspector = inspect(engine)
+        if not inspector.has_table(Comment.__tablename__):
+            print("ℹ️  Таблица comments еще не создана, индекс будет создан вместе с ней")
+            return True
+
+        existing = {index["name"] for index in inspector.get_indexes(Comment.__tablename__)}
+        print(f"📋 Текущие индексы таблицы comments: {sorted(existing)}")
+
+        if INDEX_NAME in existing:
+            print(f"ℹ️  Индекс {INDEX_NAME} уже существует")
+            return True
+
+        with engine.begin() as conn:
+            keep = (
+                select(func.min(Comment.id))
+                .where(Comment.okdesk_comment_id.is_not(None))
+                .group_by(Comment.okdesk_comment_id)
+            )
+            deleted = conn.execute(
+                Comment.__table__.delete().where(
+                    Comment.okdesk_comment_id.is_not(None), Comment.id.not_in(keep)
+                )
+            ).rowcount
+            if deleted:
+                print(f"🧹 Удалено дубликатов комментариев: {deleted}")
+
+            index = next(index for index in Comment.__table__.indexes if index.name == INDEX_NAME)
+            print(f"➕ Создание индекса {INDEX_NAME}...")
+            index.create(bind=conn)
+        print(f"✅ Индекс {INDEX_NAME} создан")
+        return True
+
+    except Exception as e:
+        print(f"❌ Ошибка при миграции: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    print("🚀 Начинаем миграцию базы данных...")
+    success = migrate_database()
+    if success:
+        print("✅ Миграция завершена успешно")
+    else:
+        print("❌ Миграция завершилась с ошибками")
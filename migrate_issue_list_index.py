@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Скрипт миграции базы данных: составной индекс issues (telegram_user_id, status, created_at)
+для постраничного списка "Мои заявки".
+
+Новые базы получают индекс автоматически при create_tables(); для существующих
+таблиц его нужно создать этим скриптом. Работает с SQLite и PostgreSQL.
+"""
+
+from sqlalchemy import inspect
+
+from models.database import engine, Issue
+
+
+INDEX_NAME = "ix_issues_user_status_created"
+
+
+def migrate_database():
+    """Миграция базы данных"""
+    try:
+        inspector = inspect(engine)
+        if not inspector.has_table(Issue.__tablename__):
+            print("ℹ️  Таблица issues еще не создана, индекс будет создан вместе с ней")
+            return True
+
+        existing = {index["name"] for index in inspector.get_indexes(Issue.__tablename__)}
+        print(f"📋 Текущие индексы таблицы issues: {sorted(existing)}")
+
+        if INDEX_NAME in existing:
+            print(f"ℹ️  Индекс {INDEX_NAME} уже существует")
+            return True
+
+        index = next(index for index in Issue.__table__.indexes if index.name == INDEX_NAME)
+        print(f"➕ Создание индекса {INDEX_NAME}...")
+        index.create(bind=engine)
+        print(f"✅ Индекс {INDEX_NAME} создан")
+        return True
+
+    except Exception as e:
+        print(f"❌ Ошибка при миграции: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    print("🚀 Начинаем миграцию базы данных...")
+    success = migrate_database()
+    if success:
+        print("✅ Миграция завершена успешно")
+    else:
+        print("❌ Миграция завершилась с ошибками")
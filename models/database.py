@@ -1,17 +1,108 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Boolean, BigInteger, BigInteger
+from sqlalchemy import create_engine, event, Column, Integer, String, DateTime, Text, Boolean, BigInteger, BigInteger, Index
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
+from typing import Any, Dict
+import time
 import config
+from utils.metrics import DB_QUERY_SECONDS
+from utils.tracing import record_span
 
 # Создаем базовый класс для моделей
 Base = declarative_base()
 
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Настройки SQLite для каждого нового соединения.
+    WAL: читатели не блокируются писателем (бот и webhook сервер работают с одним файлом),
+    busy_timeout: писатель ждет освобождения блокировки вместо "database is locked".
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={config.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(config.SQLITE_BUSY_TIMEOUT)}")
+        cursor.execute(f"PRAGMA mmap_size={int(config.SQLITE_MMAP_SIZE)}")
+    finally:
+        cursor.close()
+
+
+def create_db_engine(database_url: str = None, **kwargs) -> Engine:
+    """
+    Создать движок с настройками под конкретную СУБД.
+
+    SQLite: WAL, synchronous, busy_timeout и mmap_size (SQLITE_* в config).
+    PostgreSQL и другие: пул соединений (DB_POOL_* в config).
+    Дополнительные kwargs передаются в create_engine.
+    """
+    database_url = database_url or config.DATABASE_URL
+    options: Dict[str, Any] = {"echo": False}
+
+    if database_url.startswith("sqlite"):
+        # timeout драйвера дублирует busy_timeout на время открытия соединения
+        options["connect_args"] = {"timeout": config.SQLITE_BUSY_TIMEOUT / 1000}
+        options.update(kwargs)
+        db_engine = create_engine(database_url, **options)
+        if ":memory:" not in database_url:
+            event.listen(db_engine, "connect", _apply_sqlite_pragmas)
+        return db_engine
+
+    options.update(
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_timeout=config.DB_POOL_TIMEOUT,
+        pool_recycle=config.DB_POOL_RECYCLE,
+        pool_pre_ping=config.DB_POOL_PRE_PING,
+    )
+    options.update(kwargs)
+    return create_engine(database_url, **options)
+
+
+def get_pool_metrics(db_engine: Engine = None) -> Dict[str, Any]:
+    """Состояние пула соединений (для /health и диагностики)"""
+    pool = (db_engine or engine).pool
+    metrics: Dict[str, Any] = {"pool": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, name, None)
+        if callable(method):
+            metrics[name] = method()
+    return metrics
+
+
+_STATEMENT_TYPES = frozenset(("SELECT", "INSERT", "UPDATE", "DELETE", "PRAGMA", "BEGIN", "COMMIT", "ROLLBACK"))
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_started"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("query_started", None)
+    if started is None:
+        return
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    verb = verb if verb in _STATEMENT_TYPES else "OTHER"
+    duration = time.perf_counter() - started
+    DB_QUERY_SECONDS.observe(duration, verb)
+    record_span(f"db.{verb}", duration)
+
+
+def instrument_query_metrics(db_engine: Engine):
+    """Замерять длительность SQL-запросов (метрика db_query_seconds и span'ы db.* трассировки)"""
+    event.listen(db_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(db_engine, "after_cursor_execute", _after_cursor_execute)
+
+
 # Создаем движок базы данных (без echo для production)
-engine = create_engine(config.DATABASE_URL, echo=False)
+engine = create_db_engine()
+if config.METRICS_ENABLED:
+    instrument_query_metrics(engine)
 
-# Создаем фабрику сессий
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Создаем фабрику сессий. Объекты не истекают при commit(): сервисы возвращают
+# их после закрытия сессии, и повторная загрузка (refresh) не нужна
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, expire_on_commit=False)
 
 class User(Base):
     """Модель пользователя"""
@@ -66,6 +157,11 @@ class Issue(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        # Список "Мои заявки": фильтр по пользователю и статусу, сортировка по дате
+        Index("ix_issues_user_status_created", "telegram_user_id", "status", "created_at"),
+    )
+
 class Comment(Base):
     """Модель комментария"""
     __tablename__ = "comments"
@@ -79,6 +175,32 @@ class Comment(Base):
     
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Один комментарий Okdesk - одна запись (повторная доставка webhook'а не дублирует уведомление)
+        Index("ux_comments_okdesk_comment_id", "okdesk_comment_id", unique=True),
+    )
+
+class SyncState(Base):
+    """Состояние фоновой синхронизации (курсоры и т.п.)"""
+    __tablename__ = "sync_state"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String, unique=True, index=True, nullable=False)
+    value = Column(String, nullable=True)
+    
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class FSMState(Base):
+    """Состояние диалога бота (FSM aiogram)"""
+    __tablename__ = "fsm_states"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String, unique=True, index=True, nullable=False)  # fsm:<bot_id>:<chat_id>:<user_id>:<destiny>
+    state = Column(String, nullable=True)
+    data = Column(Text, nullable=True)  # JSON
+    
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
 # Создаем все таблицы ТОЛЬКО если их нет
 def create_tables():
     """
@@ -23,7 +23,8 @@ logger = logging.getLogger(__name__)
 TESTS = [
     "test_client_binding_fixed",
     "test_comment_with_author",
-    "quick_check_fixes"
+    "quick_check_fixes",
+    "test_status_classifier"
 ]
 
 # Дополнительные диагностические инструменты
@@ -0,0 +1,338 @@
+"""
+Массовая привязка пользователей к контактам и компаниям Okdesk.
+
+Вместо последовательных find_contact_by_phone / find_company_by_inn на
+каждого пользователя (десятки запросов на одного) синхронизатор один раз
+постранично загружает контакты и компании Okdesk и строит индексы по
+телефону (последние 10 цифр) и ИНН. Пользователи читаются из БД пачками
+по id (BULK_SYNC_BATCH_SIZE), найденные ID записываются одним
+bulk-update на пачку. Тех, кого нет в индексах, ищут точечными запросами
+не более BULK_SYNC_CONCURRENCY одновременно (один запрос на уникальный
+телефон/ИНН). Вместе с каждой пачкой в sync_state сохраняется id
+последнего обработанного пользователя: прерванный запуск продолжается с
+этого места (--restart - начать заново).
+
+Используется скриптами sync_all_users.py и sync_contacts_companies.py.
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from contextlib import aclosing
+from typing import Any, Dict, List, Optional, Set
+
+import config
+from database.unit_of_work import get_session
+from database.user_cache import user_cache
+from models.database import SyncState, User
+from services.okdesk_api import OkdeskAPI, enable_shared_session, close_shared_session
+
+logger = logging.getLogger(__name__)
+
+# Контрольная точка своя для каждого режима: прерванный запуск одного
+# скрипта не должен сдвигать начало прохода другого
+CHECKPOINT_KEY = "bulk_sync_last_user_id"
+
+# Коды параметров компании, в которых хранится ИНН
+_INN_CODES = ("inn", "INN", "ИНН", "inn_company", "legal_inn", "0001")
+
+
+def phone_key(phone: Optional[str]) -> Optional[str]:
+    """Ключ телефона для сопоставления: последние 10 цифр"""
+    digits = "".join(c for c in phone or "" if c.isdigit())
+    return digits[-10:] if len(digits) >= 10 else None
+
+
+def inn_key(inn: Optional[str]) -> Optional[str]:
+    """ИНН только из цифр"""
+    digits = "".join(c for c in str(inn or "") if c.isdigit())
+    return digits or None
+
+
+def company_inns(company: Dict[str, Any]) -> Set[str]:
+    """Все ИНН компании: основные поля, parameters и custom_parameters"""
+    values = [company.get(code) for code in _INN_CODES]
+    for param in company.get("parameters") or []:
+        if isinstance(param, dict) and param.get("code") in _INN_CODES:
+            values.append(param.get("value"))
+    custom = company.get("custom_parameters")
+    if isinstance(custom, dict):
+        values.extend(custom.get(code) for code in _INN_CODES)
+    return {key for key in map(inn_key, values) if key}
+
+
+class BulkSynchronizer:
+    """Пакетная привязка okdesk_contact_id и company_id пользователей"""
+
+    def __init__(self, okdesk_api: OkdeskAPI = None, concurrency: int = None, batch_size: int = None,
+                 lookup_missing: bool = True, create_missing_contacts: bool = False,
+                 checkpoint_key: str = None):
+        """
+        Args:
+            okdesk_api: Клиент API (по умолчанию создается новый)
+            concurrency: Одновременных точечных запросов к Okdesk
+            batch_size: Пользователей на пачку (одна транзакция и одна контрольная точка)
+            lookup_missing: Искать точечно тех, кого нет в загруженных индексах
+            create_missing_contacts: Создавать контакт, если он не найден
+            checkpoint_key: Ключ контрольной точки в sync_state (по умолчанию - по режиму)
+        """
+        self.okdesk_api = okdesk_api or OkdeskAPI()
+        self.concurrency = concurrency or config.BULK_SYNC_CONCURRENCY
+        self.batch_size = batch_size or config.BULK_SYNC_BATCH_SIZE
+        self.lookup_missing = lookup_missing
+        self.create_missing_contacts = create_missing_contacts
+        if checkpoint_key is None:
+            if create_missing_contacts:
+                checkpoint_key = f"{CHECKPOINT_KEY}:create"
+            elif not lookup_missing:
+                checkpoint_key = f"{CHECKPOINT_KEY}:index_only"
+            else:
+                checkpoint_key = CHECKPOINT_KEY
+        self.checkpoint_key = checkpoint_key
+        self.contacts_by_phone: Dict[str, int] = {}
+        self.companies_by_inn: Dict[str, int] = {}
+        self.stats = {"processed": 0, "contacts": 0, "companies": 0, "created": 0, "lookups": 0}
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._lookups: Dict[tuple, asyncio.Future] = {}
+
+    # --- Индексы ---
+
+    async def build_indexes(self):
+        """Загрузить все контакты и компании Okdesk (постранично, один раз за запуск)"""
+        started = time.perf_counter()
+        async with aclosing(self.okdesk_api.paginate("contacts", prefetch=True)) as contacts:
+            async for contact in contacts:
+                self._index_contact(contact)
+        async with aclosing(self.okdesk_api.paginate("companies/list", prefetch=True)) as companies:
+            async for company in companies:
+                for key in company_inns(company):
+                    self.companies_by_inn.setdefault(key, company["id"])
+        logger.info("📇 Индексы Okdesk: %s телефонов, %s ИНН за %.1f с",
+                    len(self.contacts_by_phone), len(self.companies_by_inn), time.perf_counter() - started)
+
+    def _index_contact(self, contact: Dict[str, Any]):
+        if not isinstance(contact, dict) or "id" not in contact:
+            return
+        for field in ("phone", "mobile_phone"):
+            key = phone_key(contact.get(field))
+            if key:
+                self.contacts_by_phone.setdefault(key, contact["id"])
+
+    # --- Точечный поиск (только для промахов индекса) ---
+
+    async def _lookup(self, kind: str, key: str, factory) -> Optional[int]:
+        """Один запрос на уникальный ключ, не более concurrency одновременно"""
+        future = self._lookups.get((kind, key))
+        if future is None:
+            future = asyncio.ensure_future(self._limited(factory))
+            self._lookups[(kind, key)] = future
+        return await future
+
+    async def _limited(self, factory) -> Optional[int]:
+        async with self._semaphore:
+            self.stats["lookups"] += 1
+            try:
+                return await factory()
+            except Exception as e:
+                logger.warning("⚠️ Ошибка точечного поиска в Okdesk: %s", e)
+                return None
+
+    async def _find_contact(self, user: Dict[str, Any]) -> Optional[int]:
+        key = phone_key(user["phone"])
+        if not key:
+            return None
+        if key in self.contacts_by_phone:
+            return self.contacts_by_phone[key]
+        if not self.lookup_missing and not self.create_missing_contacts:
+            return None
+
+        async def fetch():
+            if self.lookup_missing:
+                for phone in (f"+7{key}", f"7{key}", f"8{key}"):
+                    response = await self.okdesk_api._make_request("GET", "contacts", params={"phone": phone})
+                    found = response[0] if isinstance(response, list) and response else response
+                    if isinstance(found, dict) and "id" in found:
+                        self._index_contact(found)
+                        return found["id"]
+            if self.create_missing_contacts:
+                return await self._create_contact(user)
+            return None
+
+        return await self._lookup("contact", key, fetch)
+
+    async def _create_contact(self, user: Dict[str, Any]) -> Optional[int]:
+        parts = (user["full_name"] or "").split()
+        first_name = parts[0] if len(parts) > 1 else "Пользователь"
+        last_name = " ".join(parts[1:]) if len(parts) > 1 else "Telegram"
+        contact = await self.okdesk_api.create_contact(
+            first_name=first_name,
+            last_name=last_name,
+            phone=user["phone"],
+            comment=f"Контакт создан автоматически из Telegram для пользователя {user['telegram_id']}"
+        )
+        if contact and "id" in contact:
+            self.stats["created"] += 1
+            return contact["id"]
+        return None
+
+    async def _find_company(self, user: Dict[str, Any]) -> Optional[int]:
+        key = inn_key(user["inn_company"])
+        if not key:
+            return None
+        if key in self.companies_by_inn:
+            return self.companies_by_inn[key]
+        if not self.lookup_missing:
+            return None
+
+        async def fetch():
+            for param in ("custom_parameters[inn_company]", "custom_parameters[0001]"):
+                companies = await self.okdesk_api._make_request("GET", "companies/list", params={param: key})
+                for company in companies if isinstance(companies, list) else []:
+                    if key in company_inns(company):
+                        return company["id"]
+            return None
+
+        return await self._lookup("company", key, fetch)
+
+    # --- Пачки пользователей ---
+
+    def _load_batch(self, after_id: int) -> List[Dict[str, Any]]:
+        """Следующая пачка пользователей, которым не хватает контакта или компании"""
+        db = get_session()
+        try:
+            rows = db.query(
+                User.id, User.telegram_id, User.full_name, User.phone, User.inn_company,
+                User.okdesk_contact_id, User.company_id
+            ).filter(
+                User.id > after_id,
+                ((User.okdesk_contact_id.is_(None)) & (User.phone.isnot(None)))
+                | ((User.company_id.is_(None)) & (User.inn_company.isnot(None)))
+            ).order_by(User.id).limit(self.batch_size).all()
+            return [row._asdict() for row in rows]
+        finally:
+            db.close()
+
+    def _count_pending(self, after_id: int) -> int:
+        db = get_session()
+        try:
+            return db.query(User.id).filter(
+                User.id > after_id,
+                ((User.okdesk_contact_id.is_(None)) & (User.phone.isnot(None)))
+                | ((User.company_id.is_(None)) & (User.inn_company.isnot(None)))
+            ).count()
+        finally:
+            db.close()
+
+    async def _resolve(self, user: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Изменения для одного пользователя (None - менять нечего)"""
+        changes: Dict[str, Any] = {}
+        if user["okdesk_contact_id"] is None and user["phone"]:
+            contact_id = await self._find_contact(user)
+            if contact_id:
+                changes["okdesk_contact_id"] = contact_id
+        if user["company_id"] is None and user["inn_company"]:
+            company_id = await self._find_company(user)
+            if company_id:
+                changes["company_id"] = company_id
+        return {"id": user["id"], **changes} if changes else None
+
+    def _apply(self, mappings: List[Dict[str, Any]], checkpoint: int, telegram_ids: Dict[int, int]):
+        """Записать пачку изменений и контрольную точку одной транзакцией"""
+        db = get_session()
+        try:
+            if mappings:
+                db.bulk_update_mappings(User, mappings)
+            state = db.query(SyncState).filter(SyncState.key == self.checkpoint_key).first()
+            if state:
+                state.value = str(checkpoint)
+            else:
+                db.add(SyncState(key=self.checkpoint_key, value=str(checkpoint)))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        for mapping in mappings:
+            user_cache.invalidate(telegram_ids[mapping["id"]])
+
+    def _read_checkpoint(self) -> int:
+        db = get_session()
+        try:
+            state = db.query(SyncState).filter(SyncState.key == self.checkpoint_key).first()
+            return int(state.value) if state and state.value else 0
+        finally:
+            db.close()
+
+    # --- Запуск ---
+
+    async def run(self, restart: bool = False) -> Dict[str, int]:
+        """
+        Привязать всех пользователей без контакта/компании.
+
+        Args:
+            restart: Игнорировать контрольную точку прошлого запуска
+
+        Returns:
+            Dict[str, int]: Статистика (обработано, привязано контактов/компаний, создано, запросов)
+        """
+        after_id = 0 if restart else self._read_checkpoint()
+        if after_id:
+            logger.info("⏯️ Продолжаем с пользователя id > %s (контрольная точка %s)", after_id, self.checkpoint_key)
+        total = self._count_pending(after_id)
+        logger.info("👥 Пользователей для привязки: %s", total)
+        if not total:
+            return self.stats
+
+        await self.build_indexes()
+        started = time.perf_counter()
+        while True:
+            batch = self._load_batch(after_id)
+            if not batch:
+                break
+            results = await asyncio.gather(*(self._resolve(user) for user in batch))
+            mappings = [result for result in results if result]
+            after_id = batch[-1]["id"]
+            self._apply(mappings, after_id, {user["id"]: user["telegram_id"] for user in batch})
+
+            self.stats["processed"] += len(batch)
+            self.stats["contacts"] += sum(1 for m in mappings if "okdesk_contact_id" in m)
+            self.stats["companies"] += sum(1 for m in mappings if "company_id" in m)
+            self._log_progress(total, started)
+
+        # Полный проход завершен - следующий запуск начнет сначала
+        self._apply([], 0, {})
+        logger.info("✅ Синхронизация завершена: %s", self.stats)
+        return self.stats
+
+    def _log_progress(self, total: int, started: float):
+        processed = self.stats["processed"]
+        elapsed = time.perf_counter() - started
+        rate = processed / elapsed if elapsed > 0 else 0.0
+        eta = (total - processed) / rate if rate else 0.0
+        logger.info("📊 %s/%s (%.0f%%), %.1f польз./с, контактов +%s, компаний +%s, запросов %s, осталось ~%.0f с",
+                    processed, total, processed * 100 / max(total, 1), rate, self.stats["contacts"],
+                    self.stats["companies"], self.stats["lookups"], eta)
+
+
+def run_cli(description: str, create_missing_contacts: bool = False):
+    """Общая точка входа скриптов синхронизации"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--restart", action="store_true", help="Начать заново, игнорируя контрольную точку")
+    parser.add_argument("--concurrency", type=int, default=None, help="Одновременных запросов к Okdesk")
+    parser.add_argument("--batch-size", type=int, default=None, help="Пользователей на пачку")
+    parser.add_argument("--no-lookup", action="store_true", help="Только загруженные индексы, без точечных запросов")
+    args = parser.parse_args()
+
+    async def main():
+        enable_shared_session()
+        try:
+            synchronizer = BulkSynchronizer(concurrency=args.concurrency, batch_size=args.batch_size,
+                                            lookup_missing=not args.no_lookup,
+                                            create_missing_contacts=create_missing_contacts)
+            return await synchronizer.run(restart=args.restart)
+        finally:
+            await close_shared_session()
+
+    return asyncio.run(main())
@@ -0,0 +1,221 @@
+"""
+Хранилище FSM aiogram в нашей базе данных.
+
+Состояния регистрации и создания заявок переживают перезапуск бота.
+Чтение идет из локального кэша, запись - отложенная (write-behind): измененные
+ключи сбрасываются в таблицу fsm_states одной транзакцией раз в
+FSM_FLUSH_INTERVAL секунд и при остановке. Для нескольких реплик бота
+FSM_FLUSH_INTERVAL=0 включает немедленную запись, а локальный кэш
+используется только для ключей, записанных этой же репликой.
+Брошенные диалоги (без активности дольше FSM_STATE_TTL) периодически удаляются.
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+import config
+from models.database import SessionLocal, FSMState
+from utils import json_codec
+
+logger = logging.getLogger(__name__)
+
+
+class _CachedRecord:
+    """Запись локального кэша"""
+
+    __slots__ = ("state", "data", "touched")
+
+    def __init__(self, state: Optional[str] = None, data: Optional[Dict[str, Any]] = None):
+        self.state = state
+        self.data = data or {}
+        self.touched = time.monotonic()
+
+
+class DatabaseFSMStorage(BaseStorage):
+    """FSM storage с локальным кэшем и отложенной записью в БД"""
+
+    def __init__(self, key_builder: KeyBuilder = None, flush_interval: float = None,
+                 state_ttl: int = None, cleanup_interval: int = None):
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.flush_interval = config.FSM_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.state_ttl = state_ttl or config.FSM_STATE_TTL
+        self.cleanup_interval = cleanup_interval or config.FSM_CLEANUP_INTERVAL
+
+        self._cache: Dict[str, _CachedRecord] = {}
+        self._dirty: Dict[str, _CachedRecord] = {}
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    # --- Чтение/запись (интерфейс BaseStorage) ---
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._get_record(key)
+        record.state = state.state if isinstance(state, State) else state
+        await self._mark_dirty(self.key_builder.build(key), record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._get_record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = await self._get_record(key)
+        record.data = data.copy()
+        await self._mark_dirty(self.key_builder.build(key), record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._get_record(key)).data.copy()
+
+    async def close(self) -> None:
+        """Сбросить несохраненные изменения и остановить фоновую задачу"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        await self.flush()
+
+    def pending_count(self) -> int:
+        """Количество ключей, ожидающих записи в БД"""
+        return len(self._dirty)
+
+    # --- Кэш ---
+
+    async def _get_record(self, key: StorageKey) -> _CachedRecord:
+        storage_key = self.key_builder.build(key)
+        record = self._cache.get(storage_key)
+        if record is None or self._is_expired(record):
+            record = await asyncio.to_thread(self._load_sync, storage_key)
+            self._cache[storage_key] = record
+        record.touched = time.monotonic()
+        return record
+
+    def _is_expired(self, record: _CachedRecord) -> bool:
+        # При немедленной записи (несколько реплик) кэш не считаем источником истины:
+        # чужие изменения подхватываются при следующем чтении
+        if self.flush_interval <= 0:
+            return True
+        return time.monotonic() - record.touched > self.state_ttl
+
+    async def _mark_dirty(self, storage_key: str, record: _CachedRecord):
+        self._dirty[storage_key] = record
+        if self.flush_interval <= 0:
+            await self.flush()
+        else:
+            self._ensure_background_task()
+
+    def _ensure_background_task(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="fsm-storage-flush")
+
+    # --- Фоновая запись и очистка ---
+
+    async def _run(self):
+        last_cleanup = 0.0
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() - last_cleanup >= self.cleanup_interval:
+                    await self.cleanup()
+                    last_cleanup = time.monotonic()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("❌ Ошибка записи FSM состояний: %s", e)
+
+    async def flush(self) -> int:
+        """Записать измененные ключи в БД одной транзакцией"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return 0
+            batch = {key: (record.state, dict(record.data)) for key, record in self._dirty.items()}
+            self._dirty.clear()
+            try:
+                await asyncio.to_thread(self._flush_sync, batch)
+            except Exception:
+                # Возвращаем в очередь то, что не перезаписано более новыми изменениями
+                for key in batch:
+                    self._dirty.setdefault(key, self._cache.get(key) or _CachedRecord(*batch[key]))
+                raise
+            logger.debug("💾 FSM: записано %s состояний", len(batch))
+            return len(batch)
+
+    async def cleanup(self) -> int:
+        """Удалить брошенные состояния из БД и локального кэша"""
+        now = time.monotonic()
+        for storage_key in [k for k, r in self._cache.items()
+                            if now - r.touched > self.state_ttl and k not in self._dirty]:
+            del self._cache[storage_key]
+        removed = await asyncio.to_thread(self._cleanup_sync)
+        if removed:
+            logger.info("🧹 FSM: удалено %s брошенных состояний", removed)
+        return removed
+
+    # --- Синхронная работа с БД (выполняется в отдельном потоке) ---
+
+    @staticmethod
+    def _load_sync(storage_key: str) -> _CachedRecord:
+        db = SessionLocal()
+        try:
+            row = db.query(FSMState.state, FSMState.data).filter(FSMState.key == storage_key).first()
+            if not row:
+                return _CachedRecord()
+            return _CachedRecord(row.state, json_codec.loads(row.data) if row.data else {})
+        finally:
+            db.close()
+
+    @staticmethod
+    def _flush_sync(batch: Dict[str, tuple]):
+        db = SessionLocal()
+        try:
+            existing = {
+                row.key: row
+                for row in db.query(FSMState).filter(FSMState.key.in_(list(batch))).all()
+            }
+            for storage_key, (state, data) in batch.items():
+                row = existing.get(storage_key)
+                if state is None and not data:
+                    # Пустое состояние не храним
+                    if row:
+                        db.delete(row)
+                    continue
+                payload = json_codec.dumps(data) if data else None
+                if row:
+                    row.state = state
+                    row.data = payload
+                    row.updated_at = datetime.utcnow()
+                else:
+                    db.add(FSMState(key=storage_key, state=state, data=payload))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _cleanup_sync(self) -> int:
+        db = SessionLocal()
+        try:
+            threshold = datetime.utcnow() - timedelta(seconds=self.state_ttl)
+            removed = db.query(FSMState).filter(FSMState.updated_at < threshold).delete(synchronize_session=False)
+            db.commit()
+            return removed
+        finally:
+            db.close()
+
+
+def create_fsm_storage() -> BaseStorage:
+    """Создать FSM storage согласно FSM_STORAGE (database или memory)"""
+    if config.FSM_STORAGE == "memory":
+        return MemoryStorage()
+    if config.FSM_STORAGE != "database":
+        logger.warning("⚠️ Неизвестное FSM_STORAGE=%r, используем database", config.FSM_STORAGE)
+    return DatabaseFSMStorage()
@@ -0,0 +1,175 @@
+"""
+Фоновая сверка статусов заявок с Okdesk.
+
+Если webhook потерялся, статус заявки в нашей БД перестает обновляться.
+Сверщик периодически запрашивает issues/list с фильтром updated_since
+(курсор хранится в таблице sync_state), сравнивает статусы только для
+открытых у нас заявок и передает изменения в тот же обработчик, что и
+webhook'и. Интервал опроса адаптивный: после найденных изменений - минимальный,
+при отсутствии изменений или ошибках - удваивается до максимального.
+
+Сверка идет в одном процессе на все реплики: перед проходом процесс
+захватывает или продлевает аренду в sync_state (RECONCILE_LEASE_KEY).
+Остальные ждут и подхватывают аренду, если владелец не продлил ее за
+RECONCILE_MAX_INTERVAL + RECONCILE_LEASE_GRACE_SECONDS. Иначе каждая реплика
+находила бы одно и то же расхождение и отправляла повторное уведомление.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from contextlib import aclosing
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import config
+from database.crud import IssueService, SyncStateService
+from services.okdesk_api import OkdeskAPI
+from utils.status_classifier import status_classifier
+
+logger = logging.getLogger(__name__)
+
+CURSOR_KEY = "issues_updated_since"
+RECONCILE_LEASE_KEY = "issue_reconciler_lease"
+
+
+class IssueReconciler:
+    """Периодическая сверка статусов открытых заявок с Okdesk"""
+
+    def __init__(self, on_status_change: Callable[[Dict[str, Any]], Awaitable[None]],
+                 okdesk_api: OkdeskAPI = None,
+                 min_interval: int = None, max_interval: int = None, batch_size: int = None):
+        """
+        Args:
+            on_status_change: Обработчик изменения статуса (формат данных как у webhook)
+            okdesk_api: Клиент API (по умолчанию создается новый)
+            min_interval: Минимальный интервал опроса, секунды
+            max_interval: Максимальный интервал опроса, секунды
+            batch_size: Размер страницы issues/list
+        """
+        self.on_status_change = on_status_change
+        self.okdesk_api = okdesk_api or OkdeskAPI()
+        self.min_interval = min_interval or config.RECONCILE_MIN_INTERVAL
+        self.max_interval = max(max_interval or config.RECONCILE_MAX_INTERVAL, self.min_interval)
+        self.batch_size = min(batch_size or config.RECONCILE_BATCH_SIZE, 100)
+        self.interval = self.min_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_ttl = self.max_interval + config.RECONCILE_LEASE_GRACE_SECONDS
+        self._has_lease = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> asyncio.Task:
+        """Запустить фоновый цикл сверки в текущем event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="issue-reconciler")
+            logger.info("🔁 Сверка статусов заявок запущена (интервал %s-%s с)", self.min_interval, self.max_interval)
+        return self._task
+
+    async def stop(self):
+        """Остановить фоновый цикл"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        if self._has_lease:
+            # Отдаем аренду сразу, не дожидаясь ее истечения
+            self._has_lease = False
+            await asyncio.to_thread(SyncStateService.release_lease, RECONCILE_LEASE_KEY, self.owner)
+
+    async def _acquire_lease(self) -> bool:
+        has_lease = await asyncio.to_thread(SyncStateService.try_acquire_lease, RECONCILE_LEASE_KEY,
+                                            self.owner, self.lease_ttl)
+        if has_lease != self._has_lease:
+            if has_lease:
+                logger.info("🔁 Сверка статусов выполняется этим процессом (%s)", self.owner)
+            else:
+                logger.info("🔁 Сверку статусов выполняет другой процесс")
+        self._has_lease = has_lease
+        return has_lease
+
+    async def _run(self):
+        while True:
+            try:
+                if not await self._acquire_lease():
+                    # Резерв: проверяем аренду с тем же адаптивным интервалом
+                    self._adapt_interval(0)
+                    await asyncio.sleep(self.interval)
+                    continue
+                changes = await self.reconcile_once()
+                self._adapt_interval(changes)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("❌ Ошибка сверки статусов заявок: %s", e)
+                self._adapt_interval(0)
+            await asyncio.sleep(self.interval)
+
+    def _adapt_interval(self, changes: int):
+        """После изменений опрашиваем чаще, в тишине - реже"""
+        if changes:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * 2, self.max_interval)
+
+    def _load_cursor(self) -> datetime:
+        value = SyncStateService.get_value(CURSOR_KEY)
+        if value:
+            try:
+                return datetime.fromisoformat(value)
+            except ValueError:
+                logger.warning("⚠️ Некорректный курсор сверки %r, начинаем заново", value)
+        return datetime.now() - timedelta(hours=config.RECONCILE_INITIAL_LOOKBACK_HOURS)
+
+    async def reconcile_once(self) -> int:
+        """
+        Один проход сверки.
+
+        Returns:
+            int: Количество заявок, у которых обнаружено изменение статуса
+        """
+        cycle_started = datetime.now()
+        cursor = await asyncio.to_thread(self._load_cursor)
+
+        open_issues = await asyncio.to_thread(IssueService.get_open_issue_statuses,
+                                             status_classifier.known_statuses(completion=True))
+        changes = 0
+
+        if open_issues:
+            # Окно с перекрытием: повторно увиденные заявки просто совпадут по статусу
+            since = cursor - timedelta(seconds=config.RECONCILE_OVERLAP_SECONDS)
+            checked = 0
+
+            async with aclosing(self.okdesk_api.iter_issues(updated_since=since, page_size=self.batch_size,
+                                                            raise_on_error=True)) as remote_issues:
+                async for remote_issue in remote_issues:
+                    issue_id = remote_issue.get("id")
+                    if issue_id not in open_issues:
+                        continue
+                    checked += 1
+
+                    remote_status = remote_issue.get("status")
+                    if not remote_status:
+                        continue
+                    local_status = open_issues[issue_id]
+                    remote_canonical = status_classifier.normalize(remote_status)
+                    if remote_canonical == status_classifier.normalize(local_status):
+                        continue
+
+                    logger.info("🔁 Сверка: статус заявки %s расходится (%s -> %s)", issue_id, local_status, remote_canonical)
+                    changes += 1
+                    await self.on_status_change({
+                        "id": issue_id,
+                        "status": remote_issue.get("status"),
+                        "old_status": local_status,
+                    })
+
+            logger.debug("🔁 Сверка: проверено %s открытых заявок, изменений %s", checked, changes)
+
+        # Курсор сдвигаем только после успешного прохода
+        await asyncio.to_thread(SyncStateService.set_value, CURSOR_KEY, cycle_started.isoformat(timespec="seconds"))
+        return changes
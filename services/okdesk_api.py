@@ -2,17 +2,69 @@
 # -*- coding: utf-8 -*-
 
 import os
-import json
+import asyncio
 import aiohttp
 import logging
 import base64
-from typing import Dict, List, Optional, Any
+import time
+from contextlib import aclosing, asynccontextmanager
+from typing import Dict, List, Optional, Any, AsyncIterator, Callable
 from urllib.parse import urljoin
+from utils import json_codec
+from utils.logging_setup import LazyPayload, log_payload, redact_url, truncate
+from database.user_cache import user_cache
+from utils.metrics import OKDESK_REQUEST_SECONDS, endpoint_label
+from utils.tracing import record_span, traced
 import config
 
-# Настраиваем логирование
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+# Отдельная категория для дампов тел запросов/ответов
+payload_logger = logging.getLogger(f"{__name__}.payload")
+
+# Общая HTTP-сессия для долгоживущих процессов (бот, webhook сервер).
+# Включается через enable_shared_session(); скрипты по-прежнему открывают
+# сессию на каждый запрос и ничего не должны закрывать.
+_shared_session: Optional[aiohttp.ClientSession] = None
+_shared_session_loop: Optional[asyncio.AbstractEventLoop] = None
+_shared_session_enabled = False
+
+
+def enable_shared_session():
+    """Использовать одну HTTP-сессию (пул соединений) для всех экземпляров OkdeskAPI"""
+    global _shared_session_enabled
+    _shared_session_enabled = True
+
+
+def _get_shared_session() -> aiohttp.ClientSession:
+    """Общая сессия текущего event loop (создается при первом обращении)"""
+    global _shared_session, _shared_session_loop
+    loop = asyncio.get_running_loop()
+    if _shared_session is None or _shared_session.closed or _shared_session_loop is not loop:
+        _shared_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=config.OKDESK_HTTP_POOL_SIZE, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=config.OKDESK_HTTP_TIMEOUT),
+        )
+        _shared_session_loop = loop
+    return _shared_session
+
+
+async def close_shared_session():
+    """Закрыть общую сессию (при остановке процесса)"""
+    global _shared_session, _shared_session_enabled
+    if _shared_session is not None and not _shared_session.closed:
+        await _shared_session.close()
+    _shared_session = None
+    _shared_session_enabled = False
+
+
+@asynccontextmanager
+async def _session_scope():
+    """Сессия для запроса: общая, если включена, иначе новая на время запроса"""
+    if _shared_session_enabled:
+        yield _get_shared_session()
+    else:
+        async with aiohttp.ClientSession() as session:
+            yield session
 
 
 class OkdeskAPI:
@@ -59,9 +111,10 @@ class OkdeskAPI:
             # Обрабатываем специальные параметры массивов (например, company_ids[])
             param_strings = []
             for key, value in query_params.items():
-                if key.endswith('[]'):
-                    # Для массивов используем специальное форматирование
-                    param_strings.append(f"{key}={value}")
+                if isinstance(value, (list, tuple, set)):
+                    # Массив раскрываем в повторяющиеся параметры: key[]=1&key[]=2
+                    array_key = key if key.endswith('[]') else f"{key}[]"
+                    param_strings.extend(f"{array_key}={item}" for item in value)
                 else:
                     param_strings.append(f"{key}={value}")
             
@@ -72,87 +125,253 @@ class OkdeskAPI:
         else:
             url = f"{self.api_url}{endpoint_clean}"
         
-        # Логируем запрос для отладки
-        logger.info(f"{method} {url}")
+        # Логируем запрос (токен скрыт, тело - только на DEBUG с сэмплированием)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s %s", method, redact_url(url))
         if data:
-            logger.info(f"Request data: {data}")
+            log_payload(payload_logger, "Request data", data)
         
+        started = time.perf_counter()
+        status = "error"
         try:
-            async with aiohttp.ClientSession() as session:
+            async with _session_scope() as session:
                 if method == 'GET':
                     async with session.get(url, headers=self.headers) as resp:
-                        response_text = await resp.text()
+                        status = resp.status
+                        response_body = await resp.read()
                         
-                        # Логируем ответ
-                        logger.info(f"Response status: {resp.status}")
-                        logger.info(f"Response: {response_text}")
+                        logger.debug("Response status: %s (%s байт)", resp.status, len(response_body))
+                        log_payload(payload_logger, "Response", response_body)
                         
                         if resp.status == 200:
                             try:
-                                parsed = json.loads(response_text)
-                                logger.info(f"Parsed response: {str(parsed)[:100]}...")
-                                return parsed
+                                return json_codec.loads(response_body)
                             except Exception as e:
-                                logger.error(f"Ошибка парсинга JSON: {e}")
+                                logger.error("Ошибка парсинга JSON: %s", e)
                                 return None
                         else:
-                            logger.error(f"API Error {resp.status}: {response_text}")
+                            logger.error("API Error %s: %s %s: %s", resp.status, method, redact_url(url),
+                                         LazyPayload(response_body))
                             return None
                 
                 elif method in ['POST', 'PUT']:
-                    json_data = json.dumps(data) if data else None
+                    json_data = json_codec.dumps_bytes(data) if data else None
                     
                     async with session.request(method, url, headers=self.headers, data=json_data) as resp:
-                        response_text = await resp.text()
+                        status = resp.status
+                        response_body = await resp.read()
                         
-                        # Логируем ответ
-                        logger.info(f"Response status: {resp.status}")
-                        logger.info(f"Response: {response_text}")
+                        logger.debug("Response status: %s (%s байт)", resp.status, len(response_body))
+                        log_payload(payload_logger, "Response", response_body)
                         
                         if resp.status in [200, 201]:
                             try:
-                                parsed = json.loads(response_text)
-                                logger.info(f"Parsed response: {str(parsed)[:100]}...")
-                                return parsed
+                                return json_codec.loads(response_body)
                             except Exception as e:
-                                logger.error(f"Ошибка парсинга JSON: {e}")
-                                if "success" in response_text.lower():
+                                logger.error("Ошибка парсинга JSON: %s", e)
+                                if b"success" in response_body.lower():
                                     return {"success": True}
                                 return None
                         else:
-                            logger.error(f"API Error {resp.status}: {response_text}")
+                            response_text = response_body.decode('utf-8', 'replace')
+                            logger.error("API Error %s: %s %s: %s", resp.status, method, redact_url(url),
+                                         truncate(response_text))
                             if resp.status == 422:
                                 # Для ошибки 422 возвращаем специальный словарь с информацией об ошибке
                                 try:
-                                    error_data = json.loads(response_text)
+                                    error_data = json_codec.loads(response_body)
                                     return {"error": 422, "details": error_data}
                                 except:
                                     return {"error": 422, "details": response_text}
                             return None
         
         except Exception as e:
-            logger.error(f"Ошибка запроса к API: {e}")
+            logger.error("Ошибка запроса к API %s %s: %s", method, endpoint_clean, e)
             return None
+        finally:
+            duration = time.perf_counter() - started
+            endpoint_name = endpoint_label(endpoint_clean)
+            OKDESK_REQUEST_SECONDS.observe(duration, method, endpoint_name, status)
+            record_span(f"okdesk {method} {endpoint_name}", duration, status=status)
     
-    async def get_issues(self, status_ids: List[int] = None, limit: int = 10) -> List[Dict]:
-        """Получить список заявок"""
+    @staticmethod
+    def _extract_page_items(response: Any, items_key: str = None) -> Optional[List[Dict]]:
+        """Достать список элементов из ответа list-endpoint'а (массив или обертка)"""
+        if isinstance(response, list):
+            return response
+        if isinstance(response, dict) and items_key and isinstance(response.get(items_key), list):
+            return response[items_key]
+        return None
+
+    async def paginate(self, endpoint: str, params: Dict = None, page_size: int = 100,
+                       items_key: str = None, prefetch: bool = False,
+                       stop_when: Callable[[Dict], bool] = None,
+                       max_items: int = None, max_pages: int = None,
+                       raise_on_error: bool = False) -> AsyncIterator[Dict]:
+        """
+        Постраничный обход list-endpoint'ов Okdesk (page[size] + page[from_id]).
+
+        Args:
+            endpoint: Endpoint списка, например 'issues/list' или 'contacts'
+            params: Фильтры запроса (значения-списки раскрываются в key[]=...)
+            page_size: Размер страницы (Okdesk допускает максимум 100)
+            items_key: Ключ со списком, если API возвращает объект-обертку
+            prefetch: Запрашивать следующую страницу, пока обрабатывается текущая
+            stop_when: Предикат раннего выхода - обход прекращается на первом
+                элементе, для которого он вернул True (сам элемент не отдается)
+            max_items: Ограничение на общее количество элементов
+            max_pages: Ограничение на количество страниц
+            raise_on_error: Бросать RuntimeError, если страница не получена
+                (по умолчанию обход просто завершается)
+
+        Yields:
+            Dict: Элементы списка по одному
+
+        Вызывающий код, который может выйти из цикла досрочно, оборачивает
+        обход в contextlib.aclosing(): тогда запрос следующей страницы
+        (prefetch) отменяется сразу, а не при сборке мусора.
+        """
+        base_params = dict(params or {})
+        base_params['page[size]'] = page_size
+        base_params.setdefault('page[direction]', 'forward')
+
+        def fetch_page(from_id):
+            page_params = dict(base_params)
+            if from_id is not None:
+                page_params['page[from_id]'] = from_id
+            return asyncio.ensure_future(self._make_request('GET', endpoint, params=page_params))
+
+        pending = fetch_page(None)
+        seen_ids = set()
+        pages = 0
+        yielded = 0
+
         try:
-            # Судя по результатам тестирования, endpoint /issues возвращает 404,
-            # поэтому попробуем использовать последовательные запросы к конкретным заявкам
-            # Начнем с запроса последних заявок по порядку
-            issues = []
-            # Пробуем запросить несколько последних заявок
-            for issue_id in range(limit, 0, -1):
-                try:
-                    issue = await self.get_issue(issue_id)
-                    if issue and 'errors' not in issue:
-                        issues.append(issue)
-                        if len(issues) >= limit:
-                            break
-                except Exception:
-                    continue
-                    
-            return issues
+            while pending is not None:
+                response = await pending
+                pending = None
+                pages += 1
+
+                items = self._extract_page_items(response, items_key)
+                if items is None and raise_on_error:
+                    raise RuntimeError(f"Не удалось получить страницу {pages} из {endpoint}")
+                if not items:
+                    return
+
+                # Endpoint без поддержки пагинации отдает ту же страницу повторно
+                page_ids = [item.get('id') for item in items if isinstance(item, dict)]
+                if page_ids and all(item_id in seen_ids for item_id in page_ids):
+                    logger.debug("📄 %s: страница повторилась, пагинация не поддерживается", endpoint)
+                    return
+                seen_ids.update(page_ids)
+
+                last_id = page_ids[-1] if page_ids else None
+                has_more = (len(items) >= page_size and last_id is not None
+                            and (max_pages is None or pages < max_pages))
+                if has_more and prefetch:
+                    pending = fetch_page(last_id)
+
+                for item in items:
+                    if stop_when is not None and stop_when(item):
+                        return
+                    yield item
+                    yielded += 1
+                    if max_items is not None and yielded >= max_items:
+                        return
+
+                if has_more and pending is None:
+                    pending = fetch_page(last_id)
+
+            logger.debug("📄 %s: получено %s элементов за %s страниц", endpoint, yielded, pages)
+        finally:
+            if pending is not None and not pending.done():
+                pending.cancel()
+                # Дожидаемся отмены, чтобы задача не осталась без владельца
+                await asyncio.gather(pending, return_exceptions=True)
+
+    async def fetch_all(self, endpoint: str, params: Dict = None, **kwargs) -> List[Dict]:
+        """Собрать все элементы list-endpoint'а в список (см. paginate)"""
+        async with aclosing(self.paginate(endpoint, params, **kwargs)) as items:
+            return [item async for item in items]
+
+    @staticmethod
+    def _build_issue_filters(status_ids: List[int] = None, status_codes: List[str] = None,
+                             contact_ids: List[int] = None, company_ids: List[int] = None,
+                             updated_since: Any = None) -> Dict:
+        """Параметры серверной фильтрации для issues/list"""
+        params = {}
+        if status_ids:
+            params['status_ids[]'] = list(status_ids)
+        if status_codes:
+            params['status[]'] = list(status_codes)
+        if contact_ids:
+            params['contact_ids[]'] = list(contact_ids)
+        if company_ids:
+            params['company_ids[]'] = list(company_ids)
+        if updated_since:
+            # Формат даты в API Okdesk: dd-mm-yyyy hh:mm
+            if hasattr(updated_since, 'strftime'):
+                updated_since = updated_since.strftime('%d-%m-%Y %H:%M')
+            params['updated_since'] = updated_since
+        return params
+
+    async def iter_issues(self, status_ids: List[int] = None, status_codes: List[str] = None,
+                          contact_ids: List[int] = None, company_ids: List[int] = None,
+                          updated_since: Any = None, limit: int = None, page_size: int = 100,
+                          hydrate: bool = False, concurrency: int = 5,
+                          raise_on_error: bool = False) -> AsyncIterator[Dict]:
+        """
+        Потоковый обход заявок через issues/list с серверной фильтрацией.
+
+        Args:
+            status_ids: ID статусов
+            status_codes: Коды статусов (opened, in_work, ...)
+            contact_ids: ID контактов
+            company_ids: ID компаний
+            updated_since: Только заявки, обновленные после даты (datetime или "dd-mm-yyyy hh:mm")
+            limit: Максимальное количество заявок
+            page_size: Размер страницы (не более 100)
+            hydrate: Догружать полную карточку заявки через issues/{id}
+            concurrency: Максимум одновременных запросов при догрузке
+            raise_on_error: Бросать RuntimeError, если страница не получена
+
+        Yields:
+            Dict: Заявки в порядке возрастания ID
+        """
+        params = self._build_issue_filters(status_ids, status_codes, contact_ids, company_ids, updated_since)
+        async with aclosing(self.paginate('issues/list', params, page_size=min(page_size, 100), items_key='issues',
+                                          prefetch=True, max_items=limit, raise_on_error=raise_on_error)) as pages:
+            if not hydrate:
+                async for issue in pages:
+                    yield issue
+                return
+
+            # Догрузка карточек пачками размером со страницу, не более concurrency запросов одновременно
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def hydrate_issue(brief: Dict) -> Dict:
+                async with semaphore:
+                    full = await self.get_issue(brief['id']) if brief.get('id') else None
+                return full or brief
+
+            batch = []
+            async for issue in pages:
+                batch.append(issue)
+                if len(batch) >= page_size:
+                    for full_issue in await asyncio.gather(*(hydrate_issue(i) for i in batch)):
+                        yield full_issue
+                    batch = []
+            if batch:
+                for full_issue in await asyncio.gather(*(hydrate_issue(i) for i in batch)):
+                    yield full_issue
+
+    async def get_issues(self, status_ids: List[int] = None, limit: int = 10, **filters) -> List[Dict]:
+        """
+        Получить список заявок (см. iter_issues - фильтры и догрузка карточек).
+        """
+        try:
+            async with aclosing(self.iter_issues(status_ids=status_ids, limit=limit, **filters)) as issues:
+                return [issue async for issue in issues]
         except Exception as e:
             logger.error(f"Ошибка получения заявок: {e}")
             return []
@@ -185,7 +404,7 @@ class OkdeskAPI:
             Dict: Результат обновления или пустой словарь в случае ошибки
         """
         try:
-            logger.info(f"Обновление заявки {issue_id} с данными: {data}")
+            log_payload(payload_logger, f"Обновление заявки {issue_id}", data)
             
             # Отправляем запрос на обновление
             response = await self._make_request('PUT', f'issues/{issue_id}', data)
@@ -293,6 +512,7 @@ class OkdeskAPI:
                             db_session = SessionLocal()
                             db_session.merge(user)
                             db_session.commit()
+                            user_cache.invalidate(user.telegram_id)
                             db_session.close()
                             logger.info(f"✅ Обновлен okdesk_contact_id={contact['id']} для пользователя {user_telegram_id} в базе данных")
                     except Exception as e:
@@ -353,6 +573,7 @@ class OkdeskAPI:
                                 db_session = SessionLocal()
                                 db_session.merge(user)
                                 db_session.commit()
+                                user_cache.invalidate(user.telegram_id)
                                 db_session.close()
                                 logger.info(f"✅ Обновлен okdesk_contact_id={new_contact['id']} для пользователя {user_telegram_id} в базе данных")
                         except Exception as e:
@@ -387,6 +608,7 @@ class OkdeskAPI:
                             db_session = SessionLocal()
                             db_session.merge(user)
                             db_session.commit()
+                            user_cache.invalidate(user.telegram_id)
                             db_session.close()
                             logger.info(f"✅ Обновлен okdesk_company_id={company['id']} для пользователя {user_telegram_id} в базе данных")
                     except Exception as e:
@@ -406,7 +628,7 @@ class OkdeskAPI:
             data['assignee_id'] = kwargs['assignee_id']
         
         # Добавляем явную привязку к пользователю, если у нас есть информация о нем
-        logger.info(f"Создаем заявку с данными: {data}")
+        log_payload(payload_logger, "Создаем заявку с данными", data)
         response = await self._make_request('POST', 'issues', data)
         
         # Проверяем успешность создания заявки
@@ -483,21 +705,21 @@ class OkdeskAPI:
                         form_data.add_field(desc_field, description)
                         logger.info(f"� Добавлено описание: {desc_field} = {description}")
 
-            logger.info(f"📤 Отправка комментария с {len(files) if files else 0} файлами на {url}")
+            logger.info("📤 Отправка комментария с %s файлами на %s", len(files) if files else 0, redact_url(url))
 
             # Отправляем запрос с правильными заголовками
-            async with aiohttp.ClientSession() as session:
+            async with _session_scope() as session:
                 # НЕ устанавливаем Content-Type вручную - aiohttp сделает это автоматически с boundary
                 async with session.post(url, data=form_data) as resp:
                     response_text = await resp.text()
 
                     logger.info(f"📥 Response status: {resp.status}")
-                    logger.info(f"📄 Response headers: {dict(resp.headers)}")
-                    logger.info(f"📄 Response: {response_text[:1000]}{'...' if len(response_text) > 1000 else ''}")
+                    logger.debug("📄 Response headers: %s", dict(resp.headers))
+                    log_payload(payload_logger, "📄 Response", response_text)
 
                     if resp.status in [200, 201]:
                         try:
-                            response_data = json.loads(response_text)
+                            response_data = json_codec.loads(response_text)
 
                             # Проверяем, были ли прикреплены файлы (согласно документации, должны быть в attachments)
                             if files and response_data.get('attachments'):
@@ -524,9 +746,7 @@ class OkdeskAPI:
                         return {"error": resp.status, "message": response_text}
 
         except Exception as e:
-            logger.error(f"❌ Ошибка при отправке комментария с файлами: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("❌ Ошибка при отправке комментария с файлами: %s", e)
             # Fallback: создаем комментарий без файлов
             if files:
                 logger.warning(f"⚠️ Fallback: создаем комментарий без файлов из-за исключения")
@@ -596,18 +816,18 @@ class OkdeskAPI:
 
             for url in endpoints:
                 try:
-                    logger.info(f"📤 Попытка загрузки на {url}")
+                    logger.info("📤 Попытка загрузки на %s", redact_url(url))
 
-                    async with aiohttp.ClientSession() as session:
+                    async with _session_scope() as session:
                         async with session.post(url, data=form_data) as resp:
                             response_text = await resp.text()
 
                             logger.info(f"📥 Upload response status: {resp.status}")
-                            logger.info(f"📄 Response: {response_text[:300]}{'...' if len(response_text) > 300 else ''}")
+                            log_payload(payload_logger, "📄 Response", response_text)
 
                             if resp.status in [200, 201]:
                                 try:
-                                    response_data = json.loads(response_text)
+                                    response_data = json_codec.loads(response_text)
                                     if 'id' in response_data:
                                         logger.info(f"✅ Файл успешно загружен: ID={response_data['id']}")
                                         return response_data
@@ -615,7 +835,7 @@ class OkdeskAPI:
                                     pass
 
                 except Exception as e:
-                    logger.error(f"❌ Исключение при загрузке на {url}: {e}")
+                    logger.error("❌ Исключение при загрузке на %s: %s", redact_url(url), e)
                     continue
 
             logger.error(f"❌ Все endpoints вернули ошибку при загрузке файла {filename}")
@@ -679,16 +899,16 @@ class OkdeskAPI:
             logger.info(f"� Создание заявки с {len(files) if files else 0} файлами")
             
             # Отправляем запрос
-            async with aiohttp.ClientSession() as session:
+            async with _session_scope() as session:
                 async with session.post(url, data=form_data) as resp:
                     response_text = await resp.text()
                     
                     logger.info(f"📥 Response status: {resp.status}")
-                    logger.info(f"📄 Response: {response_text[:500]}{'...' if len(response_text) > 500 else ''}")
+                    log_payload(payload_logger, "📄 Response", response_text)
                     
                     if resp.status in [200, 201]:
                         try:
-                            response_data = json.loads(response_text)
+                            response_data = json_codec.loads(response_text)
                             logger.info(f"✅ Заявка с файлами создана: ID={response_data.get('id')}")
                             return response_data
                         except:
@@ -774,20 +994,20 @@ class OkdeskAPI:
                 form_data.add_field(file_field_names[0], file_data, filename=filename)
                 logger.info(f"📎 Добавлен файл: {filename} ({len(file_data)} байт) как {file_field_names[0]}")
             
-            logger.info(f"📤 Отправляем multipart/form-data на {url}")
+            logger.info("📤 Отправляем multipart/form-data на %s", redact_url(url))
             # logger.info(f"📋 Поля формы: {[field.name for field in form_data._fields]}")  # Убрано - вызывает ошибку
             
-            async with aiohttp.ClientSession() as session:
+            async with _session_scope() as session:
                 async with session.post(url, data=form_data) as resp:
                     response_text = await resp.text()
                     
                     logger.info(f"📥 Response status: {resp.status}")
-                    logger.info(f"📄 Response: {response_text[:500]}{'...' if len(response_text) > 500 else ''}")
+                    log_payload(payload_logger, "📄 Response", response_text)
                     
                     if resp.status in [200, 201]:
                         try:
-                            response_data = json.loads(response_text)
-                            logger.info(f"✅ Комментарий с файлами создан: {response_data}")
+                            response_data = json_codec.loads(response_text)
+                            logger.info("✅ Комментарий с файлами создан: ID=%s", response_data.get("id") if isinstance(response_data, dict) else None)
                             return response_data
                         except Exception as e:
                             logger.error(f"❌ Ошибка парсинга ответа: {e}")
@@ -856,23 +1076,23 @@ class OkdeskAPI:
     async def _contact_comment(self, endpoint: str, data: Dict) -> Dict:
         """Отправить комментарий от имени контакта (требуется auth_code)"""
         try:
-            async with aiohttp.ClientSession() as session:
+            async with _session_scope() as session:
                 headers = {'Content-Type': 'application/json'}
                 
                 # Логируем данные запроса
                 logger.info(f"Endpoint: {endpoint}")
-                logger.info(f"Data: {data}")
+                log_payload(payload_logger, "Data", data)
                 
                 async with session.post(
                     urljoin(self.api_url, endpoint),
                     headers=headers,
-                    data=json.dumps(data)
+                    data=json_codec.dumps_bytes(data)
                 ) as resp:
                     response_text = await resp.text()
                     
                     if resp.status in [200, 201]:
                         try:
-                            response = json.loads(response_text)
+                            response = json_codec.loads(response_text)
                             logger.info(f"✅ Комментарий от контакта создан: {response}")
                             return response
                         except:
@@ -885,19 +1105,11 @@ class OkdeskAPI:
             logger.error(f"Ошибка при отправке комментария от контакта: {e}")
             return {}
     
-    async def get_contacts(self, limit: int = 50) -> List[Dict]:
-        """Получить список контактов"""
+    async def get_contacts(self, limit: Optional[int] = 50) -> List[Dict]:
+        """Получить список контактов (limit=None - все контакты постранично)"""
         try:
-            endpoint = f"/contacts?limit={limit}"
-            response = await self._make_request('GET', endpoint)
-            
-            if not response:
-                return []
-            
-            if isinstance(response, list):
-                return response
-            
-            return []
+            page_size = min(limit, 100) if limit else 100
+            return await self.fetch_all('contacts', page_size=page_size, max_items=limit, prefetch=True)
         except Exception as e:
             logger.error(f"Ошибка получения контактов: {e}")
             return []
@@ -968,6 +1180,7 @@ class OkdeskAPI:
                                 user.okdesk_contact_id = response['id']
                                 db_session.merge(user)
                                 db_session.commit()
+                                user_cache.invalidate(user.telegram_id)
                                 logger.info(f"✅ Обновлен okdesk_contact_id={response['id']} для пользователя {user.telegram_id} в базе данных")
 
                     db_session.close()
@@ -1097,7 +1310,7 @@ class OkdeskAPI:
             logger.info(f"ИНН {inn} будет указан в комментарии, а не как отдельный параметр контакта")
             # ИНН уже должен быть указан в comment при вызове этого метода
         
-        logger.info(f"Создаем контакт с данными: {data}")
+        log_payload(payload_logger, "Создаем контакт с данными", data)
         response = await self._make_request('POST', 'contacts', data)
         
         # Если получили ошибку 422, возвращаем её для обработки выше
@@ -1183,7 +1396,7 @@ class OkdeskAPI:
             if field in kwargs and kwargs[field]:
                 data[field] = kwargs[field]
         
-        logger.info(f"Создаем компанию с данными: {data}")
+        log_payload(payload_logger, "Создаем компанию с данными", data)
         response = await self._make_request('POST', 'companies', data)
         
         if response and 'id' in response:
@@ -1204,6 +1417,7 @@ class OkdeskAPI:
                         user.company_id = response['id']
                         db_session.merge(user)
                         db_session.commit()
+                        user_cache.invalidate(user.telegram_id)
                         logger.info(f"✅ Обновлен company_id={response['id']} для пользователя {user.telegram_id} в базе данных")
 
                     db_session.close()
@@ -1352,6 +1566,7 @@ class OkdeskAPI:
                         user.company_id = company['id']
                         db_session.merge(user)
                         db_session.commit()
+                        user_cache.invalidate(user.telegram_id)
                         logger.info(f"✅ Обновлен company_id={company['id']} для пользователя {user.telegram_id} в базе данных")
 
                     db_session.close()
@@ -1492,7 +1707,7 @@ class OkdeskAPI:
                 if company_id:
                     contact_data['company_id'] = company_id
                 
-                logger.info(f"🔧 Создаем новый контакт с данными: {contact_data}")
+                log_payload(payload_logger, "🔧 Создаем новый контакт с данными", contact_data)
                 new_contact = await self.create_contact(**contact_data)
                 
                 if new_contact and 'id' in new_contact:
@@ -1513,6 +1728,7 @@ class OkdeskAPI:
             client_phone=phone if not contact_id else None
         )
     
+    @traced("okdesk.download_attachment")
     async def download_attachment(self, attachment_id: int, issue_id: int = None) -> Optional[bytes]:
         """
         Скачать вложение по ID
@@ -1529,7 +1745,7 @@ class OkdeskAPI:
             if issue_id:
                 try:
                     attachment_info = await self._make_request('GET', f'issues/{issue_id}/attachments/{attachment_id}')
-                    logger.info(f"📋 Информация о вложении: {attachment_info}")
+                    logger.debug("📋 Информация о вложении: %s", LazyPayload(attachment_info))
                     
                     if attachment_info and isinstance(attachment_info, dict):
                         # Если есть attachment_url, попробуем скачать оттуда
@@ -1537,7 +1753,7 @@ class OkdeskAPI:
                             url = attachment_info['attachment_url']
                             logger.info(f"📥 Попытка скачивания с attachment_url: {url}")
                             
-                            async with aiohttp.ClientSession() as session:
+                            async with _session_scope() as session:
                                 async with session.get(url) as resp:
                                     if resp.status == 200:
                                         file_data = await resp.read()
@@ -1570,7 +1786,7 @@ class OkdeskAPI:
 
             params = {'api_token': self.api_token}
 
-            async with aiohttp.ClientSession() as session:
+            async with _session_scope() as session:
                 for url in download_urls:
                     try:
                         logger.info(f"📥 Попытка скачивания файла с URL: {url}")
@@ -1630,7 +1846,8 @@ class OkdeskAPI:
 
     async def close(self):
         """Метод для закрытия ресурсов (для совместимости)"""
-        # В данной реализации нет долгоживущих ресурсов, которые требуется закрывать
+        # Общая сессия живет до остановки процесса (close_shared_session),
+        # сессии на один запрос закрываются сразу - закрывать здесь нечего
         pass
     
     async def rate_issue(self, issue_id: int, rating: int, comment: str = None) -> Dict:
@@ -1848,12 +2065,12 @@ class OkdeskAPI:
         Получить список объектов обслуживания через альтернативный endpoint
         """
         try:
-            endpoint = f"maintenance_entities/list?limit={limit}"
-            logger.info(f"🔍 Альтернативный запрос объектов обслуживания: {endpoint}")
+            logger.info(f"🔍 Альтернативный запрос объектов обслуживания: maintenance_entities/list (лимит {limit})")
             
-            response = await self._make_request('GET', endpoint)
+            response = await self.fetch_all('maintenance_entities/list', items_key='maintenance_entities',
+                                            max_items=limit, prefetch=True)
             
-            if response and isinstance(response, list):
+            if response:
                 logger.info(f"✅ Получено {len(response)} объектов через maintenance_entities/list")
                 return response
             else:
@@ -1918,28 +2135,22 @@ class OkdeskAPI:
             # Метод 1: Официальный способ с параметром company_ids[]
             try:
                 params = {
-                    'api_token': self.api_token,
-                    f'company_ids[]': company_id,  # Официальный параметр из документации
-                    'page[size]': 100  # Максимальный размер страницы
+                    'company_ids[]': company_id,  # Официальный параметр из документации
                 }
                 
                 logger.info(f"📡 Запрос maintenance_entities/list с company_ids[]={company_id}")
                 
-                response_data = await self._make_request('GET', 'maintenance_entities/list', params=params)
+                # Все страницы, а не только первые 100 объектов
+                entities = await self.fetch_all('maintenance_entities/list', params,
+                                                items_key='maintenance_entities', prefetch=True)
                 
-                if response_data:
-                    # API возвращает прямой массив объектов, не в wrapper'е
-                    entities = response_data if isinstance(response_data, list) else response_data.get('maintenance_entities', [])
-                    
-                    if entities:
-                        logger.info(f"✅ Официальный метод: найдено {len(entities)} объектов")
-                        for entity in entities:
-                            logger.info(f"  - {entity.get('name', 'Без названия')} (ID: {entity.get('id')})")
-                        return entities
-                    else:
-                        logger.info(f"❌ Официальный метод: нет объектов для компании {company_id}")
+                if entities:
+                    logger.info(f"✅ Официальный метод: найдено {len(entities)} объектов")
+                    for entity in entities:
+                        logger.debug("  - %s (ID: %s)", entity.get('name', 'Без названия'), entity.get('id'))
+                    return entities
                 else:
-                    logger.warning(f"⚠️ Официальный метод: пустой ответ")
+                    logger.info(f"❌ Официальный метод: нет объектов для компании {company_id}")
                     
             except Exception as e:
                 logger.error(f"❌ Ошибка в официальном методе: {e}")
@@ -1948,59 +2159,44 @@ class OkdeskAPI:
             try:
                 logger.info(f"🔄 Fallback: получение всех объектов с клиентской фильтрацией")
                 
-                params = {
-                    'api_token': self.api_token,
-                    'page[size]': 100
-                }
+                # Фильтруем по company_id на стороне клиента по мере получения страниц,
+                # в памяти держим только объекты нужной компании
+                total = 0
+                company_entities = []
+                async with aclosing(self.paginate('maintenance_entities/list',
+                                                  items_key='maintenance_entities', prefetch=True)) as entities:
+                    async for entity in entities:
+                        total += 1
+                        if entity.get('company_id') == company_id:
+                            company_entities.append(entity)
+                            logger.debug("  ✓ Найден: %s (ID: %s)", entity.get('name', 'Без названия'), entity.get('id'))
                 
-                response_data = await self._make_request('GET', 'maintenance_entities/list', params=params)
+                logger.info(f"📋 Fallback: просмотрено {total} объектов")
                 
-                if response_data:
-                    # API возвращает прямой массив объектов, не в wrapper'е
-                    all_entities = response_data if isinstance(response_data, list) else response_data.get('maintenance_entities', [])
-                    
-                    logger.info(f"📋 Fallback: получено {len(all_entities)} всего объектов")
-                    
-                    # Фильтруем по company_id на стороне клиента
-                    company_entities = []
-                    for entity in all_entities:
-                        entity_company_id = entity.get('company_id')
-                        if entity_company_id == company_id:
-                            company_entities.append(entity)
-                            logger.info(f"  ✓ Найден: {entity.get('name', 'Без названия')} (ID: {entity.get('id')})")
-                    
-                    if company_entities:
-                        logger.info(f"✅ Fallback: найдено {len(company_entities)} объектов")
-                        return company_entities
-                    else:
-                        logger.info(f"❌ Fallback: нет объектов для компании {company_id}")
+                if company_entities:
+                    logger.info(f"✅ Fallback: найдено {len(company_entities)} объектов")
+                    return company_entities
                 else:
-                    logger.warning(f"⚠️ Fallback: пустой ответ")
+                    logger.info(f"❌ Fallback: нет объектов для компании {company_id}")
                     
             except Exception as e:
                 logger.error(f"❌ Ошибка в fallback методе: {e}")
                 
             # Метод 3: Поиск через заявки компании
             try:
-                logger.info(f"� Поиск через заявки компании")
+                logger.info(f"🔍 Поиск через заявки компании")
                 
                 # Получаем заявки компании
                 params = {
-                    'api_token': self.api_token,
-                    'company_id': company_id,
-                    'page[size]': 50
+                    'company_ids[]': company_id,
                 }
                 
-                response_data = await self._make_request('GET', 'issues/list', params=params)
-                
-                if response_data:
-                    # API возвращает прямой массив заявок, не в wrapper'е
-                    issues = response_data if isinstance(response_data, list) else response_data.get('issues', [])
-                    logger.info(f"📋 Через заявки: найдено {len(issues)} заявок")
-                    
-                    # Извлекаем уникальные maintenance_entity из заявок
-                    maintenance_entities = {}
-                    for issue in issues:
+                issues_count = 0
+                maintenance_entities = {}
+                # Извлекаем уникальные maintenance_entity из заявок, страница за страницей
+                async with aclosing(self.paginate('issues/list', params, items_key='issues', prefetch=True)) as issues:
+                    async for issue in issues:
+                        issues_count += 1
                         me = issue.get('maintenance_entity')
                         if me and isinstance(me, dict) and me.get('id'):
                             me_id = me['id']
@@ -2011,16 +2207,16 @@ class OkdeskAPI:
                                     'company_id': company_id,
                                     'source': 'issues'
                                 }
-                                logger.info(f"  ✓ Найден через заявку: {me.get('name', 'Без названия')} (ID: {me_id})")
-                    
-                    if maintenance_entities:
-                        result = list(maintenance_entities.values())
-                        logger.info(f"✅ Через заявки: найдено {len(result)} уникальных объектов")
-                        return result
-                    else:
-                        logger.info(f"❌ Через заявки: нет объектов для компании {company_id}")
+                                logger.debug("  ✓ Найден через заявку: %s (ID: %s)", me.get('name', 'Без названия'), me_id)
+                
+                logger.info(f"📋 Через заявки: просмотрено {issues_count} заявок")
+                
+                if maintenance_entities:
+                    result = list(maintenance_entities.values())
+                    logger.info(f"✅ Через заявки: найдено {len(result)} уникальных объектов")
+                    return result
                 else:
-                    logger.warning(f"⚠️ Поиск через заявки: неожиданный формат ответа")
+                    logger.info(f"❌ Через заявки: нет объектов для компании {company_id}")
                     
             except Exception as e:
                 logger.error(f"❌ Ошибка в поиске через заявки: {e}")
@@ -0,0 +1,107 @@
+"""
+Ссылки на клиентский портал Okdesk, создаваемые при отрисовке сообщений.
+
+Раньше токен портала пользователя "запекался" в Issue.okdesk_url при
+создании заявки, и при смене токена приходилось переписывать всю таблицу
+(update_urls.py). Теперь в БД хранится простая ссылка на заявку, а ссылка
+со входом строится на лету: одна login-ссылка на контакт (POST login_link,
+многоразовая) кэшируется на PORTAL_LINK_CACHE_TTL и дополняется redirect
+на нужную страницу. Если API не отдал ссылку, используется сохраненный
+portal_token пользователя, в крайнем случае - ссылка без входа.
+
+Смена токена - это invalidate(contact_id), а запись кэша, построенная
+для другого токена, пересоздается автоматически.
+"""
+
+import asyncio
+import logging
+from typing import Dict, Optional
+
+import config
+from services.okdesk_api import OkdeskAPI
+from utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+def simple_issue_url(okdesk_issue_id) -> str:
+    """Ссылка на заявку в портале без автоматического входа (хранится в Issue.okdesk_url)"""
+    return f"{config.OKDESK_PORTAL_URL}/issues/{okdesk_issue_id}"
+
+
+def _with_redirect(login_url: str, path: str) -> str:
+    return f"{login_url}{'&' if '?' in login_url else '?'}redirect={path}"
+
+
+class PortalLinks:
+    """Кэш login-ссылок портала по contact_id"""
+
+    def __init__(self, okdesk_api: OkdeskAPI = None, ttl: float = None, max_size: int = None):
+        self.okdesk_api = okdesk_api
+        # contact_id -> (portal_token, login_url)
+        self._cache = TTLCache(ttl=config.PORTAL_LINK_CACHE_TTL if ttl is None else ttl,
+                               max_size=max_size or config.PORTAL_LINK_CACHE_SIZE)
+        self._pending: Dict[int, asyncio.Future] = {}
+
+    async def login_url(self, contact_id: Optional[int], portal_token: str = None) -> Optional[str]:
+        """Ссылка для входа контакта в портал (None - войти автоматически нельзя)"""
+        if not contact_id:
+            return f"{config.OKDESK_PORTAL_URL}/login?token={portal_token}" if portal_token else None
+
+        found, cached = self._cache.get(contact_id)
+        if found and cached[0] == portal_token:
+            return cached[1]
+
+        # Параллельные отрисовки для одного контакта ждут один запрос
+        pending = self._pending.get(contact_id)
+        if pending is None:
+            pending = asyncio.ensure_future(self._create(contact_id, portal_token))
+            self._pending[contact_id] = pending
+            pending.add_done_callback(lambda _: self._pending.pop(contact_id, None))
+        return await asyncio.shield(pending)
+
+    async def _create(self, contact_id: int, portal_token: Optional[str]) -> Optional[str]:
+        api = self.okdesk_api or OkdeskAPI()
+        response = await api.create_login_link("contact", contact_id,
+                                               expire_minutes=config.PORTAL_LINK_EXPIRE_MINUTES)
+        login_url = (response.get("url") or response.get("login_link")) if response else None
+        if login_url:
+            self._cache.set(contact_id, (portal_token, login_url))
+            return login_url
+        # API недоступен - не кэшируем, следующая отрисовка попробует снова
+        if portal_token:
+            return f"{config.OKDESK_PORTAL_URL}/login?token={portal_token}"
+        return None
+
+    async def issue_url(self, user, okdesk_issue_id) -> str:
+        """Ссылка на заявку с автоматическим входом пользователя (если возможно)"""
+        if user is not None:
+            try:
+                login_url = await self.login_url(user.okdesk_contact_id, user.portal_token)
+                if login_url:
+                    return _with_redirect(login_url, f"/issues/{okdesk_issue_id}")
+            except Exception as e:
+                logger.error("❌ Ошибка создания ссылки на портал для заявки %s: %s", okdesk_issue_id, e)
+        return simple_issue_url(okdesk_issue_id)
+
+    async def main_url(self, user) -> str:
+        """Главная страница портала с автоматическим входом (если возможно)"""
+        if user is not None:
+            try:
+                login_url = await self.login_url(user.okdesk_contact_id, user.portal_token)
+                if login_url:
+                    return login_url
+            except Exception as e:
+                logger.error("❌ Ошибка создания ссылки на портал: %s", e)
+        return config.OKDESK_PORTAL_URL
+
+    def invalidate(self, contact_id: Optional[int]):
+        """Сбросить ссылку контакта (смена токена или контакта)"""
+        if contact_id:
+            self._cache.invalidate(contact_id)
+
+    def clear(self):
+        self._cache.clear()
+
+
+portal_links = PortalLinks()
@@ -0,0 +1,83 @@
+"""
+Кэш объектов обслуживания (maintenance entities) по компаниям.
+
+Регистрация юридического лица обращается к объектам обслуживания трижды:
+список для кнопок при вводе ИНН, название выбранного филиала и
+финализация. Раньше каждый шаг заново скачивал maintenance_entities/list
+(а fallback - все объекты и все заявки компании). Теперь список компании
+загружается один раз (get_maintenance_entities_for_company), хранится
+SERVICE_OBJECT_CACHE_TTL секунд вместе с индексом id -> название, и
+название филиала определяется без запросов к API.
+"""
+
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+import config
+from services.okdesk_api import OkdeskAPI
+from utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceObjectCache:
+    """Объекты обслуживания компании и индекс id -> название"""
+
+    def __init__(self, ttl: float = None, max_size: int = None):
+        # company_id -> (список объектов, {id: название})
+        self._cache = TTLCache(ttl=config.SERVICE_OBJECT_CACHE_TTL if ttl is None else ttl,
+                               max_size=max_size or config.SERVICE_OBJECT_CACHE_SIZE)
+        self._pending: Dict[int, asyncio.Future] = {}
+
+    async def get(self, company_id: int, okdesk_api: OkdeskAPI = None) -> List[Dict]:
+        """Объекты обслуживания компании (из кэша или одним запросом к API)"""
+        if not company_id:
+            return []
+        found, cached = self._cache.get(company_id)
+        if found:
+            return cached[0]
+
+        # Параллельные регистрации одной компании ждут одну загрузку
+        pending = self._pending.get(company_id)
+        if pending is None:
+            pending = asyncio.ensure_future(self._load(company_id, okdesk_api))
+            self._pending[company_id] = pending
+            pending.add_done_callback(lambda _: self._pending.pop(company_id, None))
+        return await asyncio.shield(pending)
+
+    async def _load(self, company_id: int, okdesk_api: Optional[OkdeskAPI]) -> List[Dict]:
+        api = okdesk_api or OkdeskAPI()
+        entities = await api.get_maintenance_entities_for_company(company_id)
+        if entities:
+            names = {entity['id']: entity.get('name') or f"Объект {entity['id']}"
+                     for entity in entities if entity.get('id') is not None}
+            self._cache.set(company_id, (entities, names))
+            logger.info(f"📦 Объекты обслуживания компании {company_id} закэшированы: {len(entities)}")
+        # Пустой результат не кэшируем: это может быть и временная ошибка API
+        return entities or []
+
+    def name(self, company_id: int, branch_id: int) -> Optional[str]:
+        """Название объекта из кэша без запросов к API (None - нет в кэше)"""
+        found, cached = self._cache.get(company_id) if company_id else (False, None)
+        if not found:
+            return None
+        return cached[1].get(branch_id)
+
+    async def resolve_name(self, company_id: int, branch_id: int, okdesk_api: OkdeskAPI = None) -> str:
+        """Название объекта; если кэш устарел - одна повторная загрузка списка компании"""
+        name = self.name(company_id, branch_id)
+        if name is None and company_id:
+            await self.get(company_id, okdesk_api)
+            name = self.name(company_id, branch_id)
+        return name or f'Объект {branch_id}'
+
+    def invalidate(self, company_id: int):
+        if company_id:
+            self._cache.invalidate(company_id)
+
+    def clear(self):
+        self._cache.clear()
+
+
+service_objects_cache = ServiceObjectCache()
@@ -0,0 +1,194 @@
+"""
+Запись входящих webhook'ов Okdesk для последующего воспроизведения
+(benchmarks/replay_webhooks.py).
+
+Включается WEBHOOK_RECORD_FILE. Каждая запись - одна компактная JSON-строка
+в файле, который только дописывается (для *.gz - gzip, пачками):
+
+    {"t": 1760000000.123, "d": 12.5, "p": "/okdesk-webhook", "s": "<подпись>", "r": "<тело>"}
+
+t - время прихода (unix), d - время обработки, мс, p - путь, s - заголовок
+X-Okdesk-Signature. Тело:
+  r   - исходное тело запроса как текст (байт в байт, WEBHOOK_RECORD_SCRUB=false);
+  r64 - исходное тело в base64, если это не UTF-8;
+  b   - очищенный от ПДн JSON (WEBHOOK_RECORD_SCRUB=true);
+  x   - true, если очищено тело, которое не JSON (тогда оно в r).
+
+В обработчике запись только добавляется в буфер. Разбор, очистка
+персональных данных и запись на диск выполняются в отдельном потоке раз
+в WEBHOOK_RECORD_FLUSH_INTERVAL секунд. Исходное тело воспроизводится
+без изменений и с записанной подписью. Очищенное тело (b или x) с подписью
+уже не совпадает, и при воспроизведении его нужно подписать заново
+(--secret).
+"""
+
+import asyncio
+import base64
+import gzip
+import hashlib
+import logging
+import os
+import random
+import re
+from typing import Any, Dict, List, Optional
+
+import config
+from utils import json_codec
+
+logger = logging.getLogger(__name__)
+
+# Поля с персональными данными: значения заменяются псевдонимами
+_PII_NAME_KEYS = frozenset((
+    "first_name", "last_name", "patronymic", "full_name", "name", "username", "login", "author_name",
+))
+_PII_CONTACT_KEYS = frozenset(("phone", "mobile_phone", "email", "address", "inn", "inn_company", "telegram"))
+# Свободный текст: буквы и цифры заменяются, разметка и длина сохраняются
+_FREE_TEXT_KEYS = frozenset(("content", "description", "title", "comment", "text", "value"))
+
+_TEXT_RE = re.compile(r"(<[^>]*>|&#?\w+;)|\w")
+_DIGIT_RE = re.compile(r"\d")
+
+
+def _pseudonym(value: str, kind: str) -> str:
+    digest = hashlib.sha256(f"{kind}:{value}".encode("utf-8")).hexdigest()
+    if kind == "email":
+        return f"user{digest[:10]}@example.invalid"
+    if kind in ("phone", "mobile_phone", "inn", "inn_company"):
+        digits = iter(str(int(digest[:16], 16)))
+        return _DIGIT_RE.sub(lambda m: next(digits, "0"), value)
+    return f"{kind}-{digest[:8]}"
+
+
+def _scrub_text(value: str) -> str:
+    return _TEXT_RE.sub(lambda m: m.group(1) or "x", value)
+
+
+def scrub(data: Any, key: str = None) -> Any:
+    """Копия payload'а без персональных данных (структура, типы и размеры сохраняются)"""
+    if isinstance(data, dict):
+        return {k: scrub(v, k) for k, v in data.items()}
+    if isinstance(data, list):
+        return [scrub(item, key) for item in data]
+    if isinstance(data, str) and data and key:
+        lowered = key.lower()
+        if lowered in _PII_NAME_KEYS:
+            return _pseudonym(data, lowered)
+        if lowered in _PII_CONTACT_KEYS:
+            return _pseudonym(data, "email" if "@" in data else lowered)
+        if lowered in _FREE_TEXT_KEYS:
+            return _scrub_text(data)
+    return data
+
+
+class WebhookRecorder:
+    """Буфер записей с периодическим сбросом в файл"""
+
+    def __init__(self, path: str = None, sample_rate: float = None, scrub_pii: bool = None,
+                 flush_interval: float = None, max_bytes: int = None):
+        self.path = config.WEBHOOK_RECORD_FILE if path is None else path
+        self.sample_rate = config.WEBHOOK_RECORD_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.scrub_pii = config.WEBHOOK_RECORD_SCRUB if scrub_pii is None else scrub_pii
+        self.flush_interval = config.WEBHOOK_RECORD_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.max_bytes = config.WEBHOOK_RECORD_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+        self.recorded = 0
+        self._buffer: List[tuple] = []
+        self._task: Optional[asyncio.Task] = None
+        self._full = False
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path) and not self._full
+
+    def record(self, body: bytes, path: str, signature: Optional[str], received_at: float, duration: float):
+        """Добавить webhook в буфер (вызывается из обработчика, без I/O)"""
+        if not self.enabled:
+            return
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        self._buffer.append((body, path, signature, received_at, duration))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="webhook-recorder-flush")
+
+    async def _run(self):
+        while self._buffer:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("❌ Ошибка записи webhook'ов в %s: %s", self.path, e)
+
+    async def flush(self) -> int:
+        """Записать накопленные webhook'и"""
+        if not self._buffer:
+            return 0
+        batch, self._buffer = self._buffer, []
+        written = await asyncio.to_thread(self._write_sync, batch)
+        self.recorded += written
+        return written
+
+    async def close(self):
+        """Сбросить буфер и остановить фоновую задачу"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        await self.flush()
+
+    def _encode(self, body: bytes, path: str, signature: Optional[str], received_at: float,
+                duration: float) -> str:
+        entry: Dict[str, Any] = {"t": round(received_at, 3), "d": round(duration * 1000, 2), "p": path,
+                                 "s": signature}
+        if not self.scrub_pii:
+            # Исходные байты: подпись Okdesk при воспроизведении остается верной
+            try:
+                entry["r"] = body.decode("utf-8")
+            except UnicodeDecodeError:
+                entry["r64"] = base64.b64encode(body).decode("ascii")
+            return json_codec.dumps(entry)
+        try:
+            entry["b"] = scrub(json_codec.loads(body))
+        except Exception:
+            entry["r"] = _scrub_text(body.decode("utf-8", "replace"))
+            entry["x"] = True
+        return json_codec.dumps(entry)
+
+    def _write_sync(self, batch: List[tuple]) -> int:
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+            self._full = True
+            logger.warning("⚠️ Файл записи webhook'ов %s достиг WEBHOOK_RECORD_MAX_MB, запись остановлена", self.path)
+            return 0
+        data = "".join(self._encode(*item) + "\n" for item in batch).encode("utf-8")
+        opener = gzip.open if self.path.endswith(".gz") else open
+        with opener(self.path, "ab") as record_file:
+            record_file.write(data)
+        return len(batch)
+
+
+def read_records(path: str):
+    """Прочитать записанные webhook'и (генератор словарей, формат см. выше)"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as record_file:
+        for line in record_file:
+            line = line.strip()
+            if line:
+                yield json_codec.loads(line)
+
+
+def record_body(record: Dict) -> bytes:
+    """Тело запроса из записи (исходные байты или сериализованный очищенный JSON)"""
+    if "r64" in record:
+        return base64.b64decode(record["r64"])
+    if "b" in record:
+        return json_codec.dumps_bytes(record["b"])
+    return record.get("r", "").encode("utf-8")
+
+
+def needs_resign(record: Dict) -> bool:
+    """Тело записи изменено (очистка ПДн) и записанная подпись к нему не подходит"""
+    return "b" in record or bool(record.get("x"))
+
+
+webhook_recorder = WebhookRecorder()
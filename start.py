@@ -3,6 +3,7 @@ import subprocess
 import threading
 import time
 import os
+import signal
 import sys
 
 def run_bot():
@@ -15,6 +16,83 @@ def run_webhook():
     print("🌐 Запуск webhook сервера...")
     subprocess.run([sys.executable, "webhook_server.py"])
 
+async def run_combined():
+    """
+    Бот и webhook сервер в одном процессе и одном event loop.
+
+    Общие: движок БД, HTTP-сессия к Okdesk, экземпляр Bot и кэши.
+    SIGTERM/SIGINT останавливают uvicorn, после чего корректно
+    завершается polling и только затем закрываются общие ресурсы
+    (shutdown-хук webhook сервера их не трогает).
+    """
+    import uvicorn
+    import config
+    from services.okdesk_api import enable_shared_session, close_shared_session
+
+    enable_shared_session()
+
+    # webhook_server импортирует bot, создает таблицы и приложение FastAPI
+    import webhook_server
+    import bot as bot_module
+
+    webhook_server.SHARED_RESOURCES_EXTERNAL = True
+
+    server = uvicorn.Server(uvicorn.Config(
+        webhook_server.app,
+        host=config.HOST,
+        port=config.PORT,
+        log_config=None,  # логи идут через общую очередь логирования
+    ))
+
+    polling_task = None
+    if config.TELEGRAM_MODE != "webhook":
+        # Сигналы обрабатывает uvicorn, aiogram свои обработчики не ставит
+        polling_task = asyncio.create_task(bot_module.run_polling(handle_signals=False))
+
+        def on_polling_done(task):
+            # Если polling упал, останавливаем и сервер, чтобы процесс перезапустился
+            if not task.cancelled() and task.exception():
+                print(f"❌ Polling завершился с ошибкой: {task.exception()}")
+                server.should_exit = True
+
+        polling_task.add_done_callback(on_polling_done)
+
+    # uvicorn перехватывает SIGTERM/SIGINT только на время serve() и затем
+    # повторно посылает сигнал; обработчик в loop не дает ему убить процесс
+    # до завершения остановки polling и закрытия сессий
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, lambda: setattr(server, "should_exit", True))
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows
+
+    print(f"🚀 Совмещенный режим: webhook сервер на {config.HOST}:{config.PORT}, "
+          f"Telegram updates: {config.TELEGRAM_MODE}")
+
+    try:
+        await server.serve()
+    finally:
+        print("📴 Останавливаем сервисы...")
+        if polling_task and not polling_task.done():
+            try:
+                await bot_module.dp.stop_polling()
+            except RuntimeError:
+                # Polling еще не успел стартовать
+                polling_task.cancel()
+            try:
+                await polling_task
+            except (asyncio.CancelledError, Exception):
+                pass
+        await webhook_server.drain_telegram_updates()
+        await webhook_server.loop_monitor.stop()
+        if config.TELEGRAM_MODE == "webhook":
+            # В режиме polling хранилище FSM закрывает сам диспетчер
+            await bot_module.dp.storage.close()
+        await close_shared_session()
+        await bot_module.bot.session.close()
+        print("✅ Остановлено!")
+
 def check_env_file():
     """Проверка наличия файла .env"""
     if not os.path.exists('.env'):
@@ -33,8 +111,13 @@ def main():
     print("🚀 Запуск Okdesk Telegram Bot")
     print("=" * 40)
     
-    # Проверяем файл конфигурации
-    if not check_env_file():
+    # Проверяем файл конфигурации (в Docker переменные приходят из окружения)
+    if not os.getenv("BOT_TOKEN") and not check_env_file():
+        return
+    
+    # Один процесс вместо двух дочерних (python start.py --combined)
+    if "--combined" in sys.argv:
+        asyncio.run(run_combined())
         return
     
     try:
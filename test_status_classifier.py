@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Тест классификации статусов: коды сравниваются целиком, по словам
+разбираются только названия, отрицание отменяет завершение.
+
+Запуск: python test_status_classifier.py (или через run_all_tests.py / pytest)
+"""
+
+from utils.status_classifier import StatusClassifier, status_classifier
+
+
+def test_negated_codes_are_not_completion():
+    for code in ("not_done", "not_completed", "unclosed", "NOT_DONE"):
+        info = status_classifier.classify(code)
+        assert not info.is_completion, code
+        assert not info.needs_rating, code
+        assert info.is_open, code
+
+
+def test_known_statuses():
+    assert status_classifier.classify("closed").is_completion
+    assert status_classifier.classify({"code": "done"}).needs_rating
+    assert status_classifier.normalize("Закрыта") == "closed"
+    assert not status_classifier.classify("in_work").is_completion
+
+
+def test_free_text_names():
+    assert status_classifier.classify("Работа выполнена").is_completion
+    assert not status_classifier.classify("Не выполнена").is_completion
+    assert not status_classifier.classify("Not completed").is_completion
+
+
+def test_unknown_status_is_not_closed():
+    # Неизвестный код не попадает в "Закрытые" и остается в "Открытых" (notin_)
+    classifier = StatusClassifier({"opened": "opened"}, ["closed"], {})
+    assert "delayed" not in classifier.known_statuses(completion=True)
+    assert classifier.classify("delayed").is_open
+
+
+def main() -> bool:
+    tests = [test_negated_codes_are_not_completion, test_known_statuses,
+             test_free_text_names, test_unknown_status_is_not_closed]
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e}")
+            return False
+    return True
+
+
+if __name__ == "__main__":
+    raise SystemExit(0 if main() else 1)
@@ -3,6 +3,7 @@ import sys
 from pathlib import Path
 import asyncio
 import logging
+import time
 
 # Настраиваем логирование
 logging.basicConfig(level=logging.INFO)
@@ -12,67 +13,58 @@ logger = logging.getLogger(__name__)
 project_root = Path(__file__).parent
 sys.path.insert(0, str(project_root))
 
-from models.database import SessionLocal, Issue, User
+from sqlalchemy import or_, update
+from models.database import SessionLocal, Issue
 from database.crud import IssueService, UserService
 from services.okdesk_api import OkdeskAPI
+from services.portal_links import portal_links, simple_issue_url
 import config
 import config
 
+URL_UPDATE_CHUNK = 1000
+
+
+def build_portal_issue_url(okdesk_url: str) -> str:
+    """
+    Простая ссылка на заявку в портале вместо устаревшей или None, если URL менять не нужно.
+
+    Токен портала в ссылках больше не хранится: ссылка со входом строится
+    при отрисовке сообщения (services/portal_links.py).
+    """
+    # Ссылки на API, старые ссылки вида okdesk.ru/issues/... и ссылки с "запеченным" токеном
+    if '/api/v1' not in okdesk_url and 'okdesk.ru/issues/' not in okdesk_url and 'token=' not in okdesk_url:
+        return None
+    parts = okdesk_url.split('/issues/')
+    if len(parts) < 2:
+        return None
+    issue_id = parts[1].split('/')[0].split('?')[0].split('&')[0]
+    return simple_issue_url(issue_id)
+
+
 async def update_existing_urls():
-    """Обновляет URL существующих заявок на портал"""
+    """Приводит URL существующих заявок к простым ссылкам на портал (пакетно)"""
     session = SessionLocal()
+    started = time.perf_counter()
 
     try:
-        # Получаем все заявки с URL (только необходимые поля)
-        issues = session.query(Issue.id, Issue.issue_number, Issue.okdesk_url, Issue.telegram_user_id).filter(Issue.okdesk_url.isnot(None)).all()
+        # Только заявки, ссылки которых нужно переписать (только необходимые поля)
+        issues = session.query(Issue.id, Issue.okdesk_url).filter(
+            or_(Issue.okdesk_url.like('%/api/v1%'), Issue.okdesk_url.like('%okdesk.ru/issues/%'),
+                Issue.okdesk_url.like('%token=%'))
+        ).all()
 
-        updated_count = 0
-        api = OkdeskAPI()
+        # Новые ссылки считаются в памяти, в БД - один UPDATE по первичному ключу на пачку
+        changes = []
+        for issue_id_db, okdesk_url in issues:
+            new_url = build_portal_issue_url(okdesk_url)
+            if new_url and new_url != okdesk_url:
+                changes.append({'id': issue_id_db, 'okdesk_url': new_url})
 
-        for issue_data in issues:
-            issue_id_db, issue_number, okdesk_url, telegram_user_id = issue_data
-            
-            # Получаем данные пользователя
-            user = UserService.get_user_by_telegram_id(telegram_user_id)
-            user_portal_token = user.portal_token if user else None
-            
-            # Если у пользователя нет токена портала, но есть contact_id, попробуем получить его
-            if not user_portal_token and user and user.okdesk_contact_id:
-                try:
-                    logger.info(f"🔄 Получаем токен портала для пользователя {telegram_user_id} (contact_id: {user.okdesk_contact_id})")
-                    portal_token = await api.get_contact_portal_token(user.okdesk_contact_id)
-                    if portal_token:
-                        # Сохраняем токен в базе данных
-                        UserService.update_portal_token_by_telegram_id(telegram_user_id, portal_token)
-                        user_portal_token = portal_token
-                        print(f"✅ Получен и сохранен токен портала для пользователя {telegram_user_id}")
-                    else:
-                        print(f"⚠️ Не удалось получить токен портала для пользователя {telegram_user_id}")
-                except Exception as e:
-                    print(f"❌ Ошибка при получении токена портала для пользователя {telegram_user_id}: {e}")
-            
-            # Проверяем, содержит ли URL API путь
-            if '/api/v1' in okdesk_url or 'okdesk.ru/issues/' in okdesk_url:
-                # Извлекаем ID заявки из URL
-                if '/issues/' in okdesk_url:
-                    parts = okdesk_url.split('/issues/')
-                    if len(parts) > 1:
-                        issue_id = parts[1].split('/')[0].split('?')[0]
-                        
-                        # Формируем новую ссылку с персональным токеном пользователя
-                        if user_portal_token:
-                            new_url = f"{config.OKDESK_PORTAL_URL}/login?token={user_portal_token}&redirect=/issues/{issue_id}"
-                        else:
-                            new_url = f"{config.OKDESK_PORTAL_URL}/issues/{issue_id}"
-                        
-                        print(f"Обновляю заявку #{issue_number}: {okdesk_url} -> {new_url}")
+        for offset in range(0, len(changes), URL_UPDATE_CHUNK):
+            session.execute(update(Issue), changes[offset:offset + URL_UPDATE_CHUNK])
+            session.commit()
 
-                        # Обновляем URL в базе данных
-                        session.query(Issue).filter(Issue.id == issue_id_db).update({"okdesk_url": new_url})
-                        updated_count += 1
-                        
-        session.commit()
-        print(f"✅ Обновлено {updated_count} URL заявок")
+        print(f"✅ Обновлено {len(changes)} URL заявок за {time.perf_counter() - started:.1f} с")
 
     except Exception as e:
         session.rollback()
@@ -209,25 +201,18 @@ async def update_user_portal_access(telegram_id: int, contact_id: int = None) ->
         if not contact_id:
             return {'error': 'Contact ID не найден для пользователя'}
         
-        # Создаем генератор ссылок
-        url_gen = PortalURLGenerator()
+        # Ссылка со входом из кэша по контакту (services/portal_links.py)
+        main_portal_url = await portal_links.main_url(user)
         
-        try:
-            # Генерируем основную ссылку на портал
-            main_portal_url = await url_gen.get_portal_main_url(contact_id)
-            
-            result = {
-                'success': True,
-                'contact_id': contact_id,
-                'main_portal_url': main_portal_url,
-                'portal_base_url': config.OKDESK_PORTAL_URL
-            }
-            
-            logger.info(f"✅ Обновлен доступ к порталу для пользователя {telegram_id}")
-            return result
-            
-        finally:
-            await url_gen.close()
+        result = {
+            'success': True,
+            'contact_id': contact_id,
+            'main_portal_url': main_portal_url,
+            'portal_base_url': config.OKDESK_PORTAL_URL
+        }
+        
+        logger.info(f"✅ Обновлен доступ к порталу для пользователя {telegram_id}")
+        return result
             
     except Exception as e:
         logger.error(f"Ошибка обновления доступа к порталу: {e}")
@@ -255,30 +240,19 @@ async def get_enhanced_issue_urls(telegram_id: int, issue_id: int) -> dict:
         if not contact_id:
             return {'error': 'Contact ID не найден для пользователя'}
         
-        # Создаем генератор ссылок
-        url_gen = PortalURLGenerator()
+        # Ссылки со входом из кэша по контакту (services/portal_links.py)
+        result = {
+            'success': True,
+            'issue_id': issue_id,
+            'contact_id': contact_id,
+            'auto_login_url': await portal_links.issue_url(user, issue_id),  # URL с автоматическим входом на заявку
+            'simple_url': simple_issue_url(issue_id),                        # Простая ссылка на заявку
+            'main_portal_url': await portal_links.main_url(user),            # Главная страница портала
+            'portal_base_url': config.OKDESK_PORTAL_URL
+        }
         
-        try:
-            # Генерируем различные ссылки
-            auto_login_url = await url_gen.get_issue_portal_url(contact_id, issue_id)
-            simple_url = url_gen.get_simple_issue_url(issue_id)
-            main_portal_url = await url_gen.get_portal_main_url(contact_id)
-            
-            result = {
-                'success': True,
-                'issue_id': issue_id,
-                'contact_id': contact_id,
-                'auto_login_url': auto_login_url,  # URL с автоматическим входом на заявку
-                'simple_url': simple_url,          # Простая ссылка на заявку
-                'main_portal_url': main_portal_url, # Главная страница портала
-                'portal_base_url': config.OKDESK_PORTAL_URL
-            }
-            
-            logger.info(f"✅ Созданы ссылки на заявку {issue_id} для пользователя {telegram_id}")
-            return result
-            
-        finally:
-            await url_gen.close()
+        logger.info(f"✅ Созданы ссылки на заявку {issue_id} для пользователя {telegram_id}")
+        return result
             
     except Exception as e:
         logger.error(f"Ошибка создания ссылок на заявку: {e}")
@@ -0,0 +1,192 @@
+"""
+Преобразование HTML комментариев Okdesk в HTML для Telegram (parse_mode=HTML).
+
+Один проход по тексту скомпилированным токенизатором:
+- сохраняется базовое форматирование (жирный, курсив, подчеркнутый,
+  зачеркнутый, код, ссылки), остальные теги отбрасываются;
+- блочные теги (p, div, br, li, ...) превращаются в переносы строк;
+- HTML-сущности декодируются, текст заново экранируется для Telegram;
+- текст обрезается по бюджету видимых символов прямо во время прохода,
+  открытые теги корректно закрываются.
+"""
+
+import html
+import re
+from typing import List, Optional
+
+# Тег, текст или одиночный "<", не являющийся тегом
+_TOKEN_RE = re.compile(r'<(/?)([a-zA-Z][a-zA-Z0-9]*)([^>]*)>|<!--.*?-->|([^<]+)|<', re.DOTALL)
+_HREF_RE = re.compile(r'''href\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))''', re.IGNORECASE)
+
+# Теги Okdesk -> теги, которые понимает Telegram
+_INLINE_TAGS = {
+    "b": "b", "strong": "b",
+    "i": "i", "em": "i",
+    "u": "u", "ins": "u",
+    "s": "s", "strike": "s", "del": "s",
+    "code": "code", "pre": "pre",
+    "a": "a",
+}
+# Внутри code/pre Telegram не допускает вложенного форматирования
+_VERBATIM_TAGS = frozenset(("code", "pre"))
+_BLOCK_TAGS = frozenset((
+    "p", "div", "h1", "h2", "h3", "h4", "h5", "h6", "ul", "ol", "li",
+    "blockquote", "table", "tr", "section", "article", "header", "footer",
+))
+_SKIP_TAGS = frozenset(("script", "style", "head", "title"))
+_ALLOWED_SCHEMES = ("http://", "https://", "mailto:", "tg://")
+
+ELLIPSIS = "..."
+
+
+def _escape(text: str) -> str:
+    if "&" in text or "<" in text or ">" in text:
+        return html.escape(text, quote=False)
+    return text
+
+
+def _extract_href(attrs: str) -> Optional[str]:
+    match = _HREF_RE.search(attrs)
+    if not match:
+        return None
+    href = html.unescape(next(group for group in match.groups() if group is not None)).strip()
+    if not href.lower().startswith(_ALLOWED_SCHEMES):
+        return None
+    return html.escape(href, quote=True)
+
+
+def html_to_telegram(content: str, limit: int = None) -> str:
+    """
+    Преобразовать HTML комментария в безопасный HTML для Telegram.
+
+    Args:
+        content: HTML из Okdesk
+        limit: Максимум видимых символов (без учета тегов); при превышении
+               текст обрезается и дополняется "..."
+
+    Returns:
+        str: Текст для отправки с parse_mode=HTML
+    """
+    if not content:
+        return ""
+
+    out: List[str] = []
+    stack: List[str] = []       # Открытые теги Telegram
+    budget = limit if limit is not None else -1
+    pending_space = False
+    pending_newlines = 0
+    at_start = True
+    skip_depth = 0
+    verbatim = 0
+    truncated = False
+
+    for match in _TOKEN_RE.finditer(content):
+        closing, name, attrs, text = match.groups()
+
+        if name is not None:
+            tag = name.lower()
+            if tag in _SKIP_TAGS:
+                skip_depth += -1 if closing else 1
+                skip_depth = max(skip_depth, 0)
+                continue
+            if skip_depth:
+                continue
+
+            if tag == "br" or tag in _BLOCK_TAGS:
+                if not at_start:
+                    pending_newlines = max(pending_newlines, 1 if tag in ("br", "li") else 2)
+                    pending_space = False
+                if tag == "li" and not closing:
+                    text = "• "
+                else:
+                    continue
+            elif tag in _INLINE_TAGS:
+                target = _INLINE_TAGS[tag]
+                if closing:
+                    if target in stack:
+                        while stack:
+                            open_tag = stack.pop()
+                            out.append(f"</{open_tag}>")
+                            if open_tag in _VERBATIM_TAGS:
+                                verbatim -= 1
+                            if open_tag == target:
+                                break
+                    continue
+                if verbatim:
+                    continue
+                if target == "a":
+                    href = _extract_href(attrs)
+                    if not href:
+                        continue
+                    opening = f'<a href="{href}">'
+                else:
+                    opening = f"<{target}>"
+                if not at_start and (pending_newlines or pending_space):
+                    # Разделитель выводим до тега, а не внутри форматирования
+                    separator = "\n" * pending_newlines if pending_newlines else " "
+                    if budget >= 0:
+                        if len(separator) > budget:
+                            truncated = True
+                            break
+                        budget -= len(separator)
+                    out.append(separator)
+                    pending_newlines = 0
+                    pending_space = False
+                out.append(opening)
+                stack.append(target)
+                if target in _VERBATIM_TAGS:
+                    verbatim += 1
+                continue
+            else:
+                continue
+        elif text is None:
+            if match.group(0) != "<":
+                continue  # HTML-комментарий
+            text = "<"
+
+        if skip_depth:
+            continue
+
+        if "&" in text:
+            text = html.unescape(text)
+        if not verbatim:
+            if text[:1].isspace() and not at_start:
+                pending_space = True
+            stripped = " ".join(text.split())
+            trailing_space = stripped != "" and text[-1:].isspace()
+            text = stripped
+        else:
+            trailing_space = False
+        if not text:
+            continue
+
+        separator = ""
+        if not at_start:
+            if pending_newlines:
+                separator = "\n" * pending_newlines
+            elif pending_space:
+                separator = " "
+        pending_newlines = 0
+        pending_space = trailing_space
+
+        if budget >= 0:
+            needed = len(separator) + len(text)
+            if needed > budget:
+                keep = max(budget - len(separator), 0)
+                if keep:
+                    out.append(separator)
+                    out.append(_escape(text[:keep].rstrip()))
+                truncated = True
+                break
+            budget -= needed
+
+        out.append(separator)
+        out.append(_escape(text))
+        at_start = False
+
+    if truncated:
+        out.append(ELLIPSIS)
+    while stack:
+        out.append(f"</{stack.pop()}>")
+
+    return "".join(out)
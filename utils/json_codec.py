@@ -0,0 +1,80 @@
+"""
+Единая точка работы с JSON для API Okdesk, webhook сервера и исходящих запросов.
+
+Если установлен orjson, используется он (разбор напрямую из bytes без
+промежуточного decode, сериализация сразу в bytes). Иначе - стандартный json.
+Бэкенд можно принудительно выбрать переменной окружения JSON_BACKEND
+("auto", "orjson" или "json").
+"""
+
+import json
+import logging
+from typing import Any, Union
+
+import config
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:  # orjson - необязательная зависимость
+    orjson = None
+
+
+class JSONCodec:
+    """Базовый кодек на стандартной библиотеке json"""
+
+    name = "json"
+
+    def loads(self, data: Union[bytes, bytearray, memoryview, str]) -> Any:
+        """Разобрать JSON из bytes или str"""
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        # json.loads сам определяет кодировку bytes (utf-8/16/32)
+        return json.loads(data)
+
+    def dumps(self, obj: Any) -> str:
+        """Сериализовать объект в компактную строку"""
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str)
+
+    def dumps_bytes(self, obj: Any) -> bytes:
+        """Сериализовать объект в bytes (для тела HTTP запроса)"""
+        return self.dumps(obj).encode("utf-8")
+
+
+class OrjsonCodec(JSONCodec):
+    """Кодек на orjson: разбор bytes -> объект без промежуточной строки"""
+
+    name = "orjson"
+
+    def loads(self, data: Union[bytes, bytearray, memoryview, str]) -> Any:
+        return orjson.loads(data)
+
+    def dumps(self, obj: Any) -> str:
+        return self.dumps_bytes(obj).decode("utf-8")
+
+    def dumps_bytes(self, obj: Any) -> bytes:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+
+def create_codec(backend: str = None) -> JSONCodec:
+    """Создать кодек для указанного бэкенда ("auto", "orjson", "json")"""
+    backend = (backend or config.JSON_BACKEND or "auto").lower()
+
+    if backend in ("auto", "orjson"):
+        if orjson is not None:
+            return OrjsonCodec()
+        if backend == "orjson":
+            logger.warning("⚠️ JSON_BACKEND=orjson, но orjson не установлен - используем стандартный json")
+
+    return JSONCodec()
+
+
+# Кодек по умолчанию для всего приложения
+codec = create_codec()
+
+# JSONDecodeError у orjson наследуется от json.JSONDecodeError
+JSONDecodeError = json.JSONDecodeError
+loads = codec.loads
+dumps = codec.dumps
+dumps_bytes = codec.dumps_bytes
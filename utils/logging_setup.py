@@ -0,0 +1,183 @@
+"""
+Настройка логирования для бота и webhook сервера.
+
+- Все записи уходят в очередь (QueueHandler) неотформатированными, а
+  форматирование (getMessage(), сериализация LazyPayload) и вывод в stdout
+  выполняет отдельный поток (QueueListener), поэтому логирование не
+  блокирует event loop. При переполнении очереди записи отбрасываются.
+- Уровни задаются по категориям (именам логгеров) через LOG_LEVELS,
+  например: "services.okdesk_api=WARNING,webhook_server.payload=DEBUG".
+- Большие дампы (тела запросов/ответов, payload webhook'ов) выводятся через
+  log_payload(): с сэмплированием, ленивой сериализацией и обрезкой.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import time
+from typing import Any, Optional
+
+import config
+from utils import json_codec
+from utils.tracing import TraceContextFilter
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["DroppingQueueHandler"] = None
+
+_TOKEN_RE = re.compile(r'((?:api_token|token|secret)=)[^&\s]+', re.IGNORECASE)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который не блокируется и отбрасывает записи при переполнении очереди"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Стандартный prepare() форматирует запись в потоке вызова. Очередь
+        # внутрипроцессная (pickling не нужен), поэтому запись передается как
+        # есть: сообщение, args и exc_info форматирует обработчик QueueListener
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JSONFormatter(logging.Formatter):
+    """Форматтер структурированных логов (одна JSON-запись на строку)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key.startswith("ctx_"):
+                entry[key[4:]] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json_codec.dumps(entry)
+
+
+def parse_log_levels(spec: str) -> dict:
+    """Разобрать строку вида "logger=LEVEL,logger2=LEVEL2" в словарь"""
+    levels = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        name, level = item.split("=", 1)
+        name, level = name.strip(), level.strip().upper()
+        if name and level:
+            levels[name] = level
+    return levels
+
+
+def setup_logging(level: str = None, force: bool = False) -> logging.Logger:
+    """
+    Настроить корневой логгер: очередь + фоновый поток вывода.
+    Повторный вызов ничего не делает (если не указан force=True).
+    """
+    global _listener, _queue_handler
+
+    root = logging.getLogger()
+    if _listener is not None and not force:
+        return root
+
+    if _listener is not None:
+        _listener.stop()
+
+    stream_handler = logging.StreamHandler()
+    if config.LOG_FORMAT == "json":
+        stream_handler.setFormatter(JSONFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    log_queue = queue.Queue(maxsize=config.LOG_QUEUE_SIZE)
+    _queue_handler = DroppingQueueHandler(log_queue)
+    # trace_id/correlation_id активной трассы (фильтр выполняется в потоке вызова)
+    _queue_handler.addFilter(TraceContextFilter())
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    # Убираем обработчики, установленные basicConfig() при импорте модулей
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel((level or config.LOG_LEVEL).upper())
+
+    for name, category_level in parse_log_levels(config.LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(category_level)
+
+    return root
+
+
+def get_dropped_records() -> int:
+    """Количество записей, отброшенных из-за переполнения очереди"""
+    return _queue_handler.dropped if _queue_handler else 0
+
+
+def get_queue_size() -> int:
+    """Текущая глубина очереди логов"""
+    return _queue_handler.queue.qsize() if _queue_handler else 0
+
+
+def redact_url(url: str) -> str:
+    """Скрыть токены в URL перед записью в лог"""
+    return _TOKEN_RE.sub(r"\1***", url) if url else url
+
+
+def truncate(text: str, limit: int = None) -> str:
+    """Обрезать текст для лога до limit символов"""
+    limit = config.LOG_MAX_PAYLOAD_CHARS if limit is None else limit
+    if text is None or len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [обрезано, всего {len(text)} символов]"
+
+
+class LazyPayload:
+    """Ленивое представление payload: сериализация и обрезка только при выводе записи"""
+
+    __slots__ = ("payload", "limit")
+
+    def __init__(self, payload: Any, limit: int = None):
+        self.payload = payload
+        self.limit = limit
+
+    def __str__(self) -> str:
+        payload = self.payload
+        if isinstance(payload, (bytes, bytearray)):
+            text = bytes(payload).decode("utf-8", "replace")
+        elif isinstance(payload, str):
+            text = payload
+        else:
+            try:
+                text = json_codec.dumps(payload)
+            except Exception:
+                text = repr(payload)
+        return truncate(redact_url(text), self.limit)
+
+
+def log_payload(logger: logging.Logger, message: str, payload: Any, level: int = logging.DEBUG,
+                sample_rate: float = None):
+    """
+    Записать дамп payload с сэмплированием.
+
+    Запись формируется только если уровень включен и событие попало в выборку
+    (LOG_PAYLOAD_SAMPLE_RATE, 1.0 - все, 0 - ни одного).
+    """
+    if not logger.isEnabledFor(level):
+        return
+    rate = config.LOG_PAYLOAD_SAMPLE_RATE if sample_rate is None else sample_rate
+    if rate < 1.0 and random.random() >= rate:
+        return
+    logger.log(level, "%s: %s", message, LazyPayload(payload))
@@ -0,0 +1,258 @@
+"""
+Метрики в текстовом формате Prometheus (без внешних зависимостей).
+
+Счетчики, гистограммы и gauge'и регистрируются здесь же, при импорте модуля,
+а код только обновляет их:
+
+    metrics.WEBHOOK_EVENTS.inc("issue.status_changed", "success")
+    with metrics.HANDLER_SECONDS.time("handle_comment_created"):
+        ...
+
+Webhook сервер отдает их на /metrics, процесс бота в режиме polling -
+через start_metrics_server() на BOT_METRICS_PORT. Обновление метрик
+потокобезопасно: запросы к БД выполняются и из asyncio.to_thread.
+"""
+
+import functools
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_ID_SEGMENT_RE = re.compile(r"(?<![^/])\d+(?=/|$)")
+
+_registry: List["_Metric"] = []
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Базовый класс: имя, описание, имена меток и значения по наборам меток"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, label_values: tuple) -> tuple:
+        if len(label_values) != len(self.labelnames):
+            raise ValueError(f"{self.name}: ожидаются метки {self.labelnames}, получено {label_values}")
+        return tuple(str(value) for value in label_values)
+
+    def _labels(self, key: tuple, extra: Dict[str, str] = None) -> str:
+        pairs = list(zip(self.labelnames, key))
+        if extra:
+            pairs.extend(extra.items())
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + "}"
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.type_name}\n"
+        return header + "".join(line + "\n" for line in self._samples())
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *label_values) -> float:
+        return self._values.get(self._key(label_values), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{self._labels(key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Текущее значение; может вычисляться функцией в момент сбора метрик"""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[tuple, float] = {}
+        self._functions: Dict[tuple, Callable[[], float]] = {}
+
+    def set(self, value: float, *label_values):
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function: Callable[[], float], *label_values):
+        """Значение берется из function() при каждом сборе (повторный вызов заменяет функцию)"""
+        key = self._key(label_values)
+        with self._lock:
+            self._functions[key] = function
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+            functions = list(self._functions.items())
+        for key, function in functions:
+            try:
+                values[key] = function()
+            except Exception as e:
+                logger.debug("Не удалось вычислить %s%s: %s", self.name, key, e)
+        return [f"{self.name}{self._labels(key)} {_format_value(value)}" for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    """Распределение длительностей (накопительные бакеты, сумма и количество)"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # Для каждого набора меток: [счетчики по бакетам..., сумма]
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        key = self._key(label_values)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0] * len(self.buckets) + [0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[index] += 1
+                    break
+            data[-1] += value
+
+    @contextmanager
+    def time(self, *label_values) -> Iterator[None]:
+        """Замерить длительность блока (в том числе с await внутри)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def timed(self, *label_values):
+        """Декоратор корутины: длительность каждого вызова"""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.time(*label_values):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, *label_values) -> int:
+        data = self._values.get(self._key(label_values))
+        return sum(data[:-1]) if data else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(data)) for key, data in self._values.items())
+        lines = []
+        for key, data in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, data):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{self._labels(key, {'le': _format_value(bound)})} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_format_value(data[-1])}")
+            lines.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus"""
+    return "".join(metric.render() for metric in _registry)
+
+
+def endpoint_label(endpoint: str) -> str:
+    """Endpoint Okdesk без query и идентификаторов: issues/123/comments -> issues/:id/comments"""
+    path = endpoint.split("?", 1)[0].strip("/")
+    return _ID_SEGMENT_RE.sub(":id", path) or "/"
+
+
+async def start_metrics_server(host: str, port: int):
+    """
+    Отдельный HTTP endpoint /metrics (для процесса бота без FastAPI).
+
+    Returns:
+        aiohttp.web.AppRunner: вызовите await runner.cleanup() при остановке
+    """
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(body=render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("📈 Метрики доступны на http://%s:%s/metrics", host, port)
+    return runner
+
+
+# --- Метрики приложения ---
+
+WEBHOOK_EVENTS = Counter(
+    "okdesk_webhook_events_total", "Webhook-события Okdesk по типу и результату", ("event", "outcome"))
+HANDLER_SECONDS = Histogram(
+    "okdesk_webhook_handler_seconds", "Длительность обработчиков webhook-событий", ("handler",))
+
+OKDESK_REQUEST_SECONDS = Histogram(
+    "okdesk_api_request_seconds", "Запросы к API Okdesk по endpoint'у и HTTP-статусу",
+    ("method", "endpoint", "status"))
+
+TELEGRAM_REQUEST_SECONDS = Histogram(
+    "telegram_api_request_seconds", "Запросы к Telegram Bot API по методу и результату", ("method", "outcome"))
+TELEGRAM_FLOOD_WAITS = Counter(
+    "telegram_flood_waits_total", "Ответы flood control (RetryAfter) от Telegram", ("method",))
+TELEGRAM_FLOOD_WAIT_SECONDS = Counter(
+    "telegram_flood_wait_seconds_total", "Запрошенное Telegram время ожидания (retry_after), секунды", ("method",))
+
+BOT_UPDATE_SECONDS = Histogram(
+    "bot_update_seconds", "Обработка Telegram update'ов диспетчером", ("update_type", "outcome"))
+
+DB_QUERY_SECONDS = Histogram(
+    "db_query_seconds", "Длительность SQL-запросов по типу", ("statement",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+
+LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds", "Задержка срабатывания таймеров event loop",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+
+QUEUE_DEPTH = Gauge("queue_depth", "Текущая длина внутренних очередей", ("queue",))
@@ -0,0 +1,223 @@
+"""
+Профилирование работающего процесса без перезапуска.
+
+SamplingProfiler - семплирующий профайлер: отдельный поток каждые
+PROFILE_SAMPLE_INTERVAL_MS снимает стек потока event loop (или всех потоков)
+через sys._current_frames() и по окончании пишет файл в формате folded
+stacks ("a;b;c N") - его понимают flamegraph.pl, speedscope и inferno.
+Запуск: POST /admin/profile webhook сервера (заголовок X-Admin-Token) или
+сигнал SIGUSR1 (бот и webhook сервер; повторный сигнал - досрочная остановка).
+
+LoopLagMonitor - контроль задержек event loop: корутина-пульс отмечается
+каждые LOOP_LAG_CHECK_INTERVAL_MS, а сторожевой поток, заметив, что пульса
+нет дольше LOOP_LAG_THRESHOLD_MS, пишет в лог стек потока loop - то есть
+именно тот синхронный вызов (например, запрос SQLAlchemy), который его блокирует.
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Dict, Optional
+
+import config
+from utils.metrics import LOOP_LAG_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+_PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+_SITE_PACKAGES = "site-packages" + os.sep
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    # Короткое имя файла: путь внутри проекта или site-packages
+    if filename.startswith(_PROJECT_DIR):
+        filename = filename[len(_PROJECT_DIR):]
+    elif _SITE_PACKAGES in filename:
+        filename = filename.split(_SITE_PACKAGES, 1)[1]
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ",")
+
+
+def _collapse(frame) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    """Семплирующий профайлер (один сеанс одновременно)"""
+
+    def __init__(self, interval_ms: float = None, output_dir: str = None):
+        self.interval = (config.PROFILE_SAMPLE_INTERVAL_MS if interval_ms is None else interval_ms) / 1000
+        self.output_dir = output_dir or config.PROFILE_DIR
+        self.samples: Counter = Counter()
+        self.output_path: Optional[str] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._done: Optional[asyncio.Event] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float, all_threads: bool = False) -> str:
+        """
+        Начать сеанс на seconds секунд (не больше PROFILE_MAX_SECONDS).
+
+        Returns:
+            str: Путь к файлу, который будет записан по окончании
+        """
+        if self.running:
+            raise RuntimeError("Профилирование уже запущено")
+        seconds = max(0.1, min(seconds, config.PROFILE_MAX_SECONDS))
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.output_path = os.path.join(self.output_dir, f"profile-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+        self.samples = Counter()
+        self._stop.clear()
+        target = None if all_threads else threading.get_ident()
+        try:
+            loop = asyncio.get_running_loop()
+            self._done = asyncio.Event()
+        except RuntimeError:
+            loop = None
+            self._done = None
+        self._thread = threading.Thread(target=self._run, args=(seconds, target, loop), name="sampling-profiler",
+                                        daemon=True)
+        self._thread.start()
+        logger.info("🔬 Профилирование запущено на %.0f с (%s), результат: %s",
+                    seconds, "все потоки" if all_threads else "поток event loop", self.output_path)
+        return self.output_path
+
+    def stop(self):
+        """Досрочно завершить сеанс (файл все равно записывается)"""
+        self._stop.set()
+
+    async def wait(self):
+        """Дождаться окончания сеанса"""
+        if self._done is not None:
+            await self._done.wait()
+
+    def _run(self, seconds: float, target_thread: Optional[int], loop):
+        own_thread = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        deadline = time.monotonic() + seconds
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread or (target_thread is not None and thread_id != target_thread):
+                    continue
+                stack = _collapse(frame)
+                if target_thread is None:
+                    stack = f"{names.get(thread_id, thread_id)};{stack}"
+                self.samples[stack] += 1
+            time.sleep(self.interval)
+
+        self._write()
+        if loop is not None and self._done is not None:
+            loop.call_soon_threadsafe(self._done.set)
+
+    def _write(self):
+        total = sum(self.samples.values())
+        try:
+            with open(self.output_path, "w", encoding="utf-8") as output:
+                for stack, count in self.samples.most_common():
+                    output.write(f"{stack} {count}\n")
+            logger.info("🔬 Профиль записан: %s (%s семплов)", self.output_path, total)
+        except OSError as e:
+            logger.error("❌ Не удалось записать профиль %s: %s", self.output_path, e)
+
+
+class LoopLagMonitor:
+    """Сторож event loop: логирует блокирующие вызовы со стеком"""
+
+    def __init__(self, threshold_ms: float = None, interval_ms: float = None):
+        self.threshold = (config.LOOP_LAG_THRESHOLD_MS if threshold_ms is None else threshold_ms) / 1000
+        self.interval = (config.LOOP_LAG_CHECK_INTERVAL_MS if interval_ms is None else interval_ms) / 1000
+        self.stalls = 0
+        self._last_beat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._reported = False
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self.threshold <= 0 or (self._task and not self._task.done()):
+            return
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat(), name="loop-lag-heartbeat")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info("⏱️ Контроль задержек event loop: порог %.0f мс", self.threshold * 1000)
+
+    async def stop(self):
+        self._stop.set()
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._last_beat = now
+            LOOP_LAG_SECONDS.observe(lag)
+            if self._reported:
+                self._reported = False
+                logger.warning("⏱️ Event loop был заблокирован %.0f мс", lag * 1000)
+
+    def _watch(self):
+        while not self._stop.wait(self.threshold / 2):
+            blocked_for = time.monotonic() - self._last_beat - self.interval
+            if blocked_for < self.threshold or self._reported:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            self._reported = True
+            self.stalls += 1
+            stack = "".join(traceback.format_stack(frame, limit=config.LOOP_LAG_STACK_DEPTH))
+            logger.warning("🐢 Event loop заблокирован дольше %.0f мс, текущий вызов:\n%s",
+                           blocked_for * 1000, stack)
+
+
+profiler = SamplingProfiler()
+loop_monitor = LoopLagMonitor()
+
+
+def toggle_profiler(seconds: float = None) -> Dict[str, Optional[str]]:
+    """Запустить профилирование или остановить текущее (для сигнала)"""
+    if profiler.running:
+        profiler.stop()
+        return {"status": "stopping", "file": profiler.output_path}
+    path = profiler.start(seconds or config.PROFILE_DEFAULT_SECONDS)
+    return {"status": "started", "file": path}
+
+
+def install_profile_signal():
+    """SIGUSR1 запускает/останавливает профилирование (Unix, вызывать внутри event loop)"""
+    sigusr1 = getattr(signal, "SIGUSR1", None)
+    if sigusr1 is None:
+        return
+    try:
+        asyncio.get_running_loop().add_signal_handler(sigusr1, toggle_profiler)
+    except (NotImplementedError, RuntimeError, ValueError) as e:
+        # Windows или loop не в главном потоке
+        logger.debug("SIGUSR1 для профилирования недоступен: %s", e)
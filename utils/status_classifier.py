@@ -0,0 +1,122 @@
+"""
+Классификация статусов заявок.
+
+Таблица строится один раз при импорте из config (OKDESK_STATUS_MAPPING,
+RATING_REQUEST_STATUSES, ISSUE_STATUS_MESSAGES) и дальше не меняется:
+для любого кода или названия статуса из Okdesk она возвращает канонический
+статус и флаги is_open / is_completion / needs_rating за O(1).
+
+Неизвестные коды статусов ("not_done", "unclosed") сравниваются целиком и
+завершающими не считаются. По словам разбираются только названия статусов
+из нескольких слов ("Работа выполнена" - завершающий, "Не выполнена" - нет,
+отрицание отменяет совпадение). Результат запоминается.
+"""
+
+import re
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional
+
+import config
+
+_WORD_RE = re.compile(r"[^\W_]+")
+
+# Слова-отрицания в названиях статусов ("Не выполнена", "Not completed")
+_NEGATIONS = frozenset(("not", "no", "non", "не", "без"))
+
+# Максимум запомненных неизвестных статусов (защита от мусора во входящих данных)
+_MEMO_LIMIT = 1024
+
+
+class StatusInfo(NamedTuple):
+    """Результат классификации статуса"""
+    raw: str            # Код статуса из Okdesk
+    canonical: str      # Канонический статус (хранится в БД)
+    is_open: bool       # Заявка в работе
+    is_completion: bool  # Завершающий статус
+    needs_rating: bool  # При переходе в статус запрашивается оценка
+    text: str           # Текст для пользователя (ISSUE_STATUS_MESSAGES)
+
+
+def extract_status_code(status: Any) -> Optional[str]:
+    """Код статуса из ответа API (строка или объект с code/name)"""
+    if isinstance(status, dict):
+        return status.get("code") or status.get("name")
+    return status
+
+
+class StatusClassifier:
+    """Неизменяемая таблица классификации статусов"""
+
+    def __init__(self, status_mapping: Mapping[str, str], rating_statuses: Iterable[str],
+                 status_messages: Mapping[str, str], completion_statuses: Iterable[str] = ("closed",)):
+        self._mapping = MappingProxyType({key.lower(): value for key, value in status_mapping.items()})
+        self._rating = frozenset(status.lower() for status in rating_statuses)
+        self._completion = self._rating | frozenset(status.lower() for status in completion_statuses)
+        self._messages = MappingProxyType(dict(status_messages))
+
+        known = {}
+        for raw in list(status_mapping) + list(status_mapping.values()) + list(rating_statuses) + list(status_messages):
+            known[raw] = self._build(raw)
+        self._known = MappingProxyType(known)
+        self._known_lower = MappingProxyType({raw.lower(): info for raw, info in known.items()})
+        self._memo: Dict[str, StatusInfo] = {}
+
+    @classmethod
+    def from_config(cls) -> "StatusClassifier":
+        return cls(config.OKDESK_STATUS_MAPPING, config.RATING_REQUEST_STATUSES, config.ISSUE_STATUS_MESSAGES)
+
+    def _build(self, raw: str) -> StatusInfo:
+        canonical = self._mapping.get(raw.lower(), raw)
+        keys = {raw.lower(), canonical.lower()}
+        if not keys & self._completion and any(char.isspace() for char in raw.strip()):
+            # Название из нескольких слов: ищем целые слова, а не подстроки;
+            # коды (not_done, work_completed) сравниваются только целиком
+            words = set(_WORD_RE.findall(raw.lower()))
+            if not words & _NEGATIONS:
+                keys.update(words)
+        is_completion = bool(keys & self._completion)
+        return StatusInfo(
+            raw=raw,
+            canonical=canonical,
+            is_open=not is_completion,
+            is_completion=is_completion,
+            needs_rating=bool(keys & self._rating),
+            text=self._messages.get(canonical) or self._messages.get(raw, raw),
+        )
+
+    def classify(self, status: Any) -> StatusInfo:
+        """Классифицировать статус (строку или объект с code/name)"""
+        raw = extract_status_code(status)
+        raw = "" if raw is None else str(raw)
+        info = self._known.get(raw) or self._known_lower.get(raw.lower()) or self._memo.get(raw)
+        if info is None:
+            info = self._build(raw)
+            if len(self._memo) >= _MEMO_LIMIT:
+                self._memo.clear()
+            self._memo[raw] = info
+        return info
+
+    def normalize(self, status: Any) -> str:
+        """Канонический статус"""
+        return self.classify(status).canonical
+
+    def is_completion(self, status: Any) -> bool:
+        return self.classify(status).is_completion
+
+    def needs_rating(self, status: Any) -> bool:
+        return self.classify(status).needs_rating
+
+    def status_text(self, status: Any) -> str:
+        """Текст статуса для пользователя"""
+        return self.classify(status).text
+
+    def known_statuses(self, completion: bool) -> List[str]:
+        """
+        Все известные значения статуса (включая исходные коды, которые могли
+        сохраниться в БД до нормализации) с заданным флагом is_completion.
+        Используется для фильтров в запросах к БД.
+        """
+        return sorted(raw for raw, info in self._known.items() if info.is_completion == completion)
+
+
+status_classifier = StatusClassifier.from_config()
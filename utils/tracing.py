@@ -0,0 +1,356 @@
+"""
+Трассировка обработки событий: webhook -> БД -> Okdesk -> Telegram.
+
+Каждое событие Okdesk получает трассу с correlation id (из заголовка
+X-Correlation-Id / X-Request-Id или сгенерированный), а этапы обработки -
+вложенные span'ы:
+
+    with tracing.start_trace("webhook comment.created", correlation_id=cid, issue_id=123):
+        with tracing.span("download_attachment", attachment_id=5):
+            ...
+
+Экспорт (TRACING_EXPORTER):
+- none    - трассировка выключена, span() ничего не делает;
+- console - по завершении трассы в лог пишется разбивка времени по этапам
+            (отдельные span'ы - на уровне DEBUG);
+- file    - span'ы в JSON Lines (поля как в OTLP/JSON) в TRACING_FILE
+            (сериализация и запись - в фоновом потоке, не в event loop);
+- otel    - дополнительно создаются span'ы OpenTelemetry (если установлен
+            opentelemetry-api и настроен SDK), иначе как console.
+
+Разбивка последних трасс доступна через recent_traces() (endpoint /traces
+webhook сервера). Пока трасса активна, в записи логов добавляются
+ctx_trace_id и ctx_correlation_id (видны в LOG_FORMAT=json).
+"""
+
+import atexit
+import functools
+import logging
+import queue
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+import config
+from utils import json_codec
+
+logger = logging.getLogger(__name__)
+
+# Ограничение на число span'ов в одной трассе (защита от циклов с запросами к БД)
+_MAX_SPANS_PER_TRACE = 1000
+
+
+def _new_id(length: int) -> str:
+    return secrets.token_hex(length // 2)
+
+
+class Trace:
+    """Трасса одного события: общий trace_id, correlation id и завершенные span'ы"""
+
+    __slots__ = ("trace_id", "correlation_id", "spans", "dropped")
+
+    def __init__(self, correlation_id: str = None):
+        self.trace_id = _new_id(32)
+        self.correlation_id = correlation_id or self.trace_id[:16]
+        self.spans: List["Span"] = []
+        self.dropped = 0
+
+    def add(self, span: "Span"):
+        if len(self.spans) < _MAX_SPANS_PER_TRACE:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+
+    def breakdown(self) -> Dict[str, Dict[str, float]]:
+        """Время по этапам (имя span'а -> суммарные ms и количество), корневой span не включается"""
+        stages: Dict[str, Dict[str, float]] = {}
+        for span in self.spans:
+            if span.parent_id is None:
+                continue
+            stage = stages.setdefault(span.name, {"ms": 0.0, "count": 0})
+            stage["ms"] += span.duration_ms
+            stage["count"] += 1
+        for stage in stages.values():
+            stage["ms"] = round(stage["ms"], 2)
+        return stages
+
+
+class Span:
+    """Этап обработки"""
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = _new_id(16)
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Представление в духе OTLP/JSON"""
+        attributes = dict(self.attributes, correlation_id=self.trace.correlation_id)
+        return {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "attributes": attributes,
+            "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "OK"},
+        }
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("tracing_span", default=None)
+
+_exporter = config.TRACING_EXPORTER if config.TRACING_EXPORTER in ("console", "file", "otel") else "none"
+_recent: "deque[Dict[str, Any]]" = deque(maxlen=max(config.TRACING_RECENT_SIZE, 1))
+_otel_tracer = None
+
+
+class _TraceFileWriter:
+    """
+    Запись span'ов в TRACING_FILE отдельным потоком: event loop только кладет
+    трассу в очередь (при переполнении она отбрасывается, как записи логов).
+    """
+
+    def __init__(self, path: str, maxsize: int):
+        self.path = path
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[List[Dict[str, Any]]]]" = queue.Queue(maxsize=maxsize)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, spans: List[Dict[str, Any]]):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-file-writer", daemon=True)
+                    self._thread.start()
+                    atexit.register(self.close)
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout: float = 5.0):
+        """Дописать очередь и остановить поток (при завершении процесса)"""
+        if self._thread is not None and self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                return
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            spans = self._queue.get()
+            if spans is None:
+                return
+            batch = [spans]
+            # Все, что накопилось, - одной записью в файл
+            while len(batch) < 100:
+                try:
+                    spans = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if spans is None:
+                    self._write(batch)
+                    return
+                batch.append(spans)
+            self._write(batch)
+
+    def _write(self, batch: List[List[Dict[str, Any]]]):
+        lines = "".join(json_codec.dumps(span) + "\n" for spans in batch for span in spans)
+        try:
+            with open(self.path, "a", encoding="utf-8") as trace_file:
+                trace_file.write(lines)
+        except OSError as e:
+            logger.error("❌ Не удалось записать трассу в %s: %s", self.path, e)
+
+
+_file_writer = _TraceFileWriter(config.TRACING_FILE, config.LOG_QUEUE_SIZE) if _exporter == "file" else None
+
+if _exporter == "otel":
+    try:
+        from opentelemetry import trace as otel_trace
+        _otel_tracer = otel_trace.get_tracer("okdesk_bot")
+    except ImportError:
+        logger.warning("⚠️ TRACING_EXPORTER=otel, но opentelemetry не установлен, используем console")
+        _exporter = "console"
+
+
+def is_enabled() -> bool:
+    return _exporter != "none"
+
+
+def current_trace() -> Optional[Trace]:
+    span = _current_span.get()
+    return span.trace if span else None
+
+
+def current_correlation_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.trace.correlation_id if span else None
+
+
+@contextmanager
+def _otel_span(name: str, attributes: Dict[str, Any], correlation_id: str):
+    if _otel_tracer is None:
+        yield
+        return
+    otel_attributes = {key: value for key, value in attributes.items()
+                       if isinstance(value, (str, bool, int, float))}
+    otel_attributes["correlation_id"] = correlation_id
+    with _otel_tracer.start_as_current_span(name, attributes=otel_attributes):
+        yield
+
+
+@contextmanager
+def _run_span(trace: Trace, name: str, parent: Optional[Span], attributes: Dict[str, Any]) -> Iterator[Span]:
+    span = Span(trace, name, parent.span_id if parent else None, attributes)
+    token = _current_span.set(span)
+    try:
+        with _otel_span(name, attributes, trace.correlation_id):
+            yield span
+    except BaseException as e:
+        span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        span.end_ns = time.time_ns()
+        _current_span.reset(token)
+        trace.add(span)
+        if parent is None:
+            _finish_trace(trace, span)
+
+
+@contextmanager
+def start_trace(name: str, correlation_id: str = None, **attributes) -> Iterator[Optional[Span]]:
+    """
+    Начать трассу события (корневой span). Внутри уже открытой трассы
+    работает как обычный span.
+    """
+    if _exporter == "none":
+        yield None
+        return
+    parent = _current_span.get()
+    trace = parent.trace if parent else Trace(correlation_id)
+    with _run_span(trace, name, parent, attributes) as span:
+        yield span
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """Span этапа внутри текущей трассы (вне трассы ничего не делает)"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    with _run_span(parent.trace, name, parent, attributes) as current:
+        yield current
+
+
+def traced(name: str = None):
+    """Декоратор корутины: вызов оформляется span'ом текущей трассы"""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if _current_span.get() is None:
+                return await func(*args, **kwargs)
+            with span(span_name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_span(name: str, duration: float, **attributes):
+    """
+    Добавить уже завершившийся этап длительностью duration секунд
+    (для мест, где время и так замеряется: SQL-запросы, запросы к API).
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return
+    end_ns = time.time_ns()
+    span = Span(parent.trace, name, parent.span_id, attributes)
+    span.start_ns = end_ns - int(duration * 1e9)
+    span.end_ns = end_ns
+    parent.trace.add(span)
+
+
+def _finish_trace(trace: Trace, root: Span):
+    breakdown = trace.breakdown()
+    summary = {
+        "trace_id": trace.trace_id,
+        "correlation_id": trace.correlation_id,
+        "name": root.name,
+        "total_ms": round(root.duration_ms, 2),
+        "error": root.error,
+        "attributes": root.attributes,
+        "stages": breakdown,
+        "dropped_spans": trace.dropped,
+    }
+    _recent.append(summary)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        for span in trace.spans:
+            logger.debug("🧭 span %s %s %.1f ms %s", trace.correlation_id, span.name, span.duration_ms, span.attributes)
+    stages = ", ".join(f"{name}={stage['ms']:.1f}ms×{stage['count']}" for name, stage in breakdown.items())
+    logger.info("🧭 Трасса %s %s: %.1f ms (%s)", trace.correlation_id, root.name, root.duration_ms, stages or "без этапов")
+
+    if _file_writer is not None:
+        _file_writer.submit([span.to_dict() for span in trace.spans])
+
+
+def recent_traces(correlation_id: str = None, limit: int = 50) -> List[Dict[str, Any]]:
+    """Последние завершенные трассы (новые первыми) с разбивкой по этапам"""
+    result = []
+    for summary in reversed(_recent):
+        if correlation_id and correlation_id not in (summary["correlation_id"], summary["trace_id"]):
+            continue
+        result.append(summary)
+        if len(result) >= limit:
+            break
+    return result
+
+
+class TraceContextFilter(logging.Filter):
+    """Добавляет в записи логов trace_id и correlation_id активной трассы"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        span = _current_span.get()
+        if span is not None:
+            record.ctx_trace_id = span.trace.trace_id
+            record.ctx_correlation_id = span.trace.correlation_id
+        return True
+
+
+def correlation_id_from_headers(headers) -> Optional[str]:
+    """Correlation id, переданный вызывающей стороной"""
+    value = headers.get("X-Correlation-Id") or headers.get("X-Request-Id")
+    if value:
+        return value.strip()[:128] or None
+    return None
+
+
+def new_correlation_id(prefix: Any = None) -> str:
+    """Сгенерировать correlation id (с префиксом, например номером заявки)"""
+    suffix = _new_id(12)
+    return f"{prefix}-{suffix}" if prefix not in (None, "") else suffix
@@ -0,0 +1,65 @@
+"""
+Небольшой потокобезопасный LRU-кэш с ограничением времени жизни записей.
+
+Общий для кэшей процесса: пользователей по telegram_id
+(database/user_cache.py), login-ссылок портала по contact_id
+(services/portal_links.py) и объектов обслуживания по company_id
+(services/service_objects.py).
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Tuple
+
+
+class TTLCache:
+    """LRU-кэш с ограничением времени жизни записей"""
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._items: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        # Инвалидация вызывается и из потоков (asyncio.to_thread)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """
+        Получить значение из кэша.
+
+        Returns:
+            Tuple[bool, Any]: (найдено ли значение, значение). Значение None
+            тоже кэшируется, поэтому отсутствие записи отличается по флагу.
+        """
+        if self.ttl <= 0:
+            return False, None
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return False, None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._items[key]
+                return False, None
+            self._items.move_to_end(key)
+            return True, value
+
+    def set(self, key: Hashable, value: Any):
+        """Сохранить значение"""
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        """Удалить запись"""
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        """Очистить кэш"""
+        with self._lock:
+            self._items.clear()
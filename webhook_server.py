@@ -1,36 +1,110 @@
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, HTTPException, Response
 from pydantic import BaseModel
 from typing import Dict, Any, Optional, List
-import json
+from functools import partial
+from pathlib import Path
 import hmac
 import hashlib
+import time
 from database.crud import IssueService, CommentService, UserService
-from models.database import create_tables, Issue
-from services.okdesk_api import OkdeskAPI
+from database.unit_of_work import after_commit, run_unit_of_work
+from models.database import create_tables, get_pool_metrics
+from services.okdesk_api import OkdeskAPI, enable_shared_session, close_shared_session
+from services.portal_links import portal_links
+from services.webhook_recorder import webhook_recorder
+from utils import json_codec
+from utils.logging_setup import setup_logging, log_payload, LazyPayload
+from utils import metrics, tracing
+from utils.profiling import profiler, loop_monitor, install_profile_signal
+from utils.status_classifier import status_classifier
+from utils.html_converter import html_to_telegram
 import config
+import logging
+
+setup_logging()
+logger = logging.getLogger("webhook_server")
+# Отдельная категория для дампов payload webhook'ов
+payload_logger = logging.getLogger("webhook_server.payload")
 
 # Импорт бота с защитой от исключений
 try:
-    from bot import bot
+    from bot import bot, dp
     BOT_AVAILABLE = True
 except ImportError:
-    print("⚠️ Bot не доступен в webhook_server")
+    logger.warning("⚠️ Bot не доступен в webhook_server")
     bot = None
+    dp = None
     BOT_AVAILABLE = False
-import re
+import asyncio
 
 # Инициализируем базу данных при запуске (подключаемся к общей базе)
 try:
     if create_tables():
-        print("✅ Webhook сервер подключен к общей базе данных")
+        logger.info("✅ Webhook сервер подключен к общей базе данных")
     else:
-        print("⚠️ Проблемы с базой данных, но продолжаем работу")
+        logger.warning("⚠️ Проблемы с базой данных, но продолжаем работу")
 except Exception as e:
-    print(f"❌ Критическая ошибка базы данных: {e}")
+    logger.error("❌ Критическая ошибка базы данных: %s", e)
     # Не останавливаем сервер, продолжаем работу
 
 app = FastAPI()
 
+# Фоновая сверка статусов заявок (создается при старте сервера)
+reconciler = None
+
+# Фоновые задачи обработки Telegram updates (храним ссылки, чтобы их не собрал GC)
+telegram_update_tasks = set()
+# False после начала остановки: новые updates не принимаются (Telegram их повторит)
+accepting_telegram_updates = True
+metrics.QUEUE_DEPTH.set_function(lambda: len(telegram_update_tasks), "telegram_updates")
+
+# В совмещенном режиме (start.py --combined) общие ресурсы - HTTP-сессию,
+# контроль задержек loop и хранилище FSM - закрывает run_combined() после
+# остановки polling, а не lifespan uvicorn (он завершается раньше)
+SHARED_RESOURCES_EXTERNAL = False
+
+# События Okdesk, которые попадают в метрики под своим именем (остальные - "other")
+KNOWN_WEBHOOK_EVENTS = frozenset((
+    "issue.created", "new_ticket", "issue.updated", "issue.status_changed", "comment.created", "new_comment",
+))
+
+@app.on_event("startup")
+async def start_background_tasks():
+    """Запуск фоновой сверки статусов заявок с Okdesk и регистрация Telegram webhook"""
+    global reconciler
+    # Одна HTTP-сессия к Okdesk на весь процесс
+    enable_shared_session()
+    loop_monitor.start()
+    install_profile_signal()
+    if config.TELEGRAM_MODE == "webhook":
+        await setup_telegram_webhook()
+    if config.RECONCILE_ENABLED:
+        from services.issue_reconciler import IssueReconciler
+        reconciler = IssueReconciler(on_status_change=handle_reconciled_status_change)
+        reconciler.start()
+
+async def handle_reconciled_status_change(data: Dict[str, Any]):
+    """Изменение статуса, найденное сверкой: одна транзакция на заявку, как и для webhook'ов"""
+    issue_id = data.get("id")
+    with tracing.start_trace("reconcile status_changed", correlation_id=tracing.new_correlation_id(issue_id),
+                             issue_id=issue_id):
+        await run_unit_of_work(handle_status_changed, data)
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    """Остановка фоновых задач"""
+    if reconciler:
+        await reconciler.stop()
+    await webhook_recorder.close()
+    await drain_telegram_updates()
+    if SHARED_RESOURCES_EXTERNAL:
+        return
+    await loop_monitor.stop()
+    if config.TELEGRAM_MODE == "webhook" and dp:
+        # В режиме polling хранилище FSM закрывает сам диспетчер
+        await dp.storage.close()
+    await close_shared_session()
+
 @app.get("/")
 async def root():
     """Корневой endpoint для проверки работы сервера"""
@@ -41,35 +115,129 @@ async def webhook_info():
     """Информация о webhook endpoint"""
     return {"message": "Webhook endpoint is ready", "path": config.WEBHOOK_PATH}
 
+async def setup_telegram_webhook():
+    """Зарегистрировать webhook бота в Telegram (повторная регистрация безопасна)"""
+    if not BOT_AVAILABLE or not bot:
+        logger.error("❌ TELEGRAM_MODE=webhook, но бот недоступен")
+        return
+    if not config.TELEGRAM_WEBHOOK_URL:
+        logger.error("❌ TELEGRAM_MODE=webhook, но не задан TELEGRAM_WEBHOOK_URL (или WEBHOOK_URL)")
+        return
+    try:
+        await bot.set_webhook(
+            url=config.TELEGRAM_WEBHOOK_URL,
+            secret_token=config.TELEGRAM_WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        logger.info("✅ Telegram webhook зарегистрирован: %s", config.TELEGRAM_WEBHOOK_URL)
+    except Exception as e:
+        logger.error("❌ Не удалось зарегистрировать Telegram webhook: %s", e)
+
+async def drain_telegram_updates(timeout: float = None):
+    """Перестать принимать Telegram updates и дождаться обработки принятых
+
+    Telegram уже получил ответ 200 на эти updates и не пришлет их повторно,
+    поэтому хранилище FSM и HTTP-сессию можно закрывать только после них.
+    Не успевшие за timeout секунд задачи отменяются.
+    """
+    global accepting_telegram_updates
+    accepting_telegram_updates = False
+    if not telegram_update_tasks:
+        return
+    timeout = config.TELEGRAM_UPDATE_DRAIN_TIMEOUT if timeout is None else timeout
+    logger.info("⏳ Ожидаем обработки %d Telegram updates (до %g с)", len(telegram_update_tasks), timeout)
+    _, pending = await asyncio.wait(set(telegram_update_tasks), timeout=timeout)
+    if pending:
+        logger.warning("⚠️ Отменяем %d необработанных Telegram updates", len(pending))
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+async def process_telegram_update(update):
+    """Обработка Telegram update диспетчером aiogram"""
+    try:
+        await dp.feed_update(bot, update)
+    except Exception as e:
+        logger.exception("❌ Ошибка обработки Telegram update %s: %s", update.update_id, e)
+
+@app.post(config.TELEGRAM_WEBHOOK_PATH)
+async def telegram_webhook_handler(request: Request):
+    """Прием Telegram updates в режиме TELEGRAM_MODE=webhook"""
+    if config.TELEGRAM_MODE != "webhook" or not BOT_AVAILABLE or not dp:
+        raise HTTPException(status_code=404, detail="Not found")
+    
+    # Telegram передает секрет, указанный в set_webhook, в этом заголовке
+    secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not config.TELEGRAM_WEBHOOK_SECRET or not hmac.compare_digest(secret, config.TELEGRAM_WEBHOOK_SECRET):
+        raise HTTPException(status_code=403, detail="Invalid secret token")
+    if not accepting_telegram_updates:
+        # Сервер останавливается: Telegram повторит доставку позже
+        raise HTTPException(status_code=503, detail="Shutting down")
+    
+    from aiogram.types import Update
+    try:
+        update = Update.model_validate(json_codec.loads(await request.body()), context={"bot": bot})
+    except Exception as e:
+        logger.error("❌ Некорректный Telegram update: %s", e)
+        raise HTTPException(status_code=400, detail="Invalid update")
+    
+    # Отвечаем Telegram сразу, обработка идет в фоне (иначе Telegram повторит доставку)
+    task = asyncio.create_task(process_telegram_update(update))
+    telegram_update_tasks.add(task)
+    task.add_done_callback(telegram_update_tasks.discard)
+    return {"ok": True}
+
 class WebhookData(BaseModel):
     """Модель данных вебхука"""
     event: str
     data: Dict[str, Any]
     timestamp: Optional[int] = None
 
+def get_event_issue_id(data: Dict[str, Any]) -> Optional[int]:
+    """ID заявки из webhook'а Okdesk (для correlation id и атрибутов трассы)"""
+    for container in (data.get("issue"), data.get("data"), data):
+        if isinstance(container, dict):
+            issue = container.get("issue")
+            if isinstance(issue, dict) and issue.get("id"):
+                return issue["id"]
+            if container is not data and container.get("id"):
+                return container["id"]
+    return None
+
 @app.post(config.WEBHOOK_PATH)
-async def webhook_handler(request: Request):
+async def webhook_handler(request: Request, response: Response):
     """Обработчик вебхуков от Okdesk"""
+    received_at = time.time()
+    started = time.perf_counter()
+    body = await request.body()
+    try:
+        return await process_okdesk_webhook(request, response, body)
+    finally:
+        if webhook_recorder.enabled:
+            webhook_recorder.record(body, request.url.path, request.headers.get("X-Okdesk-Signature"),
+                                    received_at, time.perf_counter() - started)
+
+async def process_okdesk_webhook(request: Request, response: Response, body: bytes):
+    """Обработка тела webhook'а Okdesk"""
     
-    print(f"🎣 Webhook received at {config.WEBHOOK_PATH}")
+    logger.info("🎣 Webhook received at %s", config.WEBHOOK_PATH)
     
     try:
-        # Получаем тело запроса
-        body = await request.body()
-        print(f"🎣 Получен webhook (raw): {body.decode('utf-8')}")
+        log_payload(payload_logger, "🎣 Получен webhook (raw)", body)
         
-        # Пробуем парсить JSON
+        # Разбираем JSON напрямую из bytes (без decode и повторной сериализации)
         try:
-            data = json.loads(body.decode('utf-8'))
-            print(f"📄 Parsed JSON: {json.dumps(data, indent=2, ensure_ascii=False)}")
+            data = json_codec.loads(body)
         except Exception as e:
-            print(f"❌ Ошибка парсинга JSON: {e}")
+            logger.error("❌ Ошибка парсинга JSON: %s", e)
+            metrics.WEBHOOK_EVENTS.inc("unknown", "invalid_json")
             return {"message": "Webhook received", "error": "Invalid JSON"}
         
         # Проверяем подпись вебхука (только если настроен секретный ключ)
         if config.WEBHOOK_SECRET and config.WEBHOOK_SECRET.strip():
             signature = request.headers.get("X-Okdesk-Signature")
             if not verify_webhook_signature(body, signature):
+                metrics.WEBHOOK_EVENTS.inc("unknown", "invalid_signature")
                 raise HTTPException(status_code=403, detail="Invalid signature")
         
         # Определяем тип события
@@ -78,49 +246,68 @@ async def webhook_handler(request: Request):
             event = event.get("event_type", "unknown")
         
         event_data = data.get("data", data)
+        event_label = event if event in KNOWN_WEBHOOK_EVENTS else "other"
         
-        print(f"📊 Event: {event}")
-        print(f"📊 All data keys: {list(data.keys())}")
-        print(f"📊 Event data keys: {list(event_data.keys())}")
+        logger.info("📊 Event: %s", event)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("📊 All data keys: %s", list(data.keys()))
+            logger.debug("📊 Event data keys: %s", list(event_data.keys()))
+        
+        # Трасса события: correlation id от Okdesk (если передан) или новый с номером заявки
+        issue_id = get_event_issue_id(data)
+        correlation_id = tracing.correlation_id_from_headers(request.headers) or tracing.new_correlation_id(issue_id)
+        if tracing.is_enabled():
+            response.headers["X-Correlation-Id"] = correlation_id
         
         try:
-            if event == "issue.created" or event == "new_ticket":
-                print(f"🎫 Обработка создания заявки")
-                await handle_issue_created(data.get("issue", event_data))
-            elif event == "issue.updated":
-                print(f"🔄 Обработка обновления заявки")
-                await handle_issue_updated(data.get("issue", event_data))
-            elif event == "issue.status_changed":
-                print(f"� Обработка изменения статуса заявки")
-                await handle_status_changed(data.get("issue", event_data))
-            elif event == "comment.created" or event == "new_comment":
-                print(f"� Обработка создания комментария")
-                await handle_comment_created(data)
-            else:
-                print(f"❓ Неизвестное событие: {event}")
-                print(f"📄 Данные события: {json.dumps(event_data, indent=2, ensure_ascii=False)}")
-                
-                # Анализируем структуру данных для автоматического определения типа события
-                if "issue" in data and "status" in str(data.get("issue", {})):
-                    print("🔄 Обнаружены данные о статусе заявки, обрабатываем как изменение статуса...")
-                    await handle_status_changed(data.get("issue", event_data))
-                elif "comment" in str(data).lower() or "content" in str(data).lower():
-                    print("🔄 Обнаружены данные комментария, обрабатываем как комментарий...")
-                    await handle_comment_created(data)
-                elif "status" in str(data).lower() or "state" in str(data).lower():
-                    print("🔄 Обнаружены данные статуса, обрабатываем как изменение статуса...")
-                    await handle_status_changed(event_data)
+            # Все изменения в БД по событию - одной транзакцией, уведомления - после фиксации
+            with tracing.start_trace(f"webhook {event_label}", correlation_id=correlation_id,
+                                     event=event, issue_id=issue_id):
+                await run_unit_of_work(dispatch_okdesk_event, event, data, event_data)
             
+            metrics.WEBHOOK_EVENTS.inc(event_label, "success")
             return {"status": "success", "event": event}
         
         except Exception as e:
-            print(f"❌ Webhook processing error: {e}")
+            logger.error("❌ Webhook processing error: %s", e)
+            metrics.WEBHOOK_EVENTS.inc(event_label, "error")
             return {"status": "error", "message": str(e)}
     
     except Exception as e:
-        print(f"❌ Request processing error: {e}")
+        logger.error("❌ Request processing error: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
+async def dispatch_okdesk_event(event: str, data: Dict[str, Any], event_data: Dict[str, Any]):
+    """Передать событие Okdesk обработчику (вызывается в единице работы)"""
+    if event == "issue.created" or event == "new_ticket":
+        logger.info("🎫 Обработка создания заявки")
+        await handle_issue_created(data.get("issue", event_data))
+    elif event == "issue.updated":
+        logger.info("🔄 Обработка обновления заявки")
+        await handle_issue_updated(data.get("issue", event_data))
+    elif event == "issue.status_changed":
+        logger.info("📊 Обработка изменения статуса заявки")
+        await handle_status_changed(data.get("issue", event_data))
+    elif event == "comment.created" or event == "new_comment":
+        logger.info("💬 Обработка создания комментария")
+        await handle_comment_created(data)
+    else:
+        logger.info("❓ Неизвестное событие: %s", event)
+        log_payload(payload_logger, "📄 Данные события", event_data, level=logging.INFO)
+
+        # Анализируем структуру данных для автоматического определения типа события
+        if "issue" in data and "status" in str(data.get("issue", {})):
+            logger.info("🔄 Обнаружены данные о статусе заявки, обрабатываем как изменение статуса...")
+            await handle_status_changed(data.get("issue", event_data))
+        elif "comment" in str(data).lower() or "content" in str(data).lower():
+            logger.info("🔄 Обнаружены данные комментария, обрабатываем как комментарий...")
+            await handle_comment_created(data)
+        elif "status" in str(data).lower() or "state" in str(data).lower():
+            logger.info("🔄 Обнаружены данные статуса, обрабатываем как изменение статуса...")
+            await handle_status_changed(event_data)
+
+@metrics.HANDLER_SECONDS.timed("handle_issue_created")
+@tracing.traced()
 async def handle_issue_created(data: Dict[str, Any]):
     """Обработка создания заявки"""
     issue_id = data.get("id")
@@ -130,55 +317,59 @@ async def handle_issue_created(data: Dict[str, Any]):
     # Проверяем, есть ли такая заявка в нашей БД
     issue = IssueService.get_issue_by_okdesk_id(issue_id)
     if issue:
-        print(f"Issue {issue_id} already exists in database")
+        logger.debug("Issue %s already exists in database", issue_id)
         return
     
-    print(f"New issue created in Okdesk: {issue_id}")
+    logger.info("New issue created in Okdesk: %s", issue_id)
 
+@metrics.HANDLER_SECONDS.timed("handle_issue_updated")
+@tracing.traced()
 async def handle_issue_updated(data: Dict[str, Any]):
     """Обработка обновления заявки"""
-    print(f"🔄 Обработка обновления заявки: {json.dumps(data, indent=2, ensure_ascii=False)}")
+    log_payload(payload_logger, "🔄 Обработка обновления заявки", data)
 
     issue_id = data.get("id")
     if not issue_id:
-        print("❌ Не найден ID заявки в данных обновления")
+        logger.error("❌ Не найден ID заявки в данных обновления")
         return
 
     # Находим заявку в нашей БД
     issue = IssueService.get_issue_by_okdesk_id(issue_id)
     if not issue:
-        print(f"❌ Заявка {issue_id} не найдена в базе данных")
+        logger.error("❌ Заявка %s не найдена в базе данных", issue_id)
         return
 
     # Обновляем статус, если изменился
+    old_status = issue.status
     new_status = data.get("status")
-    if isinstance(new_status, dict):
-        new_status = new_status.get("code", new_status)
+    if new_status:
+        new_status = status_classifier.normalize(new_status)
     
-    print(f"🔍 Новый статус из webhook: {new_status} (тип: {type(new_status)})")
-    print(f"🔍 Текущий статус в БД: {issue.status}")
+    logger.debug("🔍 Новый статус из webhook: %s (тип: %s)", new_status, type(new_status))
+    logger.debug("🔍 Текущий статус в БД: %s", issue.status)
     
     if new_status and new_status != issue.status:
-        print(f"📊 Статус заявки {issue_id} изменился: {issue.status} -> {new_status}")
+        logger.info("📊 Статус заявки %s изменился: %s -> %s", issue_id, issue.status, new_status)
 
         updated_issue = IssueService.update_issue_status(issue.id, new_status)
         if updated_issue:
-            print(f"✅ Статус заявки {issue_id} обновлен в БД")
+            logger.info("✅ Статус заявки %s обновлен в БД", issue_id)
 
-            # Уведомляем пользователя о смене статуса
-            await notify_user_status_change(updated_issue, new_status, issue.status)
-            print(f"✅ Пользователь уведомлен об изменении статуса")
+            # Уведомляем пользователя о смене статуса (после фиксации транзакции)
+            await after_commit(partial(notify_user_status_change, updated_issue, new_status, old_status))
         else:
-            print(f"❌ Не удалось обновить статус заявки {issue_id} в БД")
+            logger.error("❌ Не удалось обновить статус заявки %s в БД", issue_id)
     else:
-        print(f"ℹ️ Статус заявки {issue_id} не изменился или не указан")
+        logger.info("ℹ️ Статус заявки %s не изменился или не указан", issue_id)
 
-    print(f"Issue {issue_id} updated")
+    logger.debug("Issue %s updated", issue_id)
 
+@metrics.HANDLER_SECONDS.timed("handle_comment_created")
+@tracing.traced()
 async def handle_comment_created(data: Dict[str, Any]):
     """Обработка создания комментария"""
     try:
-        print(f"🔍 Полные данные комментария: {json.dumps(data, indent=2, ensure_ascii=False)}")
+        log_payload(payload_logger, "🔍 Полные данные комментария", data)
         
         # Извлекаем данные из структуры webhook
         event_data = data.get("event", data)
@@ -186,9 +377,10 @@ async def handle_comment_created(data: Dict[str, Any]):
         comment_data = event_data.get("comment", {})
         author_data = event_data.get("author", {})
         
-        print(f"🔍 event_data keys: {list(event_data.keys())}")
-        print(f"🔍 issue_data keys: {list(issue_data.keys())}")
-        print(f"🔍 comment_data keys: {list(comment_data.keys())}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("🔍 event_data keys: %s", list(event_data.keys()))
+            logger.debug("🔍 issue_data keys: %s", list(issue_data.keys()))
+            logger.debug("🔍 comment_data keys: %s", list(comment_data.keys()))
         
         # Получаем ID и содержимое
         issue_id = issue_data.get("id")
@@ -202,10 +394,7 @@ async def handle_comment_created(data: Dict[str, Any]):
         elif is_public is None:
             is_public = False
         
-        print(f"🔍 Поля comment_data: {list(comment_data.keys())}")
-        print(f"🔍 Значение public (raw): {comment_data.get('is_public', 'NOT_SET')}")
-        print(f"🔍 Значение public (processed): {is_public}")
-        print(f"🔍 Тип значения public: {type(comment_data.get('is_public'))}")
+        logger.debug("🔍 Значение public: raw=%r, processed=%s", comment_data.get('is_public', 'NOT_SET'), is_public)
         
         # Формируем имя автора
         author_name = "Неизвестен"
@@ -214,55 +403,55 @@ async def handle_comment_created(data: Dict[str, Any]):
             last_name = author_data.get("last_name", "")
             author_name = f"{first_name} {last_name}".strip()
         
-        print(f"📝 Получен комментарий:")
-        print(f"   🎫 Заявка ID: {issue_id}")
-        print(f"   💬 Комментарий ID: {comment_id}")
-        print(f"   📄 Содержимое (очищенное): {clean_html_content(content)[:100]}{'...' if len(clean_html_content(content)) > 100 else ''}")
-        print(f"   👤 Автор: {author_name}")
-        print(f"   🌐 Публичный: {is_public}")
+        logger.info("📝 Получен комментарий %s к заявке %s от %s (публичный: %s)",
+                    comment_id, issue_id, author_name, is_public)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("📄 Содержимое (очищенное): %s", html_to_telegram(content, 100))
         
         if not all([issue_id, comment_id, content]):
-            print("❌ Недостаточно данных для обработки комментария")
+            logger.error("❌ Недостаточно данных для обработки комментария")
             return
         
         # Проверяем, является ли комментарий публичным
         if not is_public:
-            print(f"🔒 Комментарий {comment_id} является внутренним (не публичным), уведомление клиенту не отправляется")
+            logger.info("🔒 Комментарий %s является внутренним (не публичным), уведомление клиенту не отправляется", comment_id)
             return
         
         # Находим заявку в нашей БД
         issue = IssueService.get_issue_by_okdesk_id(issue_id)
         if not issue:
-            print(f"❌ Заявка {issue_id} не найдена в базе данных")
+            logger.error("❌ Заявка %s не найдена в базе данных", issue_id)
             
-            # Отладочная информация
-            print(f"🔍 Ищем в базе данных по пути: {config.DATABASE_URL}")
-            all_issues = IssueService.get_all_issues()
-            print(f"📊 Всего заявок в БД: {len(all_issues)}")
-            if all_issues:
-                print("📋 Последние заявки в БД:")
+            # Отладочная информация (выборка всех заявок - только на DEBUG)
+            if logger.isEnabledFor(logging.DEBUG):
+                all_issues = IssueService.get_all_issues()
+                logger.debug("📊 Всего заявок в БД: %s", len(all_issues))
                 for i in all_issues[-3:]:  # Показываем последние 3
-                    print(f"   - ID: {i.okdesk_issue_id}, Title: {i.title}")
+                    logger.debug("   - ID: %s, Title: %s", i.okdesk_issue_id, i.title)
             
             return
         
-        print(f"✅ Заявка найдена в БД: {issue.title}")
+        logger.info("✅ Заявка найдена в БД: %s", issue.title)
         
         # Проверяем, не наш ли это комментарий (чтобы избежать дублирования)
         existing_comments = CommentService.get_issue_comments(issue.id)
         for comment in existing_comments:
             if comment.okdesk_comment_id == comment_id:
-                print(f"⚠️ Комментарий {comment_id} уже существует")
+                logger.warning("⚠️ Комментарий %s уже существует", comment_id)
                 return
         
-        # Добавляем комментарий в БД
-        CommentService.add_comment(
+        # Добавляем комментарий в БД (уникальный okdesk_comment_id защищает от
+        # повторной или параллельной доставки того же события)
+        comment = CommentService.add_comment(
             issue_id=issue.id,
             telegram_user_id=issue.telegram_user_id,
             content=content,
             okdesk_comment_id=comment_id,
             is_from_okdesk=True
         )
+        if comment is None:
+            logger.warning("⚠️ Комментарий %s уже существует", comment_id)
+            return
         
         # Проверяем наличие вложений в комментарии или в заявке
         # В webhook данные вложения могут быть как в comment.attachments, так и в issue.attachments, так и в event.attachments
@@ -271,91 +460,74 @@ async def handle_comment_created(data: Dict[str, Any]):
         event_attachments = event_data.get("attachments", [])
         attachments = comment_attachments or issue_attachments or event_attachments
 
-        print(f"🔍 comment_attachments: {len(comment_attachments)} элементов")
-        print(f"🔍 issue_attachments: {len(issue_attachments)} элементов")
-        print(f"🔍 event_attachments: {len(event_attachments)} элементов")
+        logger.debug("🔍 Вложения: comment=%s, issue=%s, event=%s",
+                     len(comment_attachments), len(issue_attachments), len(event_attachments))
 
         if attachments:
-            print(f"📎 Найдено {len(attachments)} вложений в комментарии/заявке")
-            for i, attachment in enumerate(attachments):
-                print(f"   📎 Вложение {i+1}: {attachment}")
-                print(f"      ID: {attachment.get('id')}")
-                print(f"      Filename: {attachment.get('filename', attachment.get('attachment_file_name', attachment.get('name', 'unknown')))}")
-                print(f"      Size: {attachment.get('size', attachment.get('attachment_file_size', 0))}")
-                print(f"      URL: {attachment.get('url', 'no url')}")
+            logger.info("📎 Найдено %s вложений в комментарии/заявке", len(attachments))
+            log_payload(payload_logger, "📎 Вложения", attachments)
         else:
-            print(f"📎 Вложений в комментарии и заявке не найдено")
-            print(f"🔍 Доступные поля comment_data: {list(comment_data.keys())}")
-            print(f"🔍 Доступные поля issue_data: {list(issue_data.keys())}")
-            print(f"🔍 Доступные поля event_data: {list(event_data.keys())}")
-            if issue_attachments:
-                print(f"⚠️ issue_attachments не пустой, но не используется: {issue_attachments}")
-            if comment_attachments:
-                print(f"⚠️ comment_attachments не пустой, но не используется: {comment_attachments}")
-            if event_attachments:
-                print(f"⚠️ event_attachments не пустой, но не используется: {event_attachments}")
+            logger.debug("📎 Вложений в комментарии и заявке не найдено")
         
         # Проверяем, изменился ли статус заявки при добавлении комментария
         current_status = issue_data.get("status")
-        if isinstance(current_status, dict):
-            current_status = current_status.get("code", current_status)
+        if current_status:
+            current_status = status_classifier.normalize(current_status)
         
-        if current_status and current_status != issue.status:
-            print(f"📊 Статус заявки {issue_id} изменился при добавлении комментария: {issue.status} -> {current_status}")
+        old_status = issue.status
+        if current_status and current_status != old_status:
+            logger.info("📊 Статус заявки %s изменился при добавлении комментария: %s -> %s", issue_id, old_status, current_status)
             
             # Обновляем статус в БД
             updated_issue = IssueService.update_issue_status(issue.id, current_status)
             if updated_issue:
-                print(f"✅ Статус заявки {issue_id} обновлен в БД через комментарий")
+                logger.info("✅ Статус заявки %s обновлен в БД через комментарий", issue_id)
                 
-                # Уведомляем пользователя о смене статуса
-                await notify_user_status_change(updated_issue, current_status, issue.status)
-                print(f"✅ Пользователь уведомлен об изменении статуса через комментарий")
+                # Уведомляем пользователя о смене статуса (после фиксации транзакции)
+                await after_commit(partial(notify_user_status_change, updated_issue, current_status, old_status))
             else:
-                print(f"❌ Не удалось обновить статус заявки {issue_id} в БД через комментарий")
+                logger.error("❌ Не удалось обновить статус заявки %s в БД через комментарий", issue_id)
         # Если да, то не отправляем уведомление (чтобы избежать спама собственными комментариями)
         author_contact_id = author_data.get("id")
         issue_creator = UserService.get_user_by_telegram_id(issue.telegram_user_id)
         
         if issue_creator and issue_creator.okdesk_contact_id and author_contact_id:
             if issue_creator.okdesk_contact_id == author_contact_id:
-                print(f"⚠️ Комментарий оставлен создателем заявки ({author_name}), уведомление не отправляется")
-                print(f"New comment from issue creator: {comment_id}")
+                logger.info("⚠️ Комментарий оставлен создателем заявки (%s), уведомление не отправляется", author_name)
+                logger.debug("New comment from issue creator: %s", comment_id)
                 return
         
         # Проверяем, нужно ли отправлять уведомление о комментарии
         should_notify_comment = True
         
         # Если статус изменился на завершающий и комментарий от исполнителя, не отправляем уведомление о комментарии
-        if current_status and current_status != issue.status:
-            new_status_is_completion = current_status.lower() in config.RATING_REQUEST_STATUSES or any(s in current_status.lower() for s in config.RATING_REQUEST_STATUSES)
-            if new_status_is_completion:
+        if current_status and current_status != old_status:
+            if status_classifier.is_completion(current_status):
                 # Проверяем, является ли автор комментария исполнителем заявки
                 assignee_data = issue_data.get("assignee", {})
                 assignee_employee = assignee_data.get("employee", {})
                 assignee_id = assignee_employee.get("id")
                 
                 if assignee_id and author_contact_id == assignee_id:
-                    print(f"⚠️ Комментарий при завершении от исполнителя ({author_name}), отдельное уведомление о комментарии не отправляется")
+                    logger.info("⚠️ Комментарий при завершении от исполнителя (%s), отдельное уведомление о комментарии не отправляется", author_name)
                     should_notify_comment = False
         
         if should_notify_comment:
-            # Уведомляем пользователя о новом комментарии
-            await notify_user_new_comment(issue, content, author_data, attachments)
-            print(f"✅ Пользователь уведомлен о новом комментарии")
+            # Уведомляем пользователя о новом комментарии (после фиксации транзакции)
+            await after_commit(partial(notify_user_new_comment, issue, content, author_data, attachments))
         else:
-            print(f"ℹ️ Уведомление о комментарии пропущено (завершение от исполнителя)")
+            logger.info("ℹ️ Уведомление о комментарии пропущено (завершение от исполнителя)")
         
-        print(f"New comment from Okdesk: {comment_id}")
+        logger.debug("New comment from Okdesk: %s", comment_id)
         
     except Exception as e:
-        print(f"❌ Ошибка при обработке комментария: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Ошибка при обработке комментария: %s", e)
 
+@metrics.HANDLER_SECONDS.timed("handle_status_changed")
+@tracing.traced()
 async def handle_status_changed(data: Dict[str, Any]):
     """Обработка смены статуса заявки"""
-    print(f"🔄 Обработка изменения статуса: {json.dumps(data, indent=2, ensure_ascii=False)}")
+    log_payload(payload_logger, "🔄 Обработка изменения статуса", data)
 
     # Пробуем разные форматы данных
     issue_id = (
@@ -379,82 +551,74 @@ async def handle_status_changed(data: Dict[str, Any]):
         data.get("previous_state")
     )
     
-    # Обрабатываем статусы (могут быть объектами с полем 'code' или 'name')
-    new_status = new_status_raw
-    if isinstance(new_status_raw, dict):
-        # Проверяем оба поля: code и name
-        new_status = (
-            new_status_raw.get("code") or
-            new_status_raw.get("name") or
-            str(new_status_raw)
-        )
-    
-    old_status = old_status_raw  
-    if isinstance(old_status_raw, dict):
-        old_status = (
-            old_status_raw.get("code") or
-            old_status_raw.get("name") or
-            str(old_status_raw)
-        )
-    
-    # Применяем маппинг статусов для нормализации
-    normalized_new_status = config.OKDESK_STATUS_MAPPING.get(new_status, new_status)
-    normalized_old_status = config.OKDESK_STATUS_MAPPING.get(old_status, old_status) if old_status else None
+    # Статусы могут быть объектами с полем 'code' или 'name'; приводим к каноническому виду
+    new_status_info = status_classifier.classify(new_status_raw) if new_status_raw else None
+    new_status = new_status_info.raw if new_status_info else None
+    normalized_new_status = new_status_info.canonical if new_status_info else None
+    normalized_old_status = status_classifier.normalize(old_status_raw) if old_status_raw else None
 
-    print(f"🔍 Извлечено: issue_id={issue_id}")
-    print(f"🔍 Исходный статус: {new_status_raw} -> нормализованный: {normalized_new_status}")
-    print(f"🔍 Предыдущий статус: {old_status_raw} -> нормализованный: {normalized_old_status}")
-    print(f"🔍 OKDESK_STATUS_MAPPING: {config.OKDESK_STATUS_MAPPING}")
-    print(f"🔍 RATING_REQUEST_STATUSES: {config.RATING_REQUEST_STATUSES}")
+    logger.debug("🔍 Заявка %s: статус %s -> %s, предыдущий %s -> %s",
+                 issue_id, new_status_raw, normalized_new_status, old_status_raw, normalized_old_status)
 
     if not issue_id or not new_status:
-        print(f"❌ Недостаточно данных для изменения статуса: issue_id={issue_id}, new_status={new_status}")
+        logger.error("❌ Недостаточно данных для изменения статуса: issue_id=%s, new_status=%s", issue_id, new_status)
         return
 
-    print(f"📊 Изменение статуса заявки {issue_id}: {normalized_old_status or 'неизвестен'} -> {normalized_new_status}")
+    logger.info("📊 Изменение статуса заявки %s: %s -> %s", issue_id, normalized_old_status or 'неизвестен', normalized_new_status)
 
     # Находим заявку в нашей БД
     issue = IssueService.get_issue_by_okdesk_id(issue_id)
     if not issue:
-        print(f"❌ Заявка {issue_id} не найдена в базе данных")
+        logger.error("❌ Заявка %s не найдена в базе данных", issue_id)
         return
 
     # Проверяем, действительно ли статус изменился
-    status_actually_changed = normalized_new_status != issue.status
-    new_status_is_completion = normalized_new_status.lower() in config.RATING_REQUEST_STATUSES or any(s in normalized_new_status.lower() for s in config.RATING_REQUEST_STATUSES)
+    # (в единице работы update_issue_status меняет этот же объект, поэтому сохраняем значения заранее)
+    stored_status = issue.status
+    rating_already_requested = issue.rating_requested
+    status_actually_changed = normalized_new_status != stored_status
+    new_status_is_completion = new_status_info.is_completion
 
-    print(f"🔍 status_actually_changed: {status_actually_changed}")
-    print(f"🔍 new_status_is_completion: {new_status_is_completion}")
-    print(f"🔍 normalized_new_status: '{normalized_new_status}'")
+    logger.debug("🔍 status_actually_changed=%s, new_status_is_completion=%s, normalized_new_status=%r",
+                 status_actually_changed, new_status_is_completion, normalized_new_status)
 
     # Всегда обновляем статус в БД, даже если он "не изменился"
     # (могут приходить повторные webhook или статусы в разном порядке)
     updated_issue = IssueService.update_issue_status(issue.id, normalized_new_status)
     if updated_issue:
-        print(f"✅ Статус заявки {issue_id} обновлен в БД: {issue.status} -> {normalized_new_status}")
+        logger.info("✅ Статус заявки %s обновлен в БД: %s -> %s", issue_id, stored_status, normalized_new_status)
 
         # Уведомляем пользователя ОБЯЗАТЕЛЬНО если:
         # 1. Статус действительно изменился, ИЛИ
         # 2. Новый статус является завершающим И оценка еще не запрашивалась
-        should_notify = status_actually_changed or (new_status_is_completion and not issue.rating_requested)
+        should_notify = status_actually_changed or (new_status_is_completion and not rating_already_requested)
         
         if should_notify:
-            await notify_user_status_change(updated_issue, normalized_new_status, normalized_old_status)
-            print(f"✅ Пользователь уведомлен об изменении статуса")
+            # Уведомление - после фиксации транзакции
+            await after_commit(partial(notify_user_status_change, updated_issue, normalized_new_status,
+                                       normalized_old_status))
         else:
-            print(f"ℹ️ Пропускаем уведомление: статус не изменился и оценка уже запрашивалась")
+            logger.info("ℹ️ Пропускаем уведомление: статус не изменился и оценка уже запрашивалась")
     else:
-        print(f"❌ Не удалось обновить статус заявки {issue_id} в БД")
+        logger.error("❌ Не удалось обновить статус заявки %s в БД", issue_id)
+
+    logger.debug("Status changed for issue %s: %s -> %s", issue_id, normalized_old_status or 'unknown', normalized_new_status)
 
-    print(f"Status changed for issue {issue_id}: {normalized_old_status or 'unknown'} -> {normalized_new_status}")
+@tracing.traced()
+async def issue_portal_url(issue) -> str:
+    """Ссылка на заявку в портале со входом владельца заявки"""
+    user = UserService.get_cached_user_by_telegram_id(issue.telegram_user_id)
+    return await portal_links.issue_url(user, issue.okdesk_issue_id)
 
+@tracing.traced()
 async def notify_user_status_change(issue, new_status: str, old_status: str = None):
     """Уведомление пользователя о смене статуса"""
     from bot import bot  # Импортируем бота
     from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
     from database.crud import IssueService
     
-    status_text = config.ISSUE_STATUS_MESSAGES.get(new_status, new_status)
+    new_status_info = status_classifier.classify(new_status)
+    status_text = new_status_info.text
     
     message = (
         f"📊 **Статус заявки обновлен**\n\n"
@@ -467,25 +631,22 @@ async def notify_user_status_change(issue, new_status: str, old_status: str = No
     keyboard_buttons = []
     
     # Проверяем, нужно ли запрашивать оценку
-    needs_rating = any(status in new_status.lower() for status in config.RATING_REQUEST_STATUSES) or new_status.lower() in config.RATING_REQUEST_STATUSES
+    needs_rating = new_status_info.needs_rating
     
     # НЕ отправляем запрос оценки, если заявка уже была оценена или запрос уже был отправлен
     if needs_rating and (issue.rating is not None or issue.rating_requested):
         if issue.rating is not None:
-            print(f"⭐ ОЦЕНКА ПРОПУЩЕНА: заявка уже была оценена ({issue.rating}/5)")
+            logger.info("⭐ ОЦЕНКА ПРОПУЩЕНА: заявка уже была оценена (%s/5)", issue.rating)
         else:
-            print(f"⭐ ОЦЕНКА ПРОПУЩЕНА: запрос оценки уже был отправлен")
+            logger.info("⭐ ОЦЕНКА ПРОПУЩЕНА: запрос оценки уже был отправлен")
         needs_rating = False
     
-    print(f"⭐ Проверка необходимости оценки для статуса '{new_status}':")
-    print(f"   📋 RATING_REQUEST_STATUSES: {config.RATING_REQUEST_STATUSES}")
-    print(f"   🔍 new_status.lower(): '{new_status.lower()}'")
-    print(f"   ⭐ issue.rating: {issue.rating}")
-    print(f"   ✅ needs_rating: {needs_rating}")
+    logger.debug("⭐ Проверка необходимости оценки для статуса %r: rating=%s, needs_rating=%s",
+                 new_status, issue.rating, needs_rating)
     
     # Если статус изменился на статус, требующий оценки, добавляем запрос оценки качества
     if needs_rating:
-        print(f"⭐ ДОБАВЛЯЕМ ЗАПРОС ОЦЕНКИ для статуса '{new_status}'")
+        logger.info("⭐ ДОБАВЛЯЕМ ЗАПРОС ОЦЕНКИ для статуса '%s'", new_status)
         message += config.RATING_REQUEST_TEXT
         keyboard_buttons.extend([
             [InlineKeyboardButton(text="⭐⭐⭐⭐⭐ Отлично (5)", callback_data=f"rate_5_{issue.id}")],
@@ -495,12 +656,13 @@ async def notify_user_status_change(issue, new_status: str, old_status: str = No
             [InlineKeyboardButton(text="⭐ Ужасно (1)", callback_data=f"rate_1_{issue.id}")]
         ])
     else:
-        print(f"⭐ ОЦЕНКА НЕ ТРЕБУЕТСЯ для статуса '{new_status}'")
+        logger.info("⭐ ОЦЕНКА НЕ ТРЕБУЕТСЯ для статуса '%s'", new_status)
     
-    # Добавляем стандартные кнопки
+    # Добавляем стандартные кнопки (ссылка со входом строится сейчас, а не хранится в заявке)
+    portal_url = await issue_portal_url(issue)
     keyboard_buttons.append([
-        InlineKeyboardButton(text="🔗 Открыть в портале", url=issue.okdesk_url),
-        InlineKeyboardButton(text="💬 Добавить комментарий в портале", url=issue.okdesk_url)
+        InlineKeyboardButton(text="🔗 Открыть в портале", url=portal_url),
+        InlineKeyboardButton(text="💬 Добавить комментарий в портале", url=portal_url)
     ])
     
     keyboard_buttons.append([
@@ -520,10 +682,10 @@ async def notify_user_status_change(issue, new_status: str, old_status: str = No
                 text=message,
                 reply_markup=keyboard
             )
-            print(f"✅ Обновлено существующее сообщение о заявке {issue.id} (message_id={issue.telegram_message_id})")
+            logger.info("✅ Обновлено существующее сообщение о заявке %s (message_id=%s)", issue.id, issue.telegram_message_id)
             message_updated = True
         except Exception as e:
-            print(f"⚠️ Не удалось обновить существующее сообщение: {e}")
+            logger.warning("⚠️ Не удалось обновить существующее сообщение: %s", e)
     
     # Если не удалось обновить существующее сообщение, отправляем новое уведомление
     sent_message = None
@@ -538,27 +700,21 @@ async def notify_user_status_change(issue, new_status: str, old_status: str = No
             # Сохраняем ID нового сообщения для будущих обновлений
             if sent_message and sent_message.message_id:
                 IssueService.update_issue_message_id(issue.id, sent_message.message_id)
-                print(f"✅ Отправлено новое уведомление и сохранен message_id={sent_message.message_id} для заявки {issue.id}")
+                logger.info("✅ Отправлено новое уведомление и сохранен message_id=%s для заявки %s", sent_message.message_id, issue.id)
             else:
-                print(f"✅ Отправлено новое уведомление о смене статуса для заявки {issue.id}")
+                logger.info("✅ Отправлено новое уведомление о смене статуса для заявки %s", issue.id)
         except Exception as e:
-            print(f"❌ Failed to send status notification: {e}")
+            logger.error("❌ Failed to send status notification: %s", e)
     
     # Если запрос оценки был добавлен и сообщение отправлено успешно, отмечаем что запрос был отправлен
     if needs_rating and (message_updated or sent_message):
         try:
-            from models.database import SessionLocal
-            db = SessionLocal()
-            db_issue = db.query(Issue).filter(Issue.id == issue.id).first()
-            if db_issue:
-                db_issue.rating_requested = True
-                db.commit()
-                print(f"✅ Отмечено, что запрос оценки был отправлен для заявки {issue.id}")
+            if IssueService.mark_rating_requested(issue.id):
+                logger.info("✅ Отмечено, что запрос оценки был отправлен для заявки %s", issue.id)
         except Exception as e:
-            print(f"⚠️ Не удалось обновить флаг rating_requested: {e}")
-        finally:
-            db.close()
+            logger.warning("⚠️ Не удалось обновить флаг rating_requested: %s", e)
 
+@tracing.traced()
 async def notify_user_new_comment(issue, content: str, author: Dict, attachments: List[Dict] = None):
     """Уведомление пользователя о новом комментарии"""
     from bot import bot  # Импортируем бота
@@ -578,14 +734,9 @@ async def notify_user_new_comment(issue, content: str, author: Dict, attachments
             # Если нет first_name/last_name, пробуем поле name
             author_name = author.get("name", "Сотрудник")
     
-    # Очищаем HTML-теги из контента
-    clean_content = clean_html_content(content)
-    
-    # Ограничиваем длину комментария для Telegram
+    # HTML комментария -> HTML для Telegram, обрезанный до 150 видимых символов
     max_comment_length = 150
-    truncated_content = clean_content[:max_comment_length]
-    if len(clean_content) > max_comment_length:
-        truncated_content += "..."
+    truncated_content = html_to_telegram(content, max_comment_length)
     
     message = (
         f"💬 Новый комментарий к заявке #{issue.issue_number}\n\n"
@@ -598,17 +749,17 @@ async def notify_user_new_comment(issue, content: str, author: Dict, attachments
     )
     
     # Создаем клавиатуру с кнопками быстрого доступа
+    portal_url = await issue_portal_url(issue)
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🔗 Открыть в портале", url=issue.okdesk_url)],
+        [InlineKeyboardButton(text="🔗 Открыть в портале", url=portal_url)],
         [InlineKeyboardButton(text="📝 Ответить", callback_data=f"add_comment_{issue.issue_number}")],
         [InlineKeyboardButton(text="📋 Мои заявки", callback_data="my_issues"),
          InlineKeyboardButton(text="📝 Создать заявку", callback_data="create_issue")],
         [InlineKeyboardButton(text="🏠 Главное меню", callback_data="main_menu")]
     ])
     
-    print(f"📤 Отправка уведомления пользователю {issue.telegram_user_id} о комментарии к заявке #{issue.issue_number}")
-    print(f"📝 Очищенный комментарий: {truncated_content[:50]}...")
-    print(f"🔘 Кнопки: {[btn.text for row in keyboard.inline_keyboard for btn in row]}")
+    logger.info("📤 Отправка уведомления пользователю %s о комментарии к заявке #%s",
+                issue.telegram_user_id, issue.issue_number)
     
     try:
         # Сначала отправляем текстовое сообщение
@@ -619,13 +770,10 @@ async def notify_user_new_comment(issue, content: str, author: Dict, attachments
             reply_markup=keyboard
         )
         if sent_message:
-            print(f"✅ Уведомление о комментарии отправлено пользователю {issue.telegram_user_id}")
-            print(f"📨 ID отправленного сообщения: {sent_message.message_id}")
-            print(f"🔘 Клавиатура отправлена: {sent_message.reply_markup is not None}")
-            if sent_message.reply_markup:
-                print(f"🔘 Количество кнопок в клавиатуре: {len(sent_message.reply_markup.inline_keyboard)}")
+            logger.info("✅ Уведомление о комментарии отправлено пользователю %s (message_id=%s)",
+                        issue.telegram_user_id, sent_message.message_id)
         else:
-            print(f"❌ Не удалось отправить уведомление о комментарии пользователю {issue.telegram_user_id}")
+            logger.error("❌ Не удалось отправить уведомление о комментарии пользователю %s", issue.telegram_user_id)
             return
             
         # Если есть вложения, скачиваем и отправляем их
@@ -633,15 +781,15 @@ async def notify_user_new_comment(issue, content: str, author: Dict, attachments
             try:
                 await send_attachments_to_user(issue.telegram_user_id, attachments, issue.issue_number, issue.okdesk_issue_id)
             except Exception as e:
-                print(f"❌ Ошибка при отправке вложений: {e}")
+                logger.error("❌ Ошибка при отправке вложений: %s", e)
                 # Не позволяем ошибке вложений влиять на основное уведомление
             
     except Exception as e:
-        print(f"❌ Failed to send comment notification: {e}")
+        logger.error("❌ Failed to send comment notification: %s", e)
         
         # Специальная обработка для Telegram flood control
         if "TelegramRetryAfter" in str(type(e)) or "retry after" in str(e).lower():
-            print(f"⏳ Telegram flood control, ждем перед повторной попыткой...")
+            logger.warning("⏳ Telegram flood control, ждем перед повторной попыткой...")
             import asyncio
             await asyncio.sleep(10)  # Ждем 10 секунд
             
@@ -654,12 +802,12 @@ async def notify_user_new_comment(issue, content: str, author: Dict, attachments
                     reply_markup=keyboard
                 )
                 if sent_message:
-                    print(f"✅ Уведомление о комментарии отправлено после ожидания")
+                    logger.info("✅ Уведомление о комментарии отправлено после ожидания")
                     return  # Успешно отправили, выходим
                 else:
-                    print(f"❌ Повторная отправка не удалась")
+                    logger.error("❌ Повторная отправка не удалась")
             except Exception as e_retry:
-                print(f"❌ Повторная отправка тоже не удалась: {e_retry}")
+                logger.error("❌ Повторная отправка тоже не удалась: %s", e_retry)
         
         # Если это не flood control или повторная попытка не удалась,
         # пробуем отправить упрощенное сообщение без клавиатуры
@@ -669,7 +817,7 @@ async def notify_user_new_comment(issue, content: str, author: Dict, attachments
                 f"📝 {issue.title}\n"
                 f"👤 От: {author_name}\n"
                 f"💭 Комментарий: {truncated_content}\n\n"
-                f"🔗 {issue.okdesk_url}"
+                f"🔗 {portal_url}"
             )
             
             result = await send_telegram_message_safe(
@@ -678,13 +826,11 @@ async def notify_user_new_comment(issue, content: str, author: Dict, attachments
                 text=simple_message
             )
             if result:
-                print(f"✅ Упрощенное уведомление о комментарии отправлено пользователю {issue.telegram_user_id}")
+                logger.info("✅ Упрощенное уведомление о комментарии отправлено пользователю %s", issue.telegram_user_id)
             else:
-                print(f"❌ Не удалось отправить упрощенное уведомление")
+                logger.error("❌ Не удалось отправить упрощенное уведомление")
         except Exception as e2:
-            print(f"❌ Даже упрощенное уведомление не удалось отправить: {e2}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("❌ Даже упрощенное уведомление не удалось отправить: %s", e2)
 
 def verify_webhook_signature(payload: bytes, signature: str) -> bool:
     """Проверка подписи вебхука"""
@@ -699,26 +845,7 @@ def verify_webhook_signature(payload: bytes, signature: str) -> bool:
     
     return hmac.compare_digest(signature, expected_signature)
 
-def clean_html_content(content: str) -> str:
-    """Очистка HTML-тегов из контента для отправки в Telegram"""
-    if not content:
-        return ""
-    
-    # Заменяем блочные теги на пробелы, чтобы избежать склеивания слов
-    content = re.sub(r'</(p|div|br|h[1-6]|li|ul|ol|blockquote)[^>]*>', ' ', content, flags=re.IGNORECASE)
-    
-    # Удаляем все остальные HTML-теги
-    clean_text = re.sub(r'<[^>]+>', '', content)
-    
-    # Удаляем лишние пробелы и переносы строк
-    clean_text = re.sub(r'\n\s*\n', '\n', clean_text)
-    clean_text = re.sub(r'\s+', ' ', clean_text)
-    
-    # Удаляем специальные символы, которые могут вызвать проблемы
-    clean_text = clean_text.replace('\r', '').replace('\t', ' ')
-    
-    return clean_text.strip()
-
+@tracing.traced()
 async def send_telegram_message_safe(bot, chat_id: int, **kwargs):
     """
     Безопасная отправка сообщения в Telegram с обработкой flood control
@@ -750,19 +877,20 @@ async def send_telegram_message_safe(bot, chat_id: int, **kwargs):
         
     except Exception as e:
         if "TelegramRetryAfter" in str(type(e)) or "retry after" in str(e).lower():
-            print(f"⏳ Telegram flood control при отправке, ждем...")
+            logger.warning("⏳ Telegram flood control при отправке, ждем...")
             import asyncio
             await asyncio.sleep(10)  # Ждем 10 секунд
             
             try:
                 return await method(chat_id=chat_id, **kwargs)
             except Exception as e_retry:
-                print(f"❌ Повторная отправка не удалась: {e_retry}")
+                logger.error("❌ Повторная отправка не удалась: %s", e_retry)
                 return None
         else:
             # Другая ошибка, не flood control
             raise e
 
+@tracing.traced()
 async def send_attachments_to_user(telegram_user_id: int, attachments: List[Dict], issue_number: str, issue_id: int = None):
     """
     Отправляет вложения из комментария пользователю в Telegram
@@ -774,7 +902,7 @@ async def send_attachments_to_user(telegram_user_id: int, attachments: List[Dict
         issue_id: ID заявки в Okdesk для скачивания вложений
     """
     if not BOT_AVAILABLE or not bot:
-        print("❌ Bot не доступен для отправки вложений")
+        logger.error("❌ Bot не доступен для отправки вложений")
         return
 
     try:
@@ -784,7 +912,7 @@ async def send_attachments_to_user(telegram_user_id: int, attachments: List[Dict
         if not attachments:
             return
 
-        print(f"📎 Отправка {len(attachments)} вложений пользователю {telegram_user_id}")
+        logger.info("📎 Отправка %s вложений пользователю %s", len(attachments), telegram_user_id)
 
         okdesk_api = OkdeskAPI()
         try:
@@ -798,20 +926,20 @@ async def send_attachments_to_user(telegram_user_id: int, attachments: List[Dict
                     filename = attachment.get('filename', attachment.get('name', attachment.get('attachment_file_name', f'file_{i+1}')))
                     file_size = attachment.get('size', attachment.get('attachment_file_size', 0))
 
-                    print(f"📎 Обработка вложения {i+1}: ID={file_id}, filename={filename}, size={file_size}")
+                    logger.info("📎 Обработка вложения %s: ID=%s, filename=%s, size=%s", i + 1, file_id, filename, file_size)
 
                     if not file_id:
-                        print(f"⚠️ Пропускаем вложение без ID: {attachment}")
+                        logger.warning("⚠️ Пропускаем вложение без ID: %s", LazyPayload(attachment))
                         continue
 
                     # Скачиваем файл из Okdesk
                     file_data = await okdesk_api.download_attachment(file_id, issue_id)
 
                     if not file_data:
-                        print(f"❌ Не удалось скачать файл {filename} (ID: {file_id})")
+                        logger.error("❌ Не удалось скачать файл %s (ID: %s)", filename, file_id)
                         continue
 
-                    print(f"✅ Файл {filename} скачан: {len(file_data)} байт")
+                    logger.info("✅ Файл %s скачан: %s байт", filename, len(file_data))
 
                     # Определяем тип файла
                     mime_type, _ = mimetypes.guess_type(filename)
@@ -835,7 +963,7 @@ async def send_attachments_to_user(telegram_user_id: int, attachments: List[Dict
                         individual_files.append((input_file, filename, 'document'))
 
                 except Exception as e:
-                    print(f"❌ Ошибка обработки вложения {i+1}: {e}")
+                    logger.error("❌ Ошибка обработки вложения %s: %s", i + 1, e)
                     continue
 
             # Отправляем медиа-группу (если есть изображения)
@@ -858,11 +986,11 @@ async def send_attachments_to_user(telegram_user_id: int, attachments: List[Dict
                             media=media_group
                         )
                     if result:
-                        print(f"✅ Отправлено {len(media_group)} изображений")
+                        logger.info("✅ Отправлено %s изображений", len(media_group))
                     else:
-                        print(f"❌ Не удалось отправить изображения")
+                        logger.error("❌ Не удалось отправить изображения")
                 except Exception as e:
-                    print(f"❌ Ошибка отправки медиа-группы: {e}")
+                    logger.error("❌ Ошибка отправки медиа-группы: %s", e)
 
             # Отправляем видео и документы отдельно
             for input_file, filename, file_type in individual_files:
@@ -876,9 +1004,9 @@ async def send_attachments_to_user(telegram_user_id: int, attachments: List[Dict
                             caption=f"🎥 Видео к заявке #{issue_number}: {filename}"
                         )
                         if result:
-                            print(f"✅ Отправлено видео: {filename}")
+                            logger.info("✅ Отправлено видео: %s", filename)
                         else:
-                            print(f"❌ Не удалось отправить видео: {filename}")
+                            logger.error("❌ Не удалось отправить видео: %s", filename)
                     else:
                         # Обычный документ
                         result = await send_telegram_message_safe(
@@ -888,21 +1016,19 @@ async def send_attachments_to_user(telegram_user_id: int, attachments: List[Dict
                             caption=f"📎 Документ к заявке #{issue_number}: {filename}"
                         )
                         if result:
-                            print(f"✅ Отправлен документ: {filename}")
+                            logger.info("✅ Отправлен документ: %s", filename)
                         else:
-                            print(f"❌ Не удалось отправить документ: {filename}")
+                            logger.error("❌ Не удалось отправить документ: %s", filename)
                 except Exception as e:
-                    print(f"❌ Ошибка отправки файла {filename}: {e}")
+                    logger.error("❌ Ошибка отправки файла %s: %s", filename, e)
 
             if media_group or individual_files:
-                print(f"✅ Все вложения обработаны для заявки #{issue_number}")
+                logger.info("✅ Все вложения обработаны для заявки #%s", issue_number)
             else:
-                print(f"⚠️ Не удалось обработать ни одного вложения для заявки #{issue_number}")
+                logger.warning("⚠️ Не удалось обработать ни одного вложения для заявки #%s", issue_number)
 
         except Exception as e:
-            print(f"❌ Общая ошибка при отправке вложений: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("❌ Общая ошибка при отправке вложений: %s", e)
         finally:
             try:
                 await okdesk_api.close()
@@ -910,26 +1036,65 @@ async def send_attachments_to_user(telegram_user_id: int, attachments: List[Dict
                 pass
                 
     except Exception as e:
-        print(f"❌ Критическая ошибка в send_attachments_to_user: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Критическая ошибка в send_attachments_to_user: %s", e)
 
 @app.get("/health")
 async def health_check():
     """Проверка здоровья сервиса"""
-    return {"status": "healthy"}
+    return {"status": "healthy", "db_pool": get_pool_metrics()}
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Метрики в формате Prometheus"""
+    if not config.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not found")
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/traces")
+async def traces_endpoint(correlation_id: Optional[str] = None, limit: int = 50):
+    """Последние трассы событий с разбивкой времени по этапам"""
+    if not tracing.is_enabled():
+        raise HTTPException(status_code=404, detail="Tracing is disabled")
+    return {"traces": tracing.recent_traces(correlation_id, limit)}
+
+@app.post("/admin/profile")
+async def profile_endpoint(request: Request, seconds: float = config.PROFILE_DEFAULT_SECONDS,
+                           all_threads: bool = False, wait: bool = False):
+    """
+    Семплирующее профилирование процесса на seconds секунд (заголовок X-Admin-Token).
+
+    По умолчанию возвращает путь к будущему файлу; с wait=true дожидается
+    окончания и отдает профиль (folded stacks для flamegraph.pl / speedscope).
+    """
+    token = request.headers.get("X-Admin-Token", "")
+    if not config.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not hmac.compare_digest(token, config.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    try:
+        path = profiler.start(seconds, all_threads=all_threads)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not wait:
+        return {"status": "started", "seconds": min(seconds, config.PROFILE_MAX_SECONDS), "file": path}
+    await profiler.wait()
+    # Профиль может быть большим: читаем вне event loop
+    content = await asyncio.to_thread(Path(path).read_bytes)
+    return Response(content=content, media_type="text/plain; charset=utf-8",
+                    headers={"Content-Disposition": f'attachment; filename="{path.rsplit("/", 1)[-1]}"'})
 
 if __name__ == "__main__":
     import uvicorn
     
     # Отладочная информация о конфигурации
-    print(f"🔍 WEBHOOK STARTUP: Используется база данных: {config.DATABASE_URL}")
+    logger.info("🔍 WEBHOOK STARTUP: Используется база данных: %s", config.DATABASE_URL.split("@")[-1])
     
     # Информация о безопасности webhook
     if config.WEBHOOK_SECRET and config.WEBHOOK_SECRET.strip():
-        print("🔐 Webhook защищен секретным ключом")
+        logger.info("🔐 Webhook защищен секретным ключом")
     else:
-        print("⚠️  Webhook работает БЕЗ проверки подписи (не рекомендуется для продакшена)")
+        logger.warning("⚠️  Webhook работает БЕЗ проверки подписи (не рекомендуется для продакшена)")
     
-    print(f"🚀 Запуск webhook сервера на {config.HOST}:{config.PORT}")
-    uvicorn.run(app, host=config.HOST, port=config.PORT)
+    logger.info("🚀 Запуск webhook сервера на %s:%s", config.HOST, config.PORT)
+    # log_config=None: логи uvicorn идут через общую очередь логирования
+    uvicorn.run(app, host=config.HOST, port=config.PORT, log_config=None)